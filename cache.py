@@ -0,0 +1,247 @@
+# cache.py - bounded in-memory LRU/TTL cache with coalesced loads and NDJSON persistence
+import json, os, threading, time, atexit
+from collections import OrderedDict
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:     # Windows: no listener workers there, so one process per file
+    fcntl = None
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU map with per-entry expiry.
+
+    - `maxsize` bounds memory; the least recently used entry is evicted first.
+    - `ttl` is the default lifetime in seconds (wall clock, so it survives restarts).
+    - `get_or_load()` coalesces concurrent misses: one caller runs the loader,
+      everyone else asking for the same key waits for its result.
+    - With `path` set, the cache is loaded once at startup and changed entries are
+      appended to the file as JSON lines by a background thread every
+      `persist_interval` seconds. The file is compacted when it grows to several
+      times the live entry count.
+    - Several processes may share one file (main.py --workers): appends and
+      compactions hold an flock on `path`.lock, and a compaction keeps what
+      the others appended.
+    """
+
+    def __init__(self, maxsize=10000, ttl=86400, path=None, persist_interval=5.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.persist_interval = persist_interval
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._inflight = {}          # key -> threading.Event
+        self._dirty = {}             # key -> (expires_at, value) awaiting append
+        self._lines_on_disk = 0
+        self._io_lock = threading.Lock()
+        self._flusher = None
+        self.stats = {"hits": 0, "misses": 0, "loads": 0, "coalesced": 0, "evictions": 0, "expired": 0}
+        if path:
+            self._load()
+
+    # ---------------- mapping API ----------------
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.stats["misses"] += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def put(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+            if self.path:
+                self._dirty[key] = (expires_at, value)
+        if self.path:
+            self._ensure_flusher()
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+    def hit_rate(self):
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    # ---------------- coalesced loads ----------------
+    def get_or_load(self, key, loader, ttl_for=None, wait_timeout=10.0):
+        """Return the cached value for key, or run loader(key) exactly once for
+        all concurrent callers. ttl_for(value) may pick a per-value lifetime,
+        e.g. a short one for negative results."""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            event.wait(wait_timeout)
+            value = self.get(key, _MISSING)
+            return value if value is not _MISSING else loader(key)
+        try:
+            self.stats["loads"] += 1
+            value = loader(key)
+            self.put(key, value, ttl_for(value) if ttl_for else None)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    # ---------------- persistence ----------------
+    def _read(self):
+        """({key: (expires_at, value)}, line count) of the file; the last line for a key wins."""
+        entries = {}
+        lines = 0
+        if not os.path.exists(self.path):
+            return entries, lines
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                lines += 1
+                try:
+                    rec = json.loads(line)
+                    entries[rec["k"]] = (rec["exp"], rec["v"])
+                except (ValueError, KeyError, TypeError):
+                    continue  # torn tail from a crash
+        return entries, lines
+
+    def _live(self, entries):
+        """Unexpired (expires_at, key, value), the maxsize longest-lived."""
+        now = time.time()
+        live = sorted(((exp, k, v) for k, (exp, v) in entries.items() if exp > now), key=lambda e: e[0])
+        return live[-self.maxsize:]
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load(self):
+        entries, lines = self._read()
+        with self._lock:
+            for exp, k, v in self._live(entries):
+                self._data[k] = (exp, v)
+        self._lines_on_disk = lines
+
+    def import_json(self, legacy_path, ttl=None):
+        """One-off import of a legacy `{key: value}` JSON file."""
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        for k, v in legacy.items():
+            if k not in self:
+                self.put(k, v, ttl)
+        return len(legacy)
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._io_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="hp-cache-flush", daemon=True)
+                self._flusher.start()
+                atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.persist_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"[!] Cache persist failed for {self.path}: {e}")
+
+    def flush(self):
+        """Append changed entries to disk (compacting the file if it has grown)."""
+        if not self.path:
+            return
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            live = len(self._data)
+        if not dirty:
+            return
+        with self._io_lock, self._file_lock():
+            if self._lines_on_disk + len(dirty) > 4 * live + 1000:
+                self._compact()
+                return
+            with open(self.path, "a", encoding="utf-8") as f:
+                for k, (exp, v) in dirty.items():
+                    f.write(json.dumps({"k": k, "exp": round(exp, 1), "v": v}, ensure_ascii=False) + "\n")
+            self._lines_on_disk += len(dirty)
+
+    def _compact(self):
+        """Rewrite the file as one line per live entry: ours, plus those other
+        processes appended (the newer expiry wins). Holds the file lock."""
+        entries, _ = self._read()
+        with self._lock:
+            snapshot = list(self._data.items())
+        for k, (exp, v) in snapshot:
+            if k not in entries or exp >= entries[k][0]:
+                entries[k] = (exp, v)
+        live = self._live(entries)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for exp, k, v in live:
+                f.write(json.dumps({"k": k, "exp": round(exp, 1), "v": v}, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+        self._lines_on_disk = len(live)
+
+
+# ---------------- shared stores ----------------
+_stores = {}
+_stores_lock = threading.Lock()
+
+def open_store(path, legacy_json=None, **kwargs):
+    """Return the process-wide TTLCache persisted at path, so every module that
+    opens the same file shares one in-memory copy. legacy_json, if given and the
+    store file does not exist yet, is imported once."""
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            fresh = not os.path.exists(path)
+            store = _stores[key] = TTLCache(path=path, **kwargs)
+            if fresh and legacy_json and os.path.exists(legacy_json):
+                store.import_json(legacy_json)
+        return store
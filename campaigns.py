@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+campaigns.py
+
+Groups sessions that run the same bot playbook into campaigns, without
+comparing every pair of sessions.
+
+When a session has ended, its commands are normalized (IPs, URLs, numbers,
+hex/base64 blobs and random-looking names become placeholders, so a bot's
+per-run file names and C2 addresses do not matter), split into tokens and
+shingled into overlapping SHINGLE_SIZE-token windows. The shingle set is
+reduced to a MinHash signature of NUM_PERM values; two signatures agree in
+a position with probability equal to the Jaccard similarity of the sets.
+
+The signature is cut into BANDS bands of ROWS values, and each band is
+hashed into campaign_bands, an LSH index kept in SQLite. A new session is
+looked up by its BANDS band hashes (primary-key lookups, so the cost does
+not grow with the number of sessions or campaigns); campaigns sharing a
+band are candidates, and the session joins the most similar one whose
+estimated similarity is at least SIMILARITY. Otherwise it founds a new
+campaign, whose signature represents it from then on.
+
+sessions.campaign holds the result: a campaign id, 0 for sessions without
+commands, NULL while not yet clustered. main.py runs cluster() every
+CLUSTER_INTERVAL seconds on a thread of its own connection; the dashboard
+shows and filters by the id.
+
+Usage:
+    python campaigns.py                 # cluster every ended session not yet assigned
+    python campaigns.py --reset         # forget all campaigns and cluster again
+    python campaigns.py --list          # largest campaigns
+    python campaigns.py --show 42       # sessions of campaign 42
+"""
+import sqlite3, re, time, struct, random, threading, argparse
+from array import array
+from hashlib import blake2b
+import payloads
+
+NUM_PERM = 64                  # MinHash signature length ...
+BANDS, ROWS = 16, 4            # ... cut into 16 bands of 4: pairs above ~50% similarity collide
+SHINGLE_SIZE = 3               # tokens per shingle
+SIMILARITY = 0.5               # estimated Jaccard needed to join a campaign
+MAX_COMMANDS = 200             # commands per session that are fingerprinted
+MAX_CANDIDATES = 32            # campaigns compared per session at most
+CLUSTER_BATCH = 500            # sessions per transaction
+CLUSTER_INTERVAL = 10.0        # seconds between passes in main.py
+NO_CAMPAIGN = 0                # sessions.campaign for sessions without commands
+SEED = 20240501                # fixed, so signatures stay comparable across runs
+
+_PRIME = (1 << 61) - 1
+_rnd = random.Random(SEED)
+_PERMS = [(_rnd.randrange(1, _PRIME), _rnd.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_TOKEN = re.compile(r"[^\s;|&<>()'\"`]+|[;|&<>]+")
+_URL = re.compile(r"^[a-z][a-z0-9+.-]*://")
+_IP = re.compile(r"^\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?$")
+_HEX = re.compile(r"^(?:0x)?[0-9a-f]{8,}$")
+_B64 = re.compile(r"^(?=.*\d)[a-z0-9+/]{24,}={0,2}$")
+_DIGIT_RUN = re.compile(r"\d+")
+
+
+def ensure_schema(conn):
+    existing = {r[1] for r in conn.execute("PRAGMA table_info(sessions)")}
+    if existing and "campaign" not in existing:
+        conn.execute("ALTER TABLE sessions ADD COLUMN campaign INTEGER")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS campaigns (
+            id INTEGER PRIMARY KEY,
+            signature BLOB NOT NULL,
+            sessions INTEGER NOT NULL,
+            first_epoch INTEGER,
+            last_epoch INTEGER,
+            sample TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS campaign_bands (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            campaign INTEGER NOT NULL,
+            PRIMARY KEY (band, bucket, campaign)
+        ) WITHOUT ROWID
+    """)
+    if existing:
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_campaign ON sessions(campaign)")
+        # what cluster() scans for: ended sessions still waiting for a campaign
+        conn.execute("""CREATE INDEX IF NOT EXISTS idx_sessions_unclustered ON sessions(end_epoch)
+                        WHERE campaign IS NULL AND end_epoch IS NOT NULL""")
+
+# ---------------- fingerprints ----------------
+def _mask(part):
+    if _IP.match(part):
+        return "<ip>"
+    if _HEX.match(part) or _B64.match(part):
+        return "<blob>"
+    if len(part) >= 6 and len(_DIGIT_RUN.findall(part)) >= 2 and not part.isdigit():
+        return "<rand>"        # x9f3a2b1c, but not base64 or sha256sum
+    return _DIGIT_RUN.sub("<n>", part)
+
+def normalize(command):
+    """Tokens of one command with the per-victim/per-run details masked."""
+    tokens = []
+    for token in _TOKEN.findall(command.lower()):
+        if _URL.match(token):
+            tokens.append("<url>")
+        elif "/" in token and not _B64.match(token):
+            tokens.append("/".join(_mask(part) for part in token.split("/")))
+        else:
+            tokens.append(_mask(token))
+    return tokens
+
+def shingles(commands, k=SHINGLE_SIZE):
+    tokens = []
+    for command in commands[:MAX_COMMANDS]:
+        tokens.extend(normalize(command))
+        tokens.append("\n")
+    if len(tokens) <= k:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)}
+
+def signature(shingle_set):
+    """MinHash of a shingle set: NUM_PERM values, one per (a*x + b) mod p."""
+    hashes = [int.from_bytes(blake2b(s.encode("utf-8", "replace"), digest_size=8).digest(), "big")
+              for s in shingle_set]
+    return array("Q", [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS])
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of the two shingle sets."""
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / NUM_PERM
+
+def band_keys(sig):
+    """(band, bucket) pairs for the LSH index; bucket is a signed 64-bit hash."""
+    for band in range(BANDS):
+        chunk = struct.pack(f">{ROWS}Q", *sig[band * ROWS:(band + 1) * ROWS])
+        yield band, int.from_bytes(blake2b(chunk, digest_size=8).digest(), "big", signed=True)
+
+# ---------------- index ----------------
+class CampaignIndex:
+    """Matches signatures against the campaigns in one database connection;
+    representative signatures are cached, they never change."""
+
+    def __init__(self, conn, threshold=SIMILARITY):
+        self.conn = conn
+        self.threshold = threshold
+        self._signatures = {}
+
+    def _signature(self, campaign):
+        sig = self._signatures.get(campaign)
+        if sig is None:
+            row = self.conn.execute("SELECT signature FROM campaigns WHERE id = ?", (campaign,)).fetchone()
+            sig = self._signatures[campaign] = array("Q", row[0]) if row else None
+        return sig
+
+    def match(self, sig, keys):
+        """(campaign, similarity) of the best candidate above the threshold, or (None, 0)."""
+        candidates = []
+        for band, bucket in keys:
+            for (campaign,) in self.conn.execute(
+                    "SELECT campaign FROM campaign_bands WHERE band = ? AND bucket = ? LIMIT ?",
+                    (band, bucket, MAX_CANDIDATES)):
+                if campaign not in candidates:
+                    candidates.append(campaign)
+            if len(candidates) >= MAX_CANDIDATES:
+                break
+        best, best_sim = None, 0.0
+        for campaign in candidates:
+            rep = self._signature(campaign)
+            sim = similarity(sig, rep) if rep is not None else 0.0
+            if sim >= self.threshold and sim > best_sim:
+                best, best_sim = campaign, sim
+        return best, best_sim
+
+    def assign(self, sig, epoch, sample):
+        """Campaign id for a session's signature, creating a campaign if no
+        existing one is similar enough. Runs in the caller's transaction."""
+        keys = list(band_keys(sig))
+        campaign, _ = self.match(sig, keys)
+        if campaign is not None:
+            self.conn.execute("""UPDATE campaigns SET sessions = sessions + 1,
+                                     first_epoch = MIN(COALESCE(first_epoch, ?), ?),
+                                     last_epoch = MAX(COALESCE(last_epoch, ?), ?)
+                                 WHERE id = ?""", (epoch, epoch, epoch, epoch, campaign))
+            return campaign
+        cur = self.conn.execute("""INSERT INTO campaigns (signature, sessions, first_epoch, last_epoch, sample)
+                                   VALUES (?, 1, ?, ?, ?)""", (sig.tobytes(), epoch, epoch, sample))
+        campaign = cur.lastrowid
+        self.conn.executemany("INSERT OR IGNORE INTO campaign_bands (band, bucket, campaign) VALUES (?, ?, ?)",
+                              [(band, bucket, campaign) for band, bucket in keys])
+        self._signatures[campaign] = sig
+        return campaign
+
+def cluster_batch(conn, index, batch=CLUSTER_BATCH):
+    """Assign the next `batch` ended, unclustered sessions. Returns how many."""
+    with conn:
+        pending = conn.execute("""SELECT id, start_epoch FROM sessions
+                                  WHERE campaign IS NULL AND end_epoch IS NOT NULL
+                                  ORDER BY end_epoch LIMIT ?""", (batch,)).fetchall()
+        if not pending:
+            return 0
+        commands = {sid: [] for sid, _ in pending}
+        marks = ",".join("?" * len(pending))
+        for sid, payload in conn.execute(f"""SELECT e.session_id, COALESCE(p.text, e.payload)
+                                             FROM events e LEFT JOIN payloads p ON p.id = e.payload_id
+                                             WHERE e.session_id IN ({marks}) AND e.kind = 'recv' ORDER BY e.id""",
+                                         list(commands)):
+            if payload and len(commands[sid]) < MAX_COMMANDS:
+                commands[sid].append(payload)
+        updates = []
+        for sid, epoch in pending:
+            shingle_set = shingles(commands[sid])
+            if not shingle_set:
+                updates.append((NO_CAMPAIGN, sid))
+                continue
+            sample = "; ".join(commands[sid][:5])[:200]
+            updates.append((index.assign(signature(shingle_set), epoch, sample), sid))
+        conn.executemany("UPDATE sessions SET campaign = ? WHERE id = ?", updates)
+    return len(pending)
+
+def connect(db_file):
+    # IMMEDIATE: take the write lock up front rather than fail on upgrade
+    # when the honeypot's writer commits in between (see partitions.archive)
+    conn = sqlite3.connect(db_file, timeout=30, isolation_level="IMMEDIATE")
+    conn.execute("PRAGMA busy_timeout=30000")
+    ensure_schema(conn)
+    payloads.ensure_schema(conn)
+    conn.commit()
+    return conn
+
+def cluster(db_file, batch=CLUSTER_BATCH, quiet=False):
+    """Cluster every ended session that has no campaign yet."""
+    conn = connect(db_file)
+    index = CampaignIndex(conn)
+    done, t0 = 0, time.time()
+    try:
+        while True:
+            n = cluster_batch(conn, index, batch)
+            if not n:
+                break
+            done += n
+            if not quiet:
+                print(f"  clustered {done} sessions", end="\r")
+    finally:
+        conn.close()
+    if done and not quiet:
+        print(f"[+] Clustered {done} sessions in {time.time() - t0:.1f}s" + " " * 20)
+    return done
+
+def reset(db_file):
+    conn = connect(db_file)
+    try:
+        with conn:
+            conn.execute("DELETE FROM campaign_bands")
+            conn.execute("DELETE FROM campaigns")
+            conn.execute("UPDATE sessions SET campaign = NULL WHERE campaign IS NOT NULL")
+    finally:
+        conn.close()
+
+def start_clusterer(db_file, interval=CLUSTER_INTERVAL):
+    """Run cluster() every `interval` seconds on a daemon thread. One
+    process only (the one owning the writer), so campaign ids stay unique."""
+    def run():
+        while True:
+            try:
+                cluster(db_file, quiet=True)
+            except Exception as e:
+                print(f"[!] Campaign clustering failed: {e}")
+            time.sleep(interval)
+    t = threading.Thread(target=run, name="hp-campaigns", daemon=True)
+    t.start()
+    return t
+
+# ---------------- queries (dashboard) ----------------
+def top(conn, since=None, limit=10, min_sessions=2):
+    """[(id, sessions, first_epoch, last_epoch, sample)], largest first;
+    with since, only campaigns active after it."""
+    return conn.execute("""SELECT id, sessions, first_epoch, last_epoch, sample FROM campaigns
+                           WHERE sessions >= ? AND last_epoch >= ?
+                           ORDER BY sessions DESC LIMIT ?""", (min_sessions, since or 0, limit)).fetchall()
+
+
+if __name__ == "__main__":
+    from db import DB_FILE
+    parser = argparse.ArgumentParser(description="Cluster attacker sessions into campaigns")
+    parser.add_argument("--db", default=DB_FILE, help="database file (default: %(default)s)")
+    parser.add_argument("--reset", action="store_true", help="drop all campaigns and cluster from scratch")
+    parser.add_argument("--list", action="store_true", help="print the largest campaigns")
+    parser.add_argument("--show", type=int, metavar="ID", help="print the sessions of one campaign")
+    parser.add_argument("--limit", type=int, default=20, help="rows to print (default: %(default)s)")
+    args = parser.parse_args()
+    if args.reset:
+        reset(args.db)
+    if not (args.list or args.show) or args.reset:
+        cluster(args.db)
+    conn = sqlite3.connect(args.db)
+    if args.list:
+        for cid, n, first, last, sample in top(conn, limit=args.limit, min_sessions=1):
+            print(f"{cid:>8}  {n:>7} sessions  {time.strftime('%Y-%m-%d', time.gmtime(first))}.."
+                  f"{time.strftime('%Y-%m-%d', time.gmtime(last))}  {sample}")
+    if args.show:
+        for sid, ip, country in conn.execute("""SELECT id, client_ip, country FROM sessions WHERE campaign = ?
+                                                ORDER BY start_epoch LIMIT ?""", (args.show, args.limit)):
+            print(f"{sid}  {ip}  {country}")
+    conn.close()
@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 # dashboard.py — AI SecurityOps Honeypot Dashboard (Unlimited Events + Scrollable Honeypot + IST)
 
-import os, sqlite3, json
-from flask import Flask, render_template_string, request, redirect, url_for, session
+import os, sqlite3, json, base64, threading, time, csv, io, zlib
+from collections import deque
+from flask import Flask, render_template_string, request, redirect, url_for, session, Response, stream_with_context
+from db import ensure_schema, severity_code, severity_name, fan_out, iter_merged
+import rollups, search, transcripts, campaigns, partitions
+from ring import RingSet
+from cache import TTLCache
+from markupsafe import Markup, escape
 from datetime import datetime
 import pytz
 
@@ -35,47 +41,342 @@ def get_severity_color(severity):
     return "white"
 
 def format_time(ts):
-    """Convert timestamp to IST format."""
+    """Convert timestamp (epoch seconds or datetime) to IST format."""
     try:
-        if isinstance(ts, str):
-            dt = datetime.fromisoformat(ts)
+        if isinstance(ts, datetime):
+            local_time = ts.astimezone(TIMEZONE)
         else:
-            dt = datetime.fromtimestamp(ts)
-        local_time = dt.astimezone(TIMEZONE)
+            local_time = datetime.fromtimestamp(ts, TIMEZONE)
         return local_time.strftime("%d-%b-%Y %H:%M:%S IST")
     except Exception:
         return str(ts)
 
-def get_events():
-    """Fetch all honeypot events (no limit)."""
+def parse_time(value):
+    """'YYYY-MM-DD[THH:MM[:SS]]' in dashboard time (IST) -> epoch seconds, or None."""
+    for fmt in ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return int(TIMEZONE.localize(datetime.strptime(value, fmt)).timestamp())
+        except ValueError:
+            continue
+    return None
+
+PAGE_SIZE = 100
+SEVERITY_FILTERS = ("low", "medium", "high", "critical")
+COUNTRY_LIST_TTL = 300.0     # seconds the country filter's choices are cached
+
+_countries = TTLCache(maxsize=1, ttl=COUNTRY_LIST_TTL)
+
+def known_countries():
+    """Distinct session countries, offered by the (exact-match) country filter."""
+    def load(_):
+        if not os.path.exists(DB_FILE):
+            return []
+        conn = sqlite3.connect(DB_FILE)
+        try:
+            return [r[0] for r in conn.execute(
+                "SELECT DISTINCT country FROM sessions WHERE country IS NOT NULL ORDER BY country")]
+        finally:
+            conn.close()
+    return _countries.get_or_load("countries", load)
+
+def encode_cursor(ts, event_id):
+    return base64.urlsafe_b64encode(f"{ts}|{event_id}".encode()).decode()
+
+def decode_cursor(cursor):
+    """'<epoch>|<id>' (base64) -> (epoch, id), or None if the cursor is malformed."""
+    try:
+        ts, event_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return int(ts), int(event_id)
+    except Exception:
+        return None
+
+def read_filters(args):
+    """Filter values from a request's query string (empty values dropped)."""
+    f = {k: (args.get(k) or "").strip() for k in ("severity", "ip", "country", "since", "until", "campaign")}
+    if f["severity"] not in SEVERITY_FILTERS:
+        f["severity"] = ""
+    if not f["campaign"].isdigit():
+        f["campaign"] = ""
+    return {k: v for k, v in f.items() if v}
+
+def filter_clauses(filters):
+    """SQL WHERE clauses and parameters for read_filters() output."""
+    where, params = [], []
+    if filters.get("severity"):
+        where.append("e.severity = ?")
+        params.append(severity_code(filters["severity"]))
+    if filters.get("ip"):
+        where.append("s.client_ip = ?")
+        params.append(filters["ip"])
+    if filters.get("country"):
+        where.append("s.country = ?")
+        params.append(filters["country"])
+    if filters.get("campaign"):
+        where.append("s.campaign = ?")
+        params.append(int(filters["campaign"]))
+    if filters.get("since") and parse_time(filters["since"]) is not None:
+        where.append("e.ts_epoch >= ?")
+        params.append(parse_time(filters["since"]))
+    if filters.get("until") and parse_time(filters["until"]) is not None:
+        where.append("e.ts_epoch <= ?")
+        params.append(parse_time(filters["until"]))
+    return where, params
+
+def get_events(limit=PAGE_SIZE, cursor=None, filters=None):
+    """Fetch one page of events, newest first.
+
+    Keyset pagination on (ts_epoch, id): each page starts strictly after the last
+    row of the previous one, so the cost of a page does not grow with how far
+    back it is. Returns (events, next_cursor); next_cursor is None on the
+    last page."""
     if not os.path.exists(DB_FILE):
-        return []
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT e.ts, s.client_ip, s.client_port, s.country, e.payload, e.extra_json
+        return [], None
+    filters = filters or {}
+    where, params = filter_clauses(filters)
+    after = decode_cursor(cursor) if cursor else None
+    if after:
+        where.append("(e.ts_epoch, e.id) < (?, ?)")
+        params.extend(after)
+    sql = """
+        SELECT e.id, e.session_id, e.ts_epoch, s.client_ip, s.client_port, s.country, s.campaign,
+               COALESCE(p.text, e.payload) AS payload, e.severity
         FROM events e
         JOIN sessions s ON s.id = e.session_id
-        ORDER BY e.ts DESC
-    """)
-    rows = cur.fetchall()
-    conn.close()
+        LEFT JOIN payloads p ON p.id = e.payload_id
+    """
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY e.ts_epoch DESC, e.id DESC LIMIT ?"
+
+    # live database first, then archived partitions in the filtered time range
+    since = parse_time(filters["since"]) if filters.get("since") else None
+    until = parse_time(filters["until"]) if filters.get("until") else None
+    if after:
+        until = after[0] if until is None else min(until, after[0])
+    rows = fan_out(sql, params, limit + 1, since, until, db_file=DB_FILE)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["ts_epoch"], rows[-1]["id"])
+
+    return [row_to_event(r) for r in rows], next_cursor
+
+def row_to_event(r):
+    return {
+        "id": r["id"],
+        "session": r["session_id"],
+        "ts": format_time(r["ts_epoch"]),
+        "client": f"{r['client_ip']}:{r['client_port']}",
+        "country": r["country"] or "Unknown",
+        "campaign": r["campaign"] or None,
+        "payload": r["payload"],
+        "severity": severity_name(r["severity"])
+    }
+
+def ring_to_event(r):
+    """Event dict (as row_to_event) for a record from the shared-memory ring."""
+    return {
+        "id": r["seq"],
+        "session": r["session_id"],
+        "ts": format_time(r["ts"]),
+        "client": f"{r['client_ip']}:{r['client_port']}",
+        "country": r["country"] or "Unknown",
+        "campaign": None,
+        "payload": r["payload"] + ("…" if r["truncated"] else ""),
+        "severity": severity_name(r["severity"])
+    }
+
+def init_indexes():
+    if os.path.exists(DB_FILE):
+        conn = sqlite3.connect(DB_FILE)
+        try:
+            ensure_schema(conn)
+            partitions.sync_schema(DB_FILE)
+            if conn.execute("SELECT 1 FROM events WHERE ts_epoch IS NULL LIMIT 1").fetchone():
+                print("[!] Events without typed columns found; run `python migrate.py` to backfill them.")
+        finally:
+            conn.close()
+
+# ------------------------------------------------------
+# LIVE STREAM (shared poller -> Server-Sent Events)
+# ------------------------------------------------------
+STREAM_POLL_INTERVAL = 1.0   # seconds between DB polls (one poller for all viewers)
+RING_POLL_INTERVAL = 0.1     # seconds between reads of the honeypot's shared-memory rings
+STREAM_BACKLOG = 1000        # recent events kept for clients that fall behind
+STREAM_HEARTBEAT = 15.0      # seconds between keep-alive comments
+
+def parse_position(value):
+    """(events.id, run, seq) of a stream id "<events.id>:<run>:<seq>", or
+    (events.id, None, None) for a bare events.id; (None, None, None) if neither."""
+    parts = (value or "").split(":")
+    if not parts[0].isdigit():
+        return None, None, None
+    if len(parts) == 3 and parts[2].isdigit():
+        return int(parts[0]), parts[1], int(parts[2])
+    return int(parts[0]), None, None
+
+class EventBroadcaster:
+    """Follows new events once, no matter how many viewers are connected,
+    and hands them to every /stream generator waiting on its condition
+    variable. While the honeypot runs, events come from its shared-memory
+    rings (see ring.py) and the database is only asked for MAX(id) once per
+    interval; otherwise the events table is polled once per interval.
+
+    `db_last` is the events.id the stream has reached: the last row
+    delivered from the database, or the MAX(id) read before a ring poll
+    (those rows were published before it). Both sources continue from it,
+    so a switch of source loses nothing (an event may come twice). Stream
+    ids are "<events.id>:<run>:<seq>": a viewer reconnecting to this run
+    resumes from the backlog, one from an earlier run from the database."""
+
+    def __init__(self, interval=STREAM_POLL_INTERVAL, backlog=STREAM_BACKLOG):
+        self.interval = interval
+        self._recent = deque(maxlen=backlog)   # (seq, event)
+        self._cond = threading.Condition()
+        self._seq = 0
+        self.db_last = None
+        self.run = os.urandom(4).hex()          # tells this run's stream ids from a restarted one's
+        self.source = None
+        self.rings = RingSet()
+        self._thread = None
+        self._lock = threading.Lock()
 
-    events = []
-    for r in rows:
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="hp-stream-poller", daemon=True)
+                self._thread.start()
+
+    def cursor(self):
+        """Stream id of the newest event so far (where a new page starts)."""
+        self.start()
+        with self._cond:
+            return f"{self.db_last or 0}:{self.run}:{self._seq}"
+
+    def _deliver(self, marked, db_last):
+        """Hand (events.id reached, event) pairs to the viewers."""
+        with self._cond:
+            for mark, e in marked:
+                self._seq += 1
+                self._recent.append((self._seq, dict(e, id=f"{mark}:{self.run}:{self._seq}")))
+            self.db_last = db_last
+            if marked:
+                self._cond.notify_all()
+
+    def resume(self, position):
+        """(seq to follow the backlog after, events to send first) for a
+        viewer's Last-Event-ID or ?after=. A position from this run that is
+        still in the backlog resumes there; any other events.id is caught up
+        from the database to where the backlog takes over."""
+        self.start()
+        db_id, run, seq = parse_position(position)
+        with self._cond:
+            oldest = self._recent[0][0] if self._recent else self._seq + 1
+            if run == self.run and oldest - 1 <= seq <= self._seq:
+                return seq, []
+            seq, until = self._seq, self.db_last
+        if db_id is None or not os.path.exists(DB_FILE):
+            return seq, []
+        conn = sqlite3.connect(DB_FILE)
+        conn.row_factory = sqlite3.Row
         try:
-            extra = json.loads(r["extra_json"]) if r["extra_json"] else {}
-        except:
-            extra = {}
-        events.append({
-            "ts": format_time(r["ts"]),
-            "client": f"{r['client_ip']}:{r['client_port']}",
-            "country": r["country"] or "Unknown",
-            "payload": r["payload"],
-            "severity": extra.get("severity", "Unknown")
-        })
-    return events
+            if until is None:
+                with self._cond:
+                    self._start_position(conn)
+                    seq, until = self._seq, self.db_last
+            rows = self._fetch(conn, db_id, until, newest=self._recent.maxlen) if db_id < until else []
+        finally:
+            conn.close()
+        return seq, [dict(row_to_event(r), id=str(r["id"])) for r in rows]
+
+    def _fetch(self, conn, after_id, until=None, newest=None):
+        """Rows with after_id < id (<= until), oldest first: the first 1000,
+        or the newest `newest`."""
+        cur = conn.execute(f"""
+            SELECT e.id, e.session_id, e.ts_epoch, s.client_ip, s.client_port, s.country, s.campaign,
+                   COALESCE(p.text, e.payload) AS payload, e.severity
+            FROM events e
+            LEFT JOIN sessions s ON s.id = e.session_id
+            LEFT JOIN payloads p ON p.id = e.payload_id
+            WHERE e.id > ? AND e.id <= ?
+            ORDER BY e.id {"DESC" if newest else ""}
+            LIMIT ?
+        """, (after_id, until if until is not None else 2 ** 63 - 1, newest or 1000))
+        rows = cur.fetchall()
+        return rows[::-1] if newest else rows
+
+    def _poll_db(self, conn):
+        """Deliver rows newer than db_last; True if there may be more."""
+        rows = self._fetch(conn, self.db_last)
+        if rows:
+            self._deliver([(r["id"], row_to_event(r)) for r in rows], rows[-1]["id"])
+        return len(rows) == 1000
+
+    def _max_id(self, conn):
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+    def _start_position(self, conn):
+        """The stream starts at the newest row (called holding the condition)."""
+        if self.db_last is None:
+            self.db_last = self._max_id(conn)
+
+    def _run(self):
+        conn, next_mark = None, 0.0
+        while True:
+            try:
+                if conn is None and os.path.exists(DB_FILE):
+                    conn = sqlite3.connect(DB_FILE)
+                    conn.row_factory = sqlite3.Row
+                if conn is not None and self.db_last is None:
+                    with self._cond:
+                        self._start_position(conn)
+                if self.rings.available():
+                    if self.source != "ring":
+                        print(f"[*] Live view follows {len(self.rings.readers)} honeypot event ring(s)")
+                        self.source = "ring"
+                        if conn is not None:
+                            self._poll_db(conn)   # rows committed before the rings were attached
+                    top = self.db_last or 0
+                    if conn is not None and time.monotonic() >= next_mark:
+                        top = max(top, self._max_id(conn))   # published before the poll below
+                        next_mark = time.monotonic() + self.interval
+                    records = self.rings.poll()
+                    self._deliver([(top, ring_to_event(r)) for r in records], top)
+                    time.sleep(RING_POLL_INTERVAL)
+                    continue
+                if self.source != "sqlite":
+                    print("[*] Live view polls SQLite (no honeypot event ring found)")
+                    self.source = "sqlite"
+                if conn is not None and self._poll_db(conn):
+                    continue
+            except sqlite3.Error as e:
+                print(f"[!] Stream poll failed: {e}")
+                if conn is not None:
+                    conn.close()
+                conn = None
+            time.sleep(self.interval)
+
+    def wait_for(self, after_seq, timeout):
+        """(seq, event) pairs after after_seq, waiting up to timeout for new ones."""
+        with self._cond:
+            if not self._recent or self._recent[-1][0] <= after_seq:
+                self._cond.wait(timeout)
+            return [(seq, e) for seq, e in self._recent if seq > after_seq]
+
+BROADCASTER = EventBroadcaster()
+
+def event_matches(e, filters):
+    """Python-side twin of filter_clauses() for streamed events."""
+    if filters.get("severity") and e["severity"] != filters["severity"]:
+        return False
+    if filters.get("ip") and e["client"].rsplit(":", 1)[0] != filters["ip"]:
+        return False
+    if filters.get("country") and e["country"] != filters["country"]:
+        return False
+    if filters.get("campaign") and str(e["campaign"]) != filters["campaign"]:
+        return False
+    return True
 
 # ------------------------------------------------------
 # ROUTES
@@ -86,7 +387,9 @@ def index():
         return redirect(url_for("login"))
 
     auto_refresh = session.get("auto_refresh", True)
-    events = get_events()
+    filters = read_filters(request.args)
+    cursor = request.args.get("cursor")
+    events, next_cursor = get_events(cursor=cursor, filters=filters)
     last_updated = format_time(datetime.now())
 
     html = """
@@ -156,6 +459,17 @@ def index():
             color: #aaa;
             margin-top: 10px;
         }
+        .filters {
+            text-align: center;
+            margin: 10px;
+        }
+        .filters input, .filters select {
+            background: #1a1a1a;
+            color: #ddd;
+            border: 1px solid #555;
+            padding: 5px;
+            margin: 2px;
+        }
         #honeypotContainer {
             height: 500px; /* ✅ Scrollable honeypot section */
             overflow-y: auto;
@@ -164,36 +478,60 @@ def index():
             padding-right: 10px;
         }
     </style>
-    {% if auto_refresh %}
-      <meta http-equiv="refresh" content="5">
-    {% endif %}
     </head>
     <body>
         <div class="header">🧠 AI SecurityOps Honeypot — Live Event Dashboard</div>
 
         <div style="text-align:center;margin:10px;">
             <form method="post" action="/toggle_refresh" style="display:inline;">
-                <button type="submit">{% if auto_refresh %}🔄 Auto Refresh: ON{% else %}⏸️ Auto Refresh: OFF{% endif %}</button>
+                <button type="submit">{% if auto_refresh %}🔄 Live Updates: ON{% else %}⏸️ Live Updates: OFF{% endif %}</button>
             </form>
             <form method="get" action="/refresh" style="display:inline;">
                 <button type="submit">♻️ Refresh Now</button>
             </form>
+            <form method="get" action="/stats" style="display:inline;">
+                <button type="submit">📊 Stats</button>
+            </form>
+            <a href="{{ url_for('export', kind='events', format='csv', **filters) }}"><button type="button">⬇ CSV</button></a>
+            <a href="{{ url_for('export', kind='events', format='ndjson', gzip=1, **filters) }}"><button type="button">⬇ NDJSON.gz</button></a>
             <form method="get" action="/logout" style="display:inline;">
                 <button type="submit">🚪 Logout</button>
             </form>
         </div>
 
-        <div class="timestamp">🕓 Last Updated: {{ last_updated }}</div>
+        <div class="timestamp" id="lastUpdated">🕓 Last Updated: {{ last_updated }}</div>
+
+        <form method="get" action="/" class="filters">
+            <select name="severity">
+                <option value="">All severities</option>
+                {% for sev in severities %}
+                    <option value="{{ sev }}" {% if filters.severity == sev %}selected{% endif %}>{{ sev.upper() }}</option>
+                {% endfor %}
+            </select>
+            <input name="ip" placeholder="IP" value="{{ filters.ip or '' }}">
+            <input name="country" list="countries" placeholder="Country" value="{{ filters.country or '' }}">
+            <datalist id="countries">{% for c in countries %}<option value="{{ c }}">{% endfor %}</datalist>
+            <input name="campaign" size="8" placeholder="Campaign" value="{{ filters.campaign or '' }}">
+            <input name="since" placeholder="From (YYYY-MM-DD HH:MM IST)" value="{{ filters.since or '' }}">
+            <input name="until" placeholder="To (YYYY-MM-DD HH:MM IST)" value="{{ filters.until or '' }}">
+            <button type="submit">🔎 Filter</button>
+            <a href="/"><button type="button">✖ Clear</button></a>
+        </form>
+        <form method="get" action="/search" class="filters">
+            <input name="q" size="50" placeholder='Search payloads, e.g. wget "evil.example.com" or base64'>
+            <button type="submit">🔍 Search</button>
+        </form>
 
-        <div class="section-title">🧠 Honeypot Events (All Records)</div>
+        <div class="section-title">🧠 Honeypot Events (Newest First, {{ page_size }} per Page)</div>
         <div id="honeypotContainer">
-            <table>
-                <tr><th>Time (IST)</th><th>Client</th><th>Country</th><th>Payload</th><th>Severity</th></tr>
+            <table id="eventsTable">
+                <tr><th>Time (IST)</th><th>Client</th><th>Country</th><th>Campaign</th><th>Payload</th><th>Severity</th></tr>
                 {% for e in events %}
                     <tr>
                         <td>{{ e.ts }}</td>
-                        <td>{{ e.client }}</td>
+                        <td><a href="{{ url_for('transcript', session_id=e.session) }}" style="color:#8ab4f8;">{{ e.client }}</a></td>
                         <td>{{ e.country }}</td>
+                        <td>{% if e.campaign %}<a href="{{ url_for('index', campaign=e.campaign) }}" style="color:#8ab4f8;">#{{ e.campaign }}</a>{% endif %}</td>
                         <td>{{ e.payload }}</td>
                         {% if 'critical' in e.severity.lower() %}
                             <td class="critical-glow">CRITICAL</td>
@@ -206,20 +544,482 @@ def index():
                 {% endfor %}
             </table>
         </div>
+        <div style="text-align:center;margin:10px;">
+            {% if cursor %}<a href="{{ url_for('index', **filters) }}"><button>⏮ Newest</button></a>{% endif %}
+            {% if next_cursor %}<a href="{{ url_for('index', cursor=next_cursor, **filters) }}"><button>Older ▶</button></a>{% endif %}
+        </div>
 
         <script>
-        // ✅ Auto-scroll Honeypot section
-        const honeypotDiv = document.getElementById('honeypotContainer');
-        if (honeypotDiv) honeypotDiv.scrollTop = honeypotDiv.scrollHeight;
+        {% if auto_refresh and not cursor %}
+        // ✅ Live updates: append only rows newer than the newest one shown
+        const SEVERITY_COLORS = {critical: "#ff0033", high: "#ff4500", medium: "#ffa500", low: "#00ff7f"};
+        const MAX_ROWS = 500;
+        const table = document.getElementById('eventsTable');
+        const params = new URLSearchParams({{ filters|tojson }});
+        params.set('after', '{{ newest_id }}');
+        const source = new EventSource('/stream?' + params.toString());
+        source.onmessage = (msg) => {
+            const e = JSON.parse(msg.data);
+            const row = table.insertRow(1);
+            row.insertCell().textContent = e.ts;
+            const link = document.createElement('a');
+            link.href = '/transcript/' + encodeURIComponent(e.session);
+            link.style.color = '#8ab4f8';
+            link.textContent = e.client;
+            row.insertCell().appendChild(link);
+            row.insertCell().textContent = e.country;
+            row.insertCell().textContent = e.campaign ? '#' + e.campaign : '';   // assigned once the session ends
+            row.insertCell().textContent = e.payload;
+            const sev = row.insertCell();
+            const s = (e.severity || 'unknown').toLowerCase();
+            sev.textContent = s.toUpperCase();
+            if (s.includes('critical')) {
+                sev.className = 'critical-glow';
+            } else {
+                sev.style.color = SEVERITY_COLORS[s] || 'white';
+                sev.style.fontWeight = 'bold';
+            }
+            while (table.rows.length > MAX_ROWS + 1) table.deleteRow(-1);
+            document.getElementById('lastUpdated').textContent = '🕓 Last Updated: ' + e.ts;
+        };
+        {% endif %}
         </script>
     </body>
     </html>
     """
     return render_template_string(html, events=events,
+                                  filters=filters, cursor=cursor,
+                                  next_cursor=next_cursor,
+                                  severities=SEVERITY_FILTERS,
+                                  countries=known_countries(),
+                                  page_size=PAGE_SIZE,
+                                  newest_id=BROADCASTER.cursor(),
                                   auto_refresh=auto_refresh,
                                   last_updated=last_updated,
                                   get_severity_color=get_severity_color)
 
+@APP.route("/stream")
+def stream():
+    """Server-Sent Events: rows newer than the client's last seen id."""
+    if not session.get("logged"):
+        return Response("login required", status=401)
+    filters = read_filters(request.args)
+    seq, first = BROADCASTER.resume(request.headers.get("Last-Event-ID") or request.args.get("after"))
+
+    def generate():
+        last = seq
+        yield "retry: 3000\n\n"
+        for e in first:
+            if event_matches(e, filters):
+                yield f"id: {e['id']}\ndata: {json.dumps(e)}\n\n"
+        while True:
+            events = BROADCASTER.wait_for(last, STREAM_HEARTBEAT)
+            if not events:
+                yield ": keep-alive\n\n"
+                continue
+            for last, e in events:
+                if event_matches(e, filters):
+                    yield f"id: {e['id']}\ndata: {json.dumps(e)}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+TAIL_MAX = 1000
+TAIL_RINGS = RingSet()
+_tail_lock = threading.Lock()
+
+@APP.route("/tail")
+def tail():
+    """Newest ?n= events as JSON, newest first: from the honeypot's
+    shared-memory rings while it runs, from SQLite otherwise."""
+    if not session.get("logged"):
+        return Response("login required", status=401)
+    try:
+        n = max(1, min(int(request.args.get("n", 50)), TAIL_MAX))
+    except ValueError:
+        n = 50
+    with _tail_lock:
+        records = TAIL_RINGS.latest(n) if TAIL_RINGS.available() else None
+    if records is not None:
+        events, source = [ring_to_event(r) for r in records], "ring"
+    else:
+        events, source = get_events(limit=n)[0], "sqlite"
+    return Response(json.dumps({"source": source, "events": events}), mimetype="application/json")
+
+# ------------------------------------------------------
+# STREAMING EXPORT (NDJSON / CSV, optionally gzipped)
+# ------------------------------------------------------
+EXPORT_CHUNK = 1000          # rows per chunk written to the response
+EXPORT_FORMATS = ("ndjson", "csv")
+EXPORT_COLUMNS = {
+    "events": ["id", "session_id", "ts", "ts_epoch", "client_ip", "client_port", "country", "asn",
+               "campaign", "kind", "payload", "tags", "severity", "verdict"],
+    "sessions": ["id", "client_ip", "client_port", "start_ts", "end_ts", "start_epoch", "end_epoch",
+                 "r_dns", "country", "asn", "campaign", "notes"],
+}
+
+def iso_utc(epoch):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(epoch)) if epoch is not None else None
+
+def export_rows(kind, filters, after):
+    """Rows to export, oldest id first, strictly after `after` (the last id a
+    previous, interrupted download received). A generator over the live
+    database and the archived partitions; nothing is collected in memory."""
+    since = parse_time(filters["since"]) if filters.get("since") else None
+    until = parse_time(filters["until"]) if filters.get("until") else None
+    if kind == "events":
+        where, params = filter_clauses(filters)
+        sql = f"""
+            SELECT e.id, e.session_id, e.ts_epoch, s.client_ip, s.client_port, s.country, s.asn, s.campaign,
+                   e.kind, COALESCE(p.text, e.payload) AS payload, COALESCE(e.tags, p.tags) AS tags, e.severity,
+                   COALESCE(e.extra_json, p.verdict) AS extra_json
+            FROM events e
+            LEFT JOIN sessions s ON s.id = e.session_id
+            LEFT JOIN payloads p ON p.id = e.payload_id
+            WHERE {" AND ".join(["e.id > ?"] + where)}
+            ORDER BY e.id
+        """
+        for r in iter_merged(sql, [after or 0] + params, lambda r: r["id"], since, until, DB_FILE):
+            try:
+                verdict = json.loads(r["extra_json"]) if r["extra_json"] else None
+            except ValueError:
+                verdict = r["extra_json"]
+            yield {"id": r["id"], "session_id": r["session_id"], "ts": iso_utc(r["ts_epoch"]),
+                   "ts_epoch": r["ts_epoch"], "client_ip": r["client_ip"], "client_port": r["client_port"],
+                   "country": r["country"], "asn": r["asn"], "campaign": r["campaign"], "kind": r["kind"], "payload": r["payload"],
+                   "tags": r["tags"], "severity": severity_name(r["severity"]), "verdict": verdict}
+        return
+    where, params = ["s.id > ?"], [after or ""]
+    if filters.get("ip"):
+        where.append("s.client_ip = ?")
+        params.append(filters["ip"])
+    if filters.get("country"):
+        where.append("s.country = ?")
+        params.append(filters["country"])
+    if filters.get("campaign"):
+        where.append("s.campaign = ?")
+        params.append(int(filters["campaign"]))
+    if since is not None:
+        where.append("s.start_epoch >= ?")
+        params.append(since)
+    if until is not None:
+        where.append("s.start_epoch <= ?")
+        params.append(until)
+    sql = f"""
+        SELECT s.id, s.client_ip, s.client_port, s.start_epoch, s.end_epoch, s.r_dns, s.country, s.asn, s.campaign, s.notes
+        FROM sessions s WHERE {" AND ".join(where)} ORDER BY s.id
+    """
+    last = None
+    for r in iter_merged(sql, params, lambda r: r["id"], since, None, DB_FILE):
+        if r["id"] == last:
+            continue   # a session whose events span partitions is stored in each of them
+        last = r["id"]
+        yield {"id": r["id"], "client_ip": r["client_ip"], "client_port": r["client_port"],
+               "start_ts": iso_utc(r["start_epoch"]), "end_ts": iso_utc(r["end_epoch"]),
+               "start_epoch": r["start_epoch"], "end_epoch": r["end_epoch"], "r_dns": r["r_dns"],
+               "country": r["country"], "asn": r["asn"], "campaign": r["campaign"], "notes": r["notes"]}
+
+def encode_rows(rows, fmt, columns, header=True):
+    """Serialize rows in chunks of EXPORT_CHUNK: NDJSON lines or CSV text."""
+    buf = io.StringIO()
+    writer = csv.writer(buf) if fmt == "csv" else None
+    if writer and header:
+        writer.writerow(columns)
+    n = 0
+    for row in rows:
+        if writer:
+            writer.writerow([json.dumps(row[c]) if isinstance(row[c], (dict, list)) else row[c] for c in columns])
+        else:
+            buf.write(json.dumps(row, ensure_ascii=False) + "\n")
+        n += 1
+        if n % EXPORT_CHUNK == 0:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+def gzip_chunks(chunks):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)   # wbits=31: gzip container
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+@APP.route("/export/<kind>")
+def export(kind):
+    """Stream events or sessions: ?format=ndjson|csv, &gzip=1, the index
+    page's filters, and &after=<last id received> to resume a download."""
+    if not session.get("logged"):
+        return Response("login required", status=401)
+    fmt = request.args.get("format", "ndjson")
+    if kind not in EXPORT_COLUMNS or fmt not in EXPORT_FORMATS:
+        return Response("usage: /export/events|sessions?format=ndjson|csv", status=404, mimetype="text/plain")
+    filters = read_filters(request.args)
+    after = request.args.get("after") or None
+    if kind == "events" and after is not None:
+        try:
+            after = int(after)
+        except ValueError:
+            return Response("after must be an event id", status=400, mimetype="text/plain")
+    if not os.path.exists(DB_FILE):
+        return Response("no database yet", status=404, mimetype="text/plain")
+    # no CSV header when resuming, so the parts concatenate into one file
+    chunks = encode_rows(export_rows(kind, filters, after), fmt, EXPORT_COLUMNS[kind], header=after is None)
+    name = f"{kind}.{fmt}"
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    if request.args.get("gzip"):
+        chunks, name, mimetype = gzip_chunks(chunks), name + ".gz", "application/gzip"
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename={name}", "X-Accel-Buffering": "no"})
+
+# Full-text search over payloads (see search.py)
+SEARCH_PAGE_SIZE = 50
+SEARCH_MAX_PAGES = 20
+
+def highlight(snippet):
+    """Escape a search snippet and turn its hit markers into <mark> tags."""
+    html = str(escape(snippet or ""))
+    return Markup(html.replace(search.HIT_START, "<mark>").replace(search.HIT_END, "</mark>"))
+
+@APP.route("/search")
+def search_events():
+    if not session.get("logged"):
+        return redirect(url_for("login"))
+    q = (request.args.get("q") or "").strip()
+    filters = read_filters(request.args)
+    try:
+        page = min(max(int(request.args.get("page", 1)), 1), SEARCH_MAX_PAGES)
+    except ValueError:
+        page = 1
+    results, has_more, elapsed_ms = [], False, 0.0
+    if q and os.path.exists(DB_FILE):
+        where, params = filter_clauses(filters)
+        conn = sqlite3.connect(DB_FILE)
+        conn.row_factory = sqlite3.Row
+        t0 = time.perf_counter()
+        try:
+            rows = search.search(conn, q, SEARCH_PAGE_SIZE + 1, (page - 1) * SEARCH_PAGE_SIZE, where, params)
+        finally:
+            conn.close()
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        has_more = len(rows) > SEARCH_PAGE_SIZE and page < SEARCH_MAX_PAGES
+        results = [dict(row_to_event(r), snippet=highlight(r["snippet"])) for r in rows[:SEARCH_PAGE_SIZE]]
+    return render_template_string("""
+    <!DOCTYPE html>
+    <html><head><meta charset="UTF-8"><title>🔍 Payload Search</title>
+    <style>
+        body { background:#0e0e0e; color:#ddd; font-family:Consolas, monospace; margin:0; }
+        .header { background:#1a1a1a; padding:15px; font-size:18px; font-weight:bold; text-align:center; border-bottom:2px solid #444; }
+        table { width:100%; border-collapse:collapse; }
+        th, td { padding:8px; border-bottom:1px solid #333; }
+        th { background:#1a1a1a; }
+        td.payload { word-break:break-all; }
+        mark { background:#665c00; color:#fff; }
+        input, select { background:#1a1a1a; color:#ddd; border:1px solid #555; padding:5px; margin:2px; }
+        button { background:#222; color:#fff; border:1px solid #555; padding:6px 10px; border-radius:5px; cursor:pointer; margin:5px; }
+        .center { text-align:center; margin:10px; color:#aaa; }
+    </style></head>
+    <body>
+        <div class="header">🔍 Payload Search</div>
+        <form method="get" action="/search" class="center">
+            <a href="/"><button type="button">⬅ Events</button></a>
+            <input name="q" size="50" value="{{ q }}" placeholder='wget "evil.example.com", base64, curl AND sh, nc*'>
+            <select name="severity">
+                <option value="">All severities</option>
+                {% for sev in severities %}
+                    <option value="{{ sev }}" {% if filters.severity == sev %}selected{% endif %}>{{ sev.upper() }}</option>
+                {% endfor %}
+            </select>
+            <input name="ip" placeholder="IP" value="{{ filters.ip or '' }}">
+            <input name="country" list="countries" placeholder="Country" value="{{ filters.country or '' }}">
+            <datalist id="countries">{% for c in countries %}<option value="{{ c }}">{% endfor %}</datalist>
+            <button type="submit">🔍 Search</button>
+        </form>
+        {% if q %}<div class="center">Page {{ page }} · {{ results|length }} results · {{ '%.1f' % elapsed_ms }} ms · best matches first</div>{% endif %}
+        <table>
+            <tr><th>Time (IST)</th><th>Client</th><th>Country</th><th>Payload</th><th>Severity</th></tr>
+            {% for e in results %}
+                <tr>
+                    <td>{{ e.ts }}</td>
+                    <td><a href="{{ url_for('transcript', session_id=e.session) }}" style="color:#8ab4f8;">{{ e.client }}</a></td>
+                    <td>{{ e.country }}</td>
+                    <td class="payload">{{ e.snippet }}</td>
+                    <td style="color: {{ get_severity_color(e.severity) }}; font-weight:bold;">{{ e.severity.upper() }}</td>
+                </tr>
+            {% endfor %}
+        </table>
+        <div class="center">
+            {% if page > 1 %}<a href="{{ url_for('search_events', q=q, page=page - 1, **filters) }}"><button>◀ Previous</button></a>{% endif %}
+            {% if has_more %}<a href="{{ url_for('search_events', q=q, page=page + 1, **filters) }}"><button>Next ▶</button></a>{% endif %}
+        </div>
+    </body></html>
+    """, q=q, filters=filters, severities=SEVERITY_FILTERS, countries=known_countries(), page=page, results=results,
+        has_more=has_more, elapsed_ms=elapsed_ms, get_severity_color=get_severity_color)
+
+# Session transcripts (see transcripts.py)
+@APP.route("/transcript/<path:session_id>")
+def transcript(session_id):
+    if not session.get("logged"):
+        return redirect(url_for("login"))
+    records = None
+    if os.path.exists(DB_FILE):
+        conn = sqlite3.connect(DB_FILE)
+        try:
+            records = transcripts.load(conn, session_id)
+        except (OSError, ValueError) as e:
+            return Response(f"transcript unreadable: {e}", status=500, mimetype="text/plain")
+        finally:
+            conn.close()
+    if records is None:
+        return Response("no transcript for this session", status=404, mimetype="text/plain")
+    if request.args.get("download"):
+        safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in session_id)
+        return Response(transcripts.to_text(records), mimetype="text/plain",
+                        headers={"Content-Disposition": f"attachment; filename={safe_name}.log"})
+    rows = [{"t": r["t"], "d": r["d"], "x": transcripts.record_bytes(r).decode("utf-8", "replace")} for r in records]
+    return render_template_string("""
+    <!DOCTYPE html>
+    <html><head><meta charset="UTF-8"><title>📜 Transcript {{ session_id }}</title>
+    <style>
+        body { background:#0e0e0e; color:#ddd; font-family:Consolas, monospace; margin:0; }
+        .header { background:#1a1a1a; padding:15px; font-size:18px; font-weight:bold; text-align:center; border-bottom:2px solid #444; }
+        button { background:#222; color:#fff; border:1px solid #555; padding:6px 10px; border-radius:5px; cursor:pointer; margin:5px; }
+        .center { text-align:center; margin:10px; color:#aaa; }
+        #term { background:#000; margin:0 20px; padding:10px; white-space:pre-wrap; word-break:break-all; min-height:300px; }
+        .recv { color:#00ff7f; } .send { color:#ddd; } .note { color:#888; font-style:italic; }
+        .t { color:#555; }
+    </style></head>
+    <body>
+        <div class="header">📜 Session {{ session_id }}</div>
+        <div class="center">
+            <a href="/"><button>⬅ Events</button></a>
+            <button onclick="replay()">▶ Replay</button>
+            <button onclick="showAll()">⏭ Show all</button>
+            <a href="{{ url_for('transcript', session_id=session_id, download=1) }}"><button>⬇ Download</button></a>
+            {{ rows|length }} records
+        </div>
+        <div id="term"></div>
+        <script>
+        const RECORDS = {{ rows|tojson }};
+        const term = document.getElementById('term');
+        let timers = [];
+        function line(r) {
+            const div = document.createElement('div');
+            const t = document.createElement('span');
+            t.className = 't';
+            t.textContent = '+' + r.t.toFixed(3) + 's ';
+            const x = document.createElement('span');
+            x.className = r.d;
+            x.textContent = (r.d === 'recv' ? '$ ' : '') + r.x.replace(/[\r\n]+$/, '');
+            div.append(t, x);
+            term.appendChild(div);
+        }
+        function clear() { timers.forEach(clearTimeout); timers = []; term.textContent = ''; }
+        function showAll() { clear(); RECORDS.forEach(line); }
+        function replay() {
+            clear();
+            // real timings, but never more than 2s between records
+            let at = 0, prev = 0;
+            for (const r of RECORDS) {
+                at += Math.min(r.t - prev, 2) * 1000;
+                prev = r.t;
+                timers.push(setTimeout(() => line(r), at));
+            }
+        }
+        showAll();
+        </script>
+    </body></html>
+    """, session_id=session_id, rows=rows)
+
+# Stats panel: reads the rollup and campaign tables only (see rollups.py, campaigns.py), never events
+STATS_RANGES = {"1h": 3600, "24h": 86400, "7d": 7 * 86400, "30d": 30 * 86400, "90d": 90 * 86400}
+STATS_TOP = 10
+
+def top_campaigns(since):
+    if not os.path.exists(DB_FILE):
+        return []
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        return [{"id": cid, "sessions": n, "first": first, "last": last, "sample": sample}
+                for cid, n, first, last, sample in campaigns.top(conn, since, STATS_TOP)]
+    except sqlite3.OperationalError:   # database from before campaigns.py
+        return []
+    finally:
+        conn.close()
+
+@APP.route("/stats")
+def stats():
+    if not session.get("logged"):
+        return redirect(url_for("login"))
+    rng = request.args.get("range", "24h")
+    if rng not in STATS_RANGES:
+        rng = "24h"
+    until = int(time.time()) + 1
+    since = until - STATS_RANGES[rng]
+    t0 = time.perf_counter()
+    data = rollups.summary(DB_FILE, since, until, STATS_TOP)
+    data["campaigns"] = top_campaigns(since)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    if request.args.get("format") == "json":
+        return Response(json.dumps(dict(data, range=rng, since=since, until=until)), mimetype="application/json")
+
+    peak = max([n for _, n in data["series"]] or [1])
+    series = [(format_time(b), n, max(1, round(100 * n / peak))) for b, n in data["series"]]
+    severity = [(s, data["severity"].get(s, 0)) for s in reversed(SEVERITY_FILTERS)]
+    return render_template_string("""
+    <!DOCTYPE html>
+    <html><head><meta charset="UTF-8"><title>📊 Honeypot Stats</title>
+    <style>
+        body { background:#0e0e0e; color:#ddd; font-family:Consolas, monospace; margin:0; }
+        .header { background:#1a1a1a; padding:15px; font-size:18px; font-weight:bold; text-align:center; border-bottom:2px solid #444; }
+        .grid { display:flex; flex-wrap:wrap; gap:20px; margin:20px; }
+        .card { background:#151515; border:1px solid #333; padding:10px; flex:1 1 300px; }
+        .card h3 { margin:0 0 8px 0; font-size:15px; }
+        table { width:100%; border-collapse:collapse; }
+        td { padding:4px; border-bottom:1px solid #262626; word-break:break-all; }
+        td.n { text-align:right; width:80px; }
+        .chart { display:flex; align-items:flex-end; height:150px; gap:1px; margin:0 20px; border-bottom:1px solid #444; }
+        .bar { flex:1; background:#00b36b; min-width:1px; }
+        button { background:#222; color:#fff; border:1px solid #555; padding:6px 10px; border-radius:5px; cursor:pointer; margin:5px; }
+        button.active { background:#444; }
+        .center { text-align:center; margin:10px; color:#aaa; }
+    </style></head>
+    <body>
+        <div class="header">📊 Honeypot Statistics — last {{ rng }}</div>
+        <div class="center">
+            <a href="/"><button>⬅ Events</button></a>
+            {% for r in ranges %}<a href="{{ url_for('stats', range=r) }}"><button class="{{ 'active' if r == rng }}">{{ r }}</button></a>{% endfor %}
+        </div>
+        <div class="center">{{ data.total }} events · {{ data.granularity }} buckets · {{ '%.1f' % elapsed_ms }} ms</div>
+        <div class="chart">
+            {% for label, n, pct in series %}<div class="bar" style="height:{{ pct }}%" title="{{ label }}: {{ n }}"></div>{% endfor %}
+        </div>
+        <div class="grid">
+            <div class="card"><h3>Severity</h3><table>
+                {% for s, n in severity %}<tr><td style="color:{{ get_severity_color(s) }};font-weight:bold;">{{ s.upper() }}</td><td class="n">{{ n }}</td></tr>{% endfor %}
+            </table></div>
+            <div class="card"><h3>Top countries</h3><table>
+                {% for k, n in data.country %}<tr><td>{{ k }}</td><td class="n">{{ n }}</td></tr>{% endfor %}
+            </table></div>
+            <div class="card"><h3>Top ASNs</h3><table>
+                {% for k, n in data.asn %}<tr><td>{{ k }}</td><td class="n">{{ n }}</td></tr>{% endfor %}
+            </table></div>
+        </div>
+        <div class="grid">
+            <div class="card"><h3>Top commands</h3><table>
+                {% for k, n in data.command %}<tr><td>{{ k }}</td><td class="n">{{ n }}</td></tr>{% endfor %}
+            </table></div>
+            <div class="card"><h3>Top campaigns</h3><table>
+                {% for c in data.campaigns %}<tr><td><a href="{{ url_for('index', campaign=c.id) }}" style="color:#8ab4f8;">#{{ c.id }}</a></td>
+                    <td title="{{ format_time(c.first) }} – {{ format_time(c.last) }}">{{ c.sample }}</td><td class="n">{{ c.sessions }}</td></tr>{% endfor %}
+            </table></div>
+        </div>
+    </body></html>
+    """, data=data, rng=rng, ranges=STATS_RANGES, series=series, severity=severity,
+        elapsed_ms=elapsed_ms, get_severity_color=get_severity_color, format_time=format_time)
+
 @APP.route("/toggle_refresh", methods=["POST"])
 def toggle_refresh():
     session["auto_refresh"] = not session.get("auto_refresh", True)
@@ -258,4 +1058,5 @@ def logout():
     return redirect(url_for("login"))
 
 if __name__ == "__main__":
+    init_indexes()
     APP.run(host="0.0.0.0", port=8080, debug=True)
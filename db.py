@@ -1,5 +1,8 @@
 # db.py - SQLite storage for sessions and events
-import sqlite3, os
+import sqlite3, os, time, json, calendar, heapq
+from writer import get_writer, register_batch_hook
+from rules import SEVERITIES, SEVERITY_RANK
+import rollups, search, admission, transcripts, partitions, campaigns, payloads
 DB_FILE = os.path.join(os.path.dirname(__file__), "hp_events.db")
 
 def init_db():
@@ -15,7 +18,9 @@ def init_db():
         r_dns TEXT,
         country TEXT,
         asn TEXT,
-        notes TEXT
+        notes TEXT,
+        start_epoch INTEGER,
+        end_epoch INTEGER
     )
     """)
     cur.execute("""
@@ -27,25 +32,156 @@ def init_db():
         payload TEXT,
         tags TEXT,
         extra_json TEXT,
+        ts_epoch INTEGER,
+        severity INTEGER,
         FOREIGN KEY(session_id) REFERENCES sessions(id)
     )
     """)
+    ensure_schema(conn)
     conn.commit()
     conn.close()
 
+# ==============================================
+# Typed columns
+# ==============================================
+# events.ts_epoch / sessions.start_epoch / end_epoch: integer UTC seconds.
+# events.severity: SEVERITY_RANK code (0 low .. 3 critical), NULL if unknown.
+# The legacy text columns (ts, start_ts, end_ts) are still written for older
+# tooling, but every query orders and filters on the typed ones. The verdict
+# JSON that extra_json held now lives once per payload in payloads.verdict.
+TYPED_COLUMNS = {
+    "events": [("ts_epoch", "INTEGER"), ("severity", "INTEGER")],
+    "sessions": [("start_epoch", "INTEGER"), ("end_epoch", "INTEGER")],
+}
+
+def severity_code(severity):
+    return SEVERITY_RANK.get(str(severity).lower()) if severity else None
+
+def severity_name(code):
+    return SEVERITIES[code] if code is not None and 0 <= code < len(SEVERITIES) else "Unknown"
+
+def to_epoch(ts):
+    """Epoch seconds for the timestamp formats found in existing databases:
+    '...Z' strings are UTC, naive '%Y-%m-%d %H:%M:%S' strings are local time
+    (as written by time.strftime), numbers pass through."""
+    if ts is None or ts == "":
+        return None
+    if isinstance(ts, (int, float)):
+        return int(ts)
+    s = str(ts).strip()
+    try:
+        if s.endswith("Z"):
+            return calendar.timegm(time.strptime(s[:19], "%Y-%m-%dT%H:%M:%S"))
+        return int(time.mktime(time.strptime(s[:19].replace("T", " "), "%Y-%m-%d %H:%M:%S")))
+    except ValueError:
+        return None
+
+def ensure_schema(conn):
+    """Add the typed columns to databases created before they existed (a
+    metadata-only ALTER) and create the indexes behind the dashboard's keyset
+    pagination and filters. Filling the new columns for old rows is done
+    online by migrate.py."""
+    cur = conn.cursor()
+    for table, columns in TYPED_COLUMNS.items():
+        existing = {r[1] for r in cur.execute(f"PRAGMA table_info({table})")}
+        for name, decl in columns:
+            if name not in existing:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+    # superseded text-timestamp / JSON-expression indexes
+    cur.execute("DROP INDEX IF EXISTS idx_events_ts_id")
+    cur.execute("DROP INDEX IF EXISTS idx_events_severity")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_events_epoch_id ON events(ts_epoch, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_events_sev_epoch_id ON events(severity, ts_epoch, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_events_session ON events(session_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_ip ON sessions(client_ip)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_country ON sessions(country)")
+    rollups.ensure_schema(conn)
+    admission.ensure_schema(conn)
+    transcripts.ensure_schema(conn)
+    campaigns.ensure_schema(conn)
+    payloads.ensure_schema(conn)
+    if search.ensure_schema(conn) and cur.execute("SELECT 1 FROM events LIMIT 1").fetchone():
+        print("[!] Search index created; run `python search.py --rebuild` to index existing events.")
+    conn.commit()
+
+# ==============================================
+# Reads across archived partitions (see partitions.py)
+# ==============================================
+def fan_out(sql, params, limit, since=None, until=None, db_file=None, key=lambda r: (r["ts_epoch"], r["id"])):
+    """Run a newest-first query ending in `LIMIT ?` against the live
+    database, then against each archived partition overlapping
+    [since, until], newest first, and merge the results: at most `limit`
+    sqlite3.Rows in descending key order. Partitions that cannot beat the
+    rows already found (everything in them is older) are not opened."""
+    db_file = db_file or DB_FILE
+    rows = []
+    sources = [(db_file, None)] + [(p.path, p.end) for p in partitions.overlapping(db_file, since, until)]
+    for path, end in sources:
+        if end is not None and len(rows) >= limit and key(rows[limit - 1])[0] >= end:
+            break
+        if not os.path.exists(path):
+            continue
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            rows.extend(conn.execute(sql, (*params, limit)).fetchall())
+        finally:
+            conn.close()
+        rows.sort(key=key, reverse=True)
+        del rows[limit:]
+    return rows
+
+EXPORT_FETCH = 1000   # rows pulled per fetchmany() from each source
+
+def iter_merged(sql, params, key, since=None, until=None, db_file=None, fetch=EXPORT_FETCH):
+    """Stream an ascending query (its ORDER BY matching key) over the live
+    database and every overlapping archived partition, merged into one
+    ordered sequence. Each source is read through its own cursor a batch at
+    a time, so memory does not grow with the size of the result."""
+    db_file = db_file or DB_FILE
+
+    def rows(path):
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            cur = conn.execute(sql, params)
+            while True:
+                batch = cur.fetchmany(fetch)
+                if not batch:
+                    return
+                yield from batch
+        finally:
+            conn.close()
+
+    paths = [p.path for p in reversed(partitions.overlapping(db_file, since, until))] + [db_file]
+    return heapq.merge(*(rows(p) for p in paths if os.path.exists(p)), key=key)
+
+# Derived tables maintained by the writer inside each batch transaction
+register_batch_hook(rollups.apply_range)
+register_batch_hook(search.index_range)
+
+# Writes go through the shared write-behind queue (see writer.py); call
+# get_writer(DB_FILE).flush() when a caller needs to read its own writes.
 def add_session(session_id, client_ip, client_port, start_ts, r_dns='', country='', asn=''):
-    conn = sqlite3.connect(DB_FILE); cur = conn.cursor()
-    cur.execute("INSERT OR REPLACE INTO sessions (id, client_ip, client_port, start_ts, r_dns, country, asn) VALUES (?, ?, ?, ?, ?, ?, ?)", 
-                (session_id, client_ip, client_port, start_ts, r_dns, country, asn))
-    conn.commit(); conn.close()
+    get_writer(DB_FILE).submit("INSERT OR REPLACE INTO sessions (id, client_ip, client_port, start_ts, r_dns, country, asn, start_epoch) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               (session_id, client_ip, client_port, start_ts, r_dns, country, asn, to_epoch(start_ts)))
 
 def end_session(session_id, end_ts, notes=''):
-    conn = sqlite3.connect(DB_FILE); cur = conn.cursor()
-    cur.execute("UPDATE sessions SET end_ts = ?, notes = ? WHERE id = ?", (end_ts, notes, session_id))
-    conn.commit(); conn.close()
+    get_writer(DB_FILE).submit("UPDATE sessions SET end_ts = ?, end_epoch = ?, notes = ? WHERE id = ?",
+                               (end_ts, to_epoch(end_ts), notes, session_id))
 
 def add_event(session_id, ts, kind, payload, tags='', extra_json=''):
-    conn = sqlite3.connect(DB_FILE); cur = conn.cursor()
-    cur.execute("INSERT INTO events (session_id, ts, kind, payload, tags, extra_json) VALUES (?, ?, ?, ?, ?, ?)", 
-                (session_id, ts, kind, payload, tags, extra_json))
-    conn.commit(); conn.close()
+    try:
+        severity = severity_code(json.loads(extra_json).get('severity')) if extra_json else None
+    except (ValueError, AttributeError):
+        severity = None
+    w, epoch = get_writer(DB_FILE), to_epoch(ts)
+    if payload is None:
+        w.submit("INSERT INTO events (session_id, ts, kind, tags, extra_json, ts_epoch, severity) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                 (session_id, ts, kind, tags, extra_json, epoch, severity))
+        return
+    # the text and verdict go to the payloads table once (see payloads.py)
+    pid = payloads.payload_id(payload)
+    w.submit(payloads.SEEN_SQL, (pid, payload, extra_json or None, severity, tags or None, epoch, epoch, 1))
+    w.submit("INSERT INTO events (session_id, ts, kind, payload_id, tags, ts_epoch, severity) VALUES (?, ?, ?, ?, ?, ?, ?)",
+             (session_id, ts, kind, pid, tags or None, epoch, severity))
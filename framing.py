@@ -0,0 +1,68 @@
+# framing.py - line reassembly for honeypot sessions (no I/O, shared by both server modes)
+
+MAX_LINE = 4096          # longest command kept; the rest of an over-long line is discarded
+IDLE_TIMEOUT = 60.0      # seconds without any data before a session is closed
+SESSION_TIMEOUT = 900.0  # hard cap on a session's total lifetime
+RECV_SIZE = 4096
+
+
+class LineBuffer:
+    """Turns a stream of recv() chunks into complete command lines.
+
+    A command split over several chunks comes out as one line, several
+    pipelined commands in one chunk come out as several lines. Lines end at
+    LF (a trailing CR is dropped). At most max_line bytes are ever buffered:
+    a line that grows past that is emitted truncated and the remainder up to
+    the next newline is thrown away, so a client cannot grow memory by never
+    sending a newline."""
+
+    def __init__(self, max_line=MAX_LINE):
+        self.max_line = max_line
+        self._buf = bytearray()
+        self._discarding = False
+        self.lines = 0
+        self.truncated = 0
+
+    def feed(self, data):
+        """Add a chunk; return the list of lines it completed (bytes)."""
+        out = []
+        start = 0
+        while start < len(data):
+            nl = data.find(b"\n", start)
+            end = len(data) if nl < 0 else nl
+            if not self._discarding:
+                room = self.max_line - len(self._buf)
+                self._buf += data[start:min(end, start + room)]
+                if end - start > room:
+                    # over-long: emit what fits, drop the rest of this line
+                    out.append(self._take())
+                    self.truncated += 1
+                    self._discarding = True
+            if nl < 0:
+                break
+            if self._discarding:
+                self._discarding = False
+            else:
+                out.append(self._take())
+            start = nl + 1
+        self.lines += len(out)
+        return out
+
+    def flush(self):
+        """Whatever is left when the peer closes (a last line without LF)."""
+        if not self._buf:
+            return []
+        self.lines += 1
+        return [self._take()]
+
+    def pending(self):
+        return len(self._buf)
+
+    def _take(self):
+        line = bytes(self._buf)
+        self._buf.clear()
+        return line[:-1] if line.endswith(b"\r") else line
+
+
+def decode_line(line):
+    return line.decode(errors="ignore").strip()
@@ -0,0 +1,162 @@
+# geoip_local.py - offline GeoIP/ASN resolution from a local range file (no network)
+import csv, socket, ipaddress, threading
+from array import array
+from bisect import bisect_right
+
+
+def flag_emoji(country_code):
+    """'US' -> regional-indicator flag; '' for anything that is not two letters."""
+    cc = (country_code or "").strip().upper()
+    if len(cc) != 2 or not cc.isalpha():
+        return ""
+    return chr(0x1F1E6 + ord(cc[0]) - 65) + chr(0x1F1E6 + ord(cc[1]) - 65)
+
+
+def ip_to_int(ip):
+    """Return (version, integer) for an IPv4/IPv6 string, or (None, None).
+    IPv4-mapped IPv6 addresses (::ffff:a.b.c.d) resolve as IPv4."""
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except (OSError, TypeError):
+        pass
+    try:
+        n = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip.split("%", 1)[0]), "big")
+    except (OSError, TypeError, AttributeError):
+        return None, None
+    if n >> 32 == 0xFFFF:
+        return 4, n & 0xFFFFFFFF
+    return 6, n
+
+
+def is_local(ip):
+    """Loopback, RFC 1918, link-local, ULA and other non-routable addresses."""
+    try:
+        addr = ipaddress.ip_address(ip.split("%", 1)[0])
+    except ValueError:
+        return False
+    if addr.version == 6 and addr.ipv4_mapped:
+        addr = addr.ipv4_mapped
+    return addr.is_private or addr.is_loopback or addr.is_link_local
+
+
+class RangeIndex:
+    """Sorted, non-overlapping integer ranges -> (country, asn) records.
+
+    IPv4 ranges live in three parallel `array('I')` columns (start, end, record
+    id), so a million ranges take ~12 MB and a lookup is one C-level bisect.
+    IPv6 starts/ends are 128-bit and kept as plain int lists. Distinct records
+    are interned, so repeated country/ASN pairs are stored once.
+    """
+
+    def __init__(self):
+        self._pending = {4: [], 6: []}
+        self._records = []
+        self._record_ids = {}
+        self.v4_starts, self.v4_ends, self.v4_vals = array("I"), array("I"), array("I")
+        self.v6_starts, self.v6_ends, self.v6_vals = [], [], array("I")
+
+    def __len__(self):
+        return len(self.v4_starts) + len(self.v6_starts)
+
+    # ---------------- building ----------------
+    def add(self, start, end, country="", asn="", country_code="", version=None):
+        """Queue one inclusive range; start/end are IP strings, or integers
+        with an explicit version (4 or 6)."""
+        if isinstance(start, str):
+            version, start = ip_to_int(start)
+            _, end = ip_to_int(end)
+        if version not in (4, 6) or end is None or end < start:
+            return
+        display = f"{flag_emoji(country_code)} {country}".strip() if country else "Unknown"
+        key = (display, asn or "Unknown")
+        rid = self._record_ids.get(key)
+        if rid is None:
+            rid = self._record_ids[key] = len(self._records)
+            self._records.append({"country": key[0], "asn": key[1]})
+        self._pending[version].append((start, end, rid))
+
+    def add_network(self, cidr, **fields):
+        net = ipaddress.ip_network(cidr, strict=False)
+        self.add(int(net.network_address), int(net.broadcast_address), version=net.version, **fields)
+
+    def finalize(self):
+        """Sort queued ranges into the lookup columns. Call once after loading."""
+        for version, rows in self._pending.items():
+            if not rows:
+                continue
+            if version == 4:
+                rows.extend(zip(self.v4_starts, self.v4_ends, self.v4_vals))
+                rows.sort()
+                self.v4_starts = array("I", (r[0] for r in rows))
+                self.v4_ends = array("I", (r[1] for r in rows))
+                self.v4_vals = array("I", (r[2] for r in rows))
+            else:
+                rows.extend(zip(self.v6_starts, self.v6_ends, self.v6_vals))
+                rows.sort()
+                self.v6_starts = [r[0] for r in rows]
+                self.v6_ends = [r[1] for r in rows]
+                self.v6_vals = array("I", (r[2] for r in rows))
+        self._pending = {4: [], 6: []}
+        return self
+
+    @classmethod
+    def from_csv(cls, path):
+        """Load a range file. Each row needs either a `network` (CIDR) column or
+        `start_ip`/`end_ip` columns, plus any of `country_code`, `country`
+        (or `country_name`) and `asn` (or MaxMind-style
+        `autonomous_system_number`/`autonomous_system_organization`)."""
+        index = cls()
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                asn = row.get("asn")
+                if not asn and row.get("autonomous_system_number"):
+                    asn = f"AS{row['autonomous_system_number']} {row.get('autonomous_system_organization', '')}".strip()
+                fields = {
+                    "country": row.get("country") or row.get("country_name") or "",
+                    "country_code": row.get("country_code") or row.get("country_iso_code") or "",
+                    "asn": asn or "",
+                }
+                try:
+                    if row.get("network"):
+                        index.add_network(row["network"], **fields)
+                    else:
+                        index.add(row["start_ip"], row["end_ip"], **fields)
+                except (KeyError, ValueError):
+                    continue
+        return index.finalize()
+
+    # ---------------- lookup ----------------
+    def lookup(self, ip):
+        """Return the {"country", "asn"} record covering ip, or None."""
+        version, n = ip_to_int(ip)
+        if version == 4:
+            starts, ends, vals = self.v4_starts, self.v4_ends, self.v4_vals
+        elif version == 6:
+            starts, ends, vals = self.v6_starts, self.v6_ends, self.v6_vals
+        else:
+            return None
+        i = bisect_right(starts, n) - 1
+        if i >= 0 and n <= ends[i]:
+            return self._records[vals[i]]
+        return None
+
+
+# ---------------- process-wide resolver ----------------
+_index = None
+_index_path = None
+_index_lock = threading.Lock()
+
+def get_index(path):
+    """Load path once (empty index if the file is missing) and reuse it."""
+    global _index, _index_path
+    if _index is not None and _index_path == path:
+        return _index
+    with _index_lock:
+        if _index is None or _index_path != path:
+            try:
+                _index = RangeIndex.from_csv(path)
+                print(f"[*] GeoIP ranges loaded from {path}: {len(_index)} ranges")
+            except OSError:
+                _index = RangeIndex()
+            _index_path = path
+        return _index
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+loadgen.py
+
+End-to-end load generator for the honeypot listener.
+
+Opens many concurrent sessions, each of which waits for the banner and sends
+a few commands drawn from simulate_attacks.PAYLOADS in a configurable
+severity mix, waiting for the OK after each one. Reports connections/sec,
+p50/p99 banner and OK latency, errors, and how many events per second
+actually reached the database, and writes everything as JSON so runs can be
+compared across releases.
+
+By default it starts its own honeypot (main.py) in a scratch directory, with
+admission limits lifted, and optionally mock_ai_api.py as the analyzer; use
+--external to load a server that is already running.
+
+Usage:
+    python loadgen.py                                   # local rules, async server
+    python loadgen.py --analyzer remote --unique        # through mock_ai_api.py, no verdict-cache hits
+    python loadgen.py --server-mode threaded --sessions 5000 --concurrency 1000 --out run.json
+    python loadgen.py --external --port 2229 --db hp_events.db
+"""
+import argparse, asyncio, json, os, platform, random, re, signal, socket, sqlite3, subprocess, sys, tempfile, threading, time
+from simulate_attacks import PAYLOADS
+
+BASE = os.path.dirname(os.path.abspath(__file__))
+CONNECT_TIMEOUT = 10.0
+READ_TIMEOUT = 30.0
+DEFAULT_MIX = "low=60,high=30,critical=10"
+DB_SAMPLE_INTERVAL = 0.5
+DB_SETTLE = 10.0        # seconds to wait after the run for queued rows to land
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        sev, _, weight = part.partition("=")
+        if sev.strip() not in PAYLOADS:
+            raise SystemExit(f"unknown severity {sev!r} in --mix (have {', '.join(PAYLOADS)})")
+        mix[sev.strip()] = float(weight or 1)
+    return mix
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def summarize(values):
+    ms = [round(v * 1000, 3) for v in values]
+    return {"count": len(ms), "p50_ms": percentile(ms, 50), "p99_ms": percentile(ms, 99),
+            "max_ms": max(ms) if ms else None}
+
+def raise_fd_limit():
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY or soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+# ==============================================
+# Client side
+# ==============================================
+class Stats:
+    def __init__(self):
+        self.connected = 0
+        self.completed = 0
+        self.commands = 0
+        self.errors = {}
+        self.banner = []
+        self.ok = []
+
+    def error(self, kind):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+async def session(host, port, commands, think, stats):
+    t0 = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), CONNECT_TIMEOUT)
+    except (OSError, asyncio.TimeoutError) as e:
+        stats.error(f"connect: {type(e).__name__}")
+        return
+    stats.connected += 1
+    try:
+        await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+        stats.banner.append(time.perf_counter() - t0)
+        for cmd in commands:
+            sent = time.perf_counter()
+            writer.write(cmd.encode() + b"\n")
+            await writer.drain()
+            reply = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+            if not reply:
+                stats.error("closed by server")
+                return
+            stats.ok.append(time.perf_counter() - sent)
+            stats.commands += 1
+            if think:
+                await asyncio.sleep(think)
+        stats.completed += 1
+    except asyncio.TimeoutError:
+        stats.error("read timeout")
+    except OSError as e:
+        stats.error(type(e).__name__)
+    finally:
+        writer.close()
+
+def make_commands(rnd, mix, n, unique):
+    sevs, weights = list(mix), list(mix.values())
+    cmds = [rnd.choice(PAYLOADS[rnd.choices(sevs, weights)[0]]) for _ in range(n)]
+    if unique:
+        # hex words survive utils.normalize_payload, so every command misses the verdict cache
+        cmds = [f"{c} # {rnd.getrandbits(48):012x}" for c in cmds]
+    return cmds
+
+async def run_clients(host, port, sessions, concurrency, commands, mix, think, unique, seed):
+    rnd = random.Random(seed)
+    stats = Stats()
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with gate:
+            await session(host, port, make_commands(rnd, mix, commands, unique), think, stats)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(sessions)))
+    return stats, time.perf_counter() - t0
+
+# ==============================================
+# Server side
+# ==============================================
+def wait_for_line(path, needle, timeout, proc):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            break
+        try:
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                for line in f:
+                    if needle in line:
+                        return line
+        except OSError:
+            pass
+        time.sleep(0.1)
+    return None
+
+def port_open(host, port):
+    try:
+        socket.create_connection((host, port), timeout=0.5).close()
+        return True
+    except OSError:
+        return False
+
+def start_analyzer(workdir):
+    """Start mock_ai_api.py unless something already listens on its port."""
+    if port_open("127.0.0.1", 9000):
+        print("[*] Using the analyzer already running on :9000")
+        return None
+    log = open(os.path.join(workdir, "mock_ai_api.log"), "w")
+    proc = subprocess.Popen([sys.executable, os.path.join(BASE, "mock_ai_api.py")], cwd=workdir,
+                            stdout=log, stderr=subprocess.STDOUT)
+    for _ in range(100):
+        if port_open("127.0.0.1", 9000):
+            return proc
+        time.sleep(0.1)
+    proc.terminate()
+    raise SystemExit("[X] mock_ai_api.py did not start")
+
+def start_server(workdir, port, mode, analyzer, workers):
+    """main.py in workdir (its DB and caches land there) with limits lifted."""
+    log_path = os.path.join(workdir, "honeypot.log")
+    cmd = [sys.executable, os.path.join(BASE, "main.py"), "--port", str(port), "--analyzer", analyzer,
+           "--no-geoip-http", "--transcripts", os.path.join(workdir, "transcripts"),
+           "--ip-rate", "1e9", "--prefix-rate", "1e9", "--events-per-sec", "1e9", "--max-sessions", "1000000"]
+    if workers:
+        cmd += ["--workers", str(workers), "--ports", str(port)]
+    else:
+        cmd += ["--mode", mode]
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen(cmd, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+    line = wait_for_line(log_path, "Honeypot active", 30, proc)
+    if line is None:
+        proc.terminate()
+        raise SystemExit(f"[X] Honeypot did not start, see {log_path}")
+    bound = int(re.search(r":(\d+)", line).group(1))
+    return proc, bound, os.path.join(workdir, "hp_events.db")
+
+def stop(proc):
+    if proc is None or proc.poll() is not None:
+        return
+    proc.send_signal(signal.SIGINT)  # let the honeypot flush its writer
+    try:
+        proc.wait(15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+class DBSampler:
+    """Counts events in the database while the load runs."""
+
+    def __init__(self, db_file, interval=DB_SAMPLE_INTERVAL):
+        self.db_file = db_file
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self.baseline = self.count()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def count(self):
+        if not self.db_file or not os.path.exists(self.db_file):
+            return 0
+        conn = sqlite3.connect(self.db_file, timeout=5)
+        try:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        except sqlite3.Error:
+            return 0
+        finally:
+            conn.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.samples.append((time.perf_counter(), self.count() - self.baseline))
+
+    def start(self):
+        self.t0 = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def finish(self, expected):
+        """Wait (up to DB_SETTLE s) for expected rows; returns (rows, seconds
+        from start until the last row was seen)."""
+        deadline = time.perf_counter() + DB_SETTLE
+        while time.perf_counter() < deadline:
+            if self.count() - self.baseline >= expected:
+                break
+            time.sleep(self.interval)
+        self._stop.set()
+        self._thread.join()
+        rows = self.count() - self.baseline
+        last = next((t for t, n in self.samples if n >= rows), time.perf_counter())
+        return rows, last - self.t0
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+# ==============================================
+# Main
+# ==============================================
+def main(args):
+    raise_fd_limit()
+    mix = parse_mix(args.mix)
+    workdir = tempfile.mkdtemp(prefix="hp-load-")
+    server = analyzer = None
+    try:
+        if args.external:
+            port, db_file = args.port, args.db
+        else:
+            if args.analyzer == "remote":
+                analyzer = start_analyzer(workdir)
+            server, port, db_file = start_server(workdir, args.port, args.server_mode, args.analyzer, args.workers)
+            print(f"[*] Honeypot ({args.server_mode}, analyzer={args.analyzer}) on port {port}, scratch dir {workdir}")
+
+        sampler = DBSampler(db_file).start()
+        print(f"[*] {args.sessions} sessions x {args.commands} commands, concurrency {args.concurrency}, mix {args.mix}")
+        stats, elapsed = asyncio.run(run_clients(args.host, port, args.sessions, args.concurrency, args.commands,
+                                                 mix, args.think / 1000, args.unique, args.seed))
+        rows, db_elapsed = sampler.finish(stats.commands) if db_file else (None, None)
+    finally:
+        stop(server)
+        stop(analyzer)
+
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "revision": git_revision(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": {"server": "external" if args.external else args.server_mode, "workers": args.workers,
+                   "analyzer": None if args.external else args.analyzer, "sessions": args.sessions,
+                   "concurrency": args.concurrency, "commands_per_session": args.commands, "mix": mix,
+                   "think_ms": args.think, "unique": args.unique},
+        "elapsed_s": round(elapsed, 3),
+        "connections": stats.connected,
+        "connections_per_s": round(stats.connected / elapsed, 1),
+        "sessions_completed": stats.completed,
+        "commands_acked": stats.commands,
+        "commands_per_s": round(stats.commands / elapsed, 1),
+        "errors": stats.errors,
+        "banner_latency": summarize(stats.banner),
+        "ok_latency": summarize(stats.ok),
+        "db_events": rows,
+        "db_events_per_s": round(rows / db_elapsed, 1) if rows and db_elapsed else None,
+    }
+    print(f"[+] {result['connections_per_s']:,} conn/s, {result['commands_per_s']:,} cmd/s acked, "
+          f"{result['db_events_per_s']} events/s in DB ({rows} of {stats.commands} rows)")
+    print(f"    banner p50/p99 {result['banner_latency']['p50_ms']}/{result['banner_latency']['p99_ms']} ms, "
+          f"OK p50/p99 {result['ok_latency']['p50_ms']}/{result['ok_latency']['p99_ms']} ms, errors {stats.errors or 0}")
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+        print(f"[+] Results written to {args.out}")
+    else:
+        print(text)
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent load generator and end-to-end benchmark")
+    parser.add_argument("--sessions", type=int, default=2000, help="sessions to open in total")
+    parser.add_argument("--concurrency", type=int, default=500, help="sessions open at once")
+    parser.add_argument("--commands", type=int, default=5, help="commands per session")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="severity weights for PAYLOADS (default: %(default)s)")
+    parser.add_argument("--think", type=float, default=0, help="milliseconds between a session's commands")
+    parser.add_argument("--unique", action="store_true", help="make every command distinct (defeats the verdict cache)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the command mix")
+    parser.add_argument("--analyzer", choices=["local", "remote"], default="local",
+                        help="local rules, or mock_ai_api.py (started if not running)")
+    parser.add_argument("--server-mode", choices=["async", "threaded"], default="async", help="honeypot --mode")
+    parser.add_argument("--workers", type=int, default=0, help="honeypot --workers (multi-process listener)")
+    parser.add_argument("--external", action="store_true", help="load an already running honeypot instead")
+    parser.add_argument("--host", default="127.0.0.1", help="honeypot host (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=2229, help="honeypot port (default: %(default)s)")
+    parser.add_argument("--db", help="with --external: its database, to count the events that land")
+    parser.add_argument("--out", help="write the JSON result here instead of stdout")
+    main(parser.parse_args())
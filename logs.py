@@ -0,0 +1,62 @@
+# logs.py - structured, rate-limited console logging for per-connection and per-event lines
+import sys, json, time, threading
+from admission import TokenBucket
+import metrics
+
+LOG_FORMAT = "text"   # "text" (the usual [LOG]/[*] lines) or "json" (one object per line)
+LOG_RATE = 20.0       # lines per second per kind before lines are suppressed (0 = no limit)
+LOG_BURST = 100
+FORMATS = ("text", "json")
+PREFIXES = {"event": "[LOG]", "info": "[*]", "ok": "[+]", "end": "[-]", "warn": "[!]", "error": "[X]"}
+
+SUPPRESSED = metrics.Counter("hp_log_lines_suppressed_total", "Log lines dropped by the rate limit", ["kind"])
+
+
+class Log:
+    """Writes one line per call, limited per kind (e.g. "event", "connect"),
+    so a flood of commands costs a token-bucket check instead of a terminal
+    write each. When a kind is allowed through again, a note says how many
+    of its lines were skipped."""
+
+    def __init__(self, fmt=LOG_FORMAT, rate=LOG_RATE, burst=LOG_BURST, stream=None):
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown log format {fmt!r}, expected one of {FORMATS}")
+        self.fmt = fmt
+        self.rate, self.burst = rate, burst
+        self.stream = stream
+        self._buckets = {}
+        self._suppressed = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, kind, msg, level="info", **fields):
+        if self.rate > 0:
+            with self._lock:
+                bucket = self._buckets.get(kind)
+                if bucket is None:
+                    bucket = self._buckets[kind] = TokenBucket(self.rate, self.burst)
+                if not bucket.take():
+                    self._suppressed[kind] = self._suppressed.get(kind, 0) + 1
+                    SUPPRESSED.labels(kind).inc()
+                    return False
+                skipped = self._suppressed.pop(kind, 0)
+            if skipped:
+                self._write("suppressed", f"{skipped} {kind} lines suppressed", "warn", {"count": skipped})
+        self._write(kind, msg, level, fields)
+        return True
+
+    def _write(self, kind, msg, level, fields):
+        if self.fmt == "json":
+            line = json.dumps({"ts": round(time.time(), 3), "level": level, "kind": kind, "msg": msg, **fields},
+                              default=str)
+        else:
+            line = f"{PREFIXES.get(level, '[*]')} {msg}"
+        (self.stream or sys.stdout).write(line + "\n")
+
+
+log = Log()
+
+def configure(fmt=LOG_FORMAT, rate=LOG_RATE, burst=LOG_BURST):
+    """Replace the process-wide logger (from the command line)."""
+    global log
+    log = Log(fmt, rate, burst)
+    return log
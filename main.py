@@ -5,82 +5,128 @@ import socket
 import threading
 import sqlite3
 import time
-import json
 import os
 import errno
+import argparse
+import asyncio
+import signal
+import sys
+import multiprocessing
 import requests
-import sqlite3, json, time, uuid, os
-from utils import analyze_event
+import sqlite3, time, uuid, os
+import utils
+from utils import analyze_event, analyze_event_async
+from cache import open_store
+from geoip_local import get_index, is_local, flag_emoji
+from writer import get_writer, shutdown_writers, use_remote_writer, serve_remote, POLICIES, QUEUE_POLICY
+from db import ensure_schema, severity_code
+import db
+from framing import LineBuffer, decode_line, MAX_LINE, IDLE_TIMEOUT, SESSION_TIMEOUT, RECV_SIZE
+import admission
+import transcripts
+from transcripts import Transcript
+from admission import Admission, prefix_of, TARPIT_SECONDS, TARPIT_INTERVAL
+import metrics
+import logs
+import alerts
+import partitions
+import campaigns
+import ring
+import payloads
 
 DB_FILE = os.path.join(os.path.dirname(__file__), 'hp_events.db')
 
 def save_event(session_id, payload):
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cur = conn.cursor()
-        ts = time.strftime("%Y-%m-%d %H:%M:%S")
+        now = time.time()
+        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
         analysis = analyze_event(payload)
-        extra_json = json.dumps(analysis)
-        cur.execute("INSERT INTO events (session_id, ts, payload, extra_json) VALUES (?, ?, ?, ?)",
-                    (session_id, ts, payload, extra_json))
-        conn.commit()
-        conn.close()
+        # the text and verdict go to the payloads table once (see payloads.py)
+        pid = payloads.payload_id(payload)
+        w = get_writer(DB_FILE)
+        w.submit(payloads.NEW_SQL if cacheable(analysis) else payloads.SEEN_SQL,
+                 payloads.row(pid, payload, analysis, int(now), int(now)))
+        w.submit("INSERT INTO events (session_id, ts, payload_id, ts_epoch, severity) VALUES (?, ?, ?, ?, ?)",
+                 (session_id, ts, pid, int(now), severity_code(analysis.get("severity"))))
     except Exception as e:
         print(f"[DB ERROR] {e}")
 
 def create_session(client_ip, client_port):
     sid = str(uuid.uuid4())
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    ts = time.strftime("%Y-%m-%d %H:%M:%S")
-    cur.execute("INSERT INTO sessions (id, client_ip, client_port, start_ts) VALUES (?, ?, ?, ?)",
-                (sid, client_ip, client_port, ts))
-    conn.commit()
-    conn.close()
+    now = time.time()
+    ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+    get_writer(DB_FILE).submit("INSERT INTO sessions (id, client_ip, client_port, start_ts, start_epoch) VALUES (?, ?, ?, ?, ?)",
+                               (sid, client_ip, client_port, ts, int(now)))
     return sid
 
 
-GEO_CACHE_FILE = "geoip_cache.json"
+GEO_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "geoip_cache.jsonl")  # append-only store, see cache.py
+GEO_LEGACY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "geoip_cache.json")  # imported once if the store is new
+GEO_CACHE_SIZE = 100000
+GEO_TTL = 7 * 86400                      # successful lookups
+GEO_NEGATIVE_TTL = 3600                  # failed lookups, retried after an hour
 
-def geoip_lookup(ip: str):
-    """Fetch GeoIP info for an IP and cache results."""
-    if os.path.exists(GEO_CACHE_FILE):
-        try:
-            with open(GEO_CACHE_FILE, "r") as f:
-                cache = json.load(f)
-        except Exception:
-            cache = {}
-    else:
-        cache = {}
+_geo_cache = open_store(GEO_CACHE_FILE, legacy_json=GEO_LEGACY_FILE,
+                        maxsize=GEO_CACHE_SIZE, ttl=GEO_TTL)
 
-    if ip in cache:
-        return cache[ip]
+GEOIP_DB_FILE = "geoip_ranges.csv"       # local range table, see geoip_local.py
+GEOIP_HTTP_FALLBACK = True               # ask ip-api.com when the local table has no answer
 
+def _geoip_fetch(ip: str):
     data = {"country": "Unknown", "asn": "Unknown"}
     try:
-        if ip.startswith("127.") or ip.startswith("192.168.") or ip.startswith("10."):
-            data = {"country": "Local", "asn": "Private Network"}
-        else:
-            r = requests.get(f"http://ip-api.com/json/{ip}?fields=status,country,countryCode,as,query", timeout=2)
-            if r.status_code == 200:
-                j = r.json()
-                if j.get("status") == "success":
-                    flag = j.get("countryCode", "")
-                    emoji = f"🇺🇸" if flag == "US" else f"🇮🇳" if flag == "IN" else ""
-                    data = {"country": f"{emoji} {j.get('country','')}", "asn": j.get("as", "")}
+        r = requests.get(f"http://ip-api.com/json/{ip}?fields=status,country,countryCode,as,query", timeout=2)
+        if r.status_code == 200:
+            j = r.json()
+            if j.get("status") == "success":
+                data = {"country": f"{flag_emoji(j.get('countryCode', ''))} {j.get('country','')}".strip(),
+                        "asn": j.get("as", "")}
     except Exception as e:
-        print(f"[!] GeoIP lookup failed for {ip}: {e}")
+        logs.log("geoip_error", f"GeoIP lookup failed for {ip}: {e}", "warn", ip=ip, error=str(e))
+    return data
 
-    cache[ip] = data
-    with open(GEO_CACHE_FILE, "w") as f:
-        json.dump(cache, f, indent=2)
+def _geo_ttl(data):
+    return GEO_NEGATIVE_TTL if data.get("country") == "Unknown" else GEO_TTL
 
-    return data
+GEOIP_SECONDS = metrics.Histogram("hp_geoip_lookup_seconds", "GeoIP lookups by where the answer came from", ["source"])
+
+def geoip_lookup(ip: str):
+    """Resolve an IP to country/ASN: private ranges and the local range table
+    answer in microseconds; only misses go to the (cached, coalesced) HTTP
+    enrichment fallback, if enabled."""
+    t0 = time.perf_counter()
+    if is_local(ip):
+        source, geo = "private", {"country": "Local", "asn": "Private Network"}
+    else:
+        source, geo = "table", get_index(GEOIP_DB_FILE).lookup(ip)
+        if geo is None and GEOIP_HTTP_FALLBACK:
+            source, geo = "http", _geo_cache.get_or_load(ip, _geoip_fetch, ttl_for=_geo_ttl)
+        elif geo is None:
+            source, geo = "none", {"country": "Unknown", "asn": "Unknown"}
+    GEOIP_SECONDS.labels(source).observe(time.perf_counter() - t0)
+    return geo
 
 
 DB_FILE = "hp_events.db"
 HOST = "0.0.0.0"
 PORT = 2229  # Default honeypot port
+BACKLOG = 1024  # listen() backlog; the kernel caps this at net.core.somaxconn
+SERVER_MODE = "async"  # "async" (event loop) or "threaded" (thread per connection)
+BANNER = b"Welcome to Secure SSH Server v7.4\r\n"
+db.DB_FILE = DB_FILE  # db.end_session and friends write to the listener's database
+ADMISSION = Admission()  # replaced from the command line in __main__
+KNOWN_PAYLOADS = payloads.PayloadCache()  # verdicts of payloads already classified, see payloads.py
+
+# ==============================================
+# Metrics (GET /metrics on --metrics-port, see metrics.py)
+# ==============================================
+CONNECTIONS = metrics.Counter("hp_connections_total", "Incoming connections by admission result", ["result"])
+SESSIONS_CLOSED = metrics.Counter("hp_sessions_closed_total", "Finished sessions by reason", ["reason"])
+EVENTS_LOGGED = metrics.Counter("hp_events_total", "Commands logged, by severity", ["severity"])
+ACCEPT_TO_BANNER = metrics.Histogram("hp_accept_to_banner_seconds", "From accepting a connection to its banner being sent")
+metrics.Gauge("hp_active_sessions", "Admitted sessions in progress", fn=lambda: ADMISSION.active)
+metrics.Gauge("hp_tarpits", "Connections held in a tarpit", fn=lambda: ADMISSION.tarpits)
+metrics.Gauge("hp_threads", "Live threads in this process", fn=threading.active_count)
 
 # ==============================================
 # Ensure DB exists
@@ -98,7 +144,9 @@ def init_db():
             r_dns TEXT,
             country TEXT,
             asn TEXT,
-            notes TEXT
+            notes TEXT,
+            start_epoch INTEGER,
+            end_epoch INTEGER
         )
     """)
     cur.execute("""
@@ -109,9 +157,12 @@ def init_db():
             kind TEXT,
             payload TEXT,
             tags TEXT,
-            extra_json TEXT
+            extra_json TEXT,
+            ts_epoch INTEGER,
+            severity INTEGER
         )
     """)
+    ensure_schema(conn)
     conn.commit()
     conn.close()
 
@@ -120,105 +171,328 @@ init_db()
 # ==============================================
 # Event Logger (handles all severities)
 # ==============================================
-def log_event(session_id, kind, payload, tags=""):
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-
-    # Always assign a default severity
-    severity = "low"
-
-    # Escalate severity based on content
-    payload_l = payload.lower()
-    if any(x in payload_l for x in ["rm -rf", "wget", "curl http", "chmod 777", "python -c"]):
-        severity = "critical"
-    elif any(x in payload_l for x in ["sudo", "nmap", "nc ", "bash", "cat /etc/passwd"]):
-        severity = "high"
-
-    ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-
-    cur.execute(
-        "INSERT INTO events (session_id, ts, kind, payload, tags, extra_json) VALUES (?, ?, ?, ?, ?, ?)",
-        (session_id, ts, kind, payload, tags, json.dumps({"severity": severity}))
-    )
-
-    conn.commit()
-    conn.close()
-
-    print(f"[LOG] {session_id} | {severity.upper()} | {payload}")
+def cacheable(verdict):
+    """Whether a verdict may stand for its payload from now on: not one the
+    local rules gave only because the analyzer was unreachable."""
+    return verdict.get("source") == "analyzer" or utils.ANALYZER_MODE == "local"
+
+def known_verdict(payload):
+    return KNOWN_PAYLOADS.get(payloads.payload_id(payload))
+
+def log_event(session_id, kind, payload, tags="", verdict=None, client_ip="", client_port=0, country="", block=True):
+    """Store, publish and alert on one event. Pass block=False from the event
+    loop: a full write queue then drops the rows instead of stalling every
+    session for up to writer.BLOCK_TIMEOUT."""
+    # A payload seen before keeps its verdict and is stored once (see payloads.py)
+    pid = payloads.payload_id(payload)
+    known = KNOWN_PAYLOADS.get(pid)
+    if verdict is None:
+        # Analyzer verdict (pooled/batched, local rules when it is down or disabled)
+        verdict = known or analyze_event(payload)
+    severity = verdict["severity"]
+
+    now = time.time()
+    ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now))
+
+    # Queued for the writer thread; the handler never waits on a commit.
+    # The payloads row is queued again until the cache has seen it stored.
+    w = get_writer(DB_FILE)
+    if known is None or not KNOWN_PAYLOADS.seen(pid, int(now)):
+        keep = cacheable(verdict)
+        w.submit(payloads.NEW_SQL if keep else payloads.SEEN_SQL,
+                 payloads.row(pid, payload, verdict, int(now), int(now)), block)
+        KNOWN_PAYLOADS.add(pid, payload, verdict, int(now), cache=keep)
+    w.submit("INSERT INTO events (session_id, ts, kind, payload_id, tags, ts_epoch, severity) VALUES (?, ?, ?, ?, ?, ?, ?)",
+             (session_id, ts, kind, pid, tags or None, int(now), severity_code(severity)), block)
+    # and at once to the dashboard's live view, through shared memory (see ring.py)
+    ring.publish(session_id, client_ip, client_port, country, payload, severity_code(severity), now)
+    EVENTS_LOGGED.labels(severity).inc()
+    if severity in alerts.ALERT_SEVERITIES:
+        # queued for the alert stage (dedup + delivery happen off this path)
+        alerts.on_alert(session_id, severity, payload, client_ip=client_ip, rule=",".join(sorted(verdict["tags"])))
+    logs.log("event", f"{session_id} | {severity.upper()} | {payload}", "event",
+             session=session_id, severity=severity, payload=payload)
 
 # ==============================================
-# Handle individual client connections
+# Session registration (shared by both server modes)
 # ==============================================
-def handle_client(conn, addr):
-    client_ip, client_port = addr
-    session_id = f"{client_ip}-{client_port}-{int(time.time())}"
-    print(f"[*] Connection from {client_ip}:{client_port}")
-
-    # Register session
+def register_session(session_id, client_ip, client_port):
     # Lookup GeoIP info
     geo = geoip_lookup(client_ip)
     country = geo.get("country", "Unknown")
     asn = geo.get("asn", "Unknown")
 
     # Register session with GeoIP data
-    conn_db = sqlite3.connect(DB_FILE)
-    cur = conn_db.cursor()
-    cur.execute("INSERT OR REPLACE INTO sessions (id, client_ip, client_port, start_ts, country, asn) VALUES (?,?,?,?,?,?)",(session_id, client_ip, client_port, time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), country, asn))
+    now = time.time()
+    get_writer(DB_FILE).submit("INSERT OR REPLACE INTO sessions (id, client_ip, client_port, start_ts, country, asn, start_epoch) VALUES (?,?,?,?,?,?,?)",(session_id, client_ip, client_port, time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now)), country, asn, int(now)))
+    return country
+
+def close_session(session_id, reason, lines, transcript):
+    """Record why and when a session ended (fills sessions.end_ts/end_epoch)
+    and append its transcript to the segment store."""
+    notes = f"{reason}; lines={lines.lines} truncated={lines.truncated}"
+    SESSIONS_CLOSED.labels(reason.split(":")[0]).inc()
+    db.end_session(session_id, time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), notes)
+    transcript.note(reason)
+    try:
+        transcripts.save(transcript, get_writer(DB_FILE).submit)
+    except Exception as e:
+        print(f"[!] Could not store transcript for {session_id}: {e}")
+
+def next_timeout(started):
+    """Seconds the next read may wait: the idle timeout, capped by what is
+    left of the session's total lifetime (<= 0 once that is used up)."""
+    return min(IDLE_TIMEOUT, SESSION_TIMEOUT - (time.monotonic() - started))
+
+def pace_event(events, prefix):
+    """Per-session command rate. Returns (log_it, delay): under the "reject"
+    policy commands over the limit are dropped, under "tarpit" they are
+    logged but the session is stalled until its bucket catches up."""
+    if events.take():
+        return True, 0.0
+    if ADMISSION.policy == "tarpit":
+        ADMISSION.count("event_delayed", prefix)
+        return True, events.reserve()
+    ADMISSION.count("event_dropped", prefix)
+    return False, 0.0
+
+# ==============================================
+# Admission refusals
+# ==============================================
+def refuse(conn, client_ip):
+    """Threaded mode: tarpit (own thread, bounded by MAX_TARPITS) or reset."""
+    if ADMISSION.try_tarpit():
+        threading.Thread(target=tarpit, args=(conn, client_ip), daemon=True).start()
+        return
+    try:
+        # RST instead of FIN: no TIME_WAIT left behind on our side
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, b"\x01\x00\x00\x00\x00\x00\x00\x00")
+    except OSError:
+        pass
+    conn.close()
 
-    conn_db.commit()
-    conn_db.close()
+def tarpit(conn, client_ip):
+    """Hold the connection open, trickling the banner a byte at a time and
+    never reading, so a scanner wastes its time rather than ours."""
+    ADMISSION.count("tarpit", prefix_of(client_ip))
+    try:
+        deadline = time.monotonic() + TARPIT_SECONDS
+        for b in BANNER:
+            if time.monotonic() >= deadline:
+                break
+            conn.sendall(bytes([b]))
+            time.sleep(TARPIT_INTERVAL)
+    except OSError:
+        pass
+    finally:
+        conn.close()
+        ADMISSION.end_tarpit()
 
+async def refuse_async(writer, client_ip):
+    if not ADMISSION.try_tarpit():
+        writer.transport.abort()
+        return
+    ADMISSION.count("tarpit", prefix_of(client_ip))
     try:
-        conn.sendall(b"Welcome to Secure SSH Server v7.4\r\n")
+        deadline = time.monotonic() + TARPIT_SECONDS
+        for b in BANNER:
+            if time.monotonic() >= deadline:
+                break
+            writer.write(bytes([b]))
+            await writer.drain()
+            await asyncio.sleep(TARPIT_INTERVAL)
+    except OSError:
+        pass
+    finally:
+        writer.close()
+        ADMISSION.end_tarpit()
+
+# ==============================================
+# Handle individual client connections (threaded mode)
+# ==============================================
+def handle_client(conn, addr, accepted=None):
+    """Serve one admitted connection; releases its admission slot on exit."""
+    accepted = accepted or time.perf_counter()
+    client_ip, client_port = addr[:2]
+    session_id = f"{client_ip}-{client_port}-{int(time.time())}"
+    logs.log("connect", f"Connection from {client_ip}:{client_port}", ip=client_ip, port=client_port, session=session_id)
+    lines = LineBuffer(MAX_LINE)
+    events, prefix = ADMISSION.event_bucket(), prefix_of(client_ip)
+    started = time.monotonic()
+    reason = "closed by client"
+    transcript = Transcript(session_id)
+
+    try:
+        conn.sendall(BANNER)
+        ACCEPT_TO_BANNER.observe(time.perf_counter() - accepted)
+        transcript.send(BANNER)
+        country = register_session(session_id, client_ip, client_port)
         while True:
-            data = conn.recv(1024)
-            if not data:
+            timeout = next_timeout(started)
+            if timeout <= 0:
+                reason = "session timeout"
+                break
+            conn.settimeout(timeout)
+            try:
+                data = conn.recv(RECV_SIZE)
+            except socket.timeout:
+                reason = "session timeout" if next_timeout(started) <= 0 else "idle timeout"
                 break
-            payload = data.decode(errors="ignore").strip()
-            if payload:
-                log_event(session_id, "recv", payload)
+            if data:
+                transcript.recv(data)
+            complete = lines.feed(data) if data else lines.flush()
+            for line in complete:
+                payload = decode_line(line)
+                if not payload:
+                    continue
+                log_it, delay = pace_event(events, prefix)
+                if delay:
+                    time.sleep(delay)
+                if log_it:
+                    log_event(session_id, "recv", payload, client_ip=client_ip, client_port=client_port, country=country)
                 conn.sendall(b"OK\r\n")
+                transcript.send(b"OK\r\n")
+            if not data:
+                break
+    except ConnectionResetError:
+        reason = "reset by peer"
     except Exception as e:
-        print(f"[!] Error handling client {addr}: {e}")
+        reason = f"error: {e}"
+        logs.log("error", f"Error handling client {addr}: {e}", "warn", session=session_id, error=str(e))
     finally:
         conn.close()
-        print(f"[-] Disconnected {client_ip}:{client_port}")
+        ADMISSION.release()
+        close_session(session_id, reason, lines, transcript)
+        logs.log("disconnect", f"Disconnected {client_ip}:{client_port} ({reason})", "end",
+                 session=session_id, reason=reason)
+
+# ==============================================
+# Handle individual client connections (async mode)
+# ==============================================
+async def handle_client_async(reader, writer):
+    """Event-loop twin of handle_client; an idle session costs a socket and a
+    coroutine instead of a thread. Blocking GeoIP/SQLite work is pushed to
+    the loop's default executor so it never stalls other sessions."""
+    accepted = time.perf_counter()
+    addr = writer.get_extra_info("peername")
+    client_ip, client_port = addr[:2]
+    admitted, reason = ADMISSION.admit(client_ip)
+    CONNECTIONS.labels(reason or "admitted").inc()
+    if not admitted:
+        await refuse_async(writer, client_ip)
+        return
+    session_id = f"{client_ip}-{client_port}-{int(time.time())}"
+    logs.log("connect", f"Connection from {client_ip}:{client_port}", ip=client_ip, port=client_port, session=session_id)
+    loop = asyncio.get_running_loop()
+    lines = LineBuffer(MAX_LINE)
+    events, prefix = ADMISSION.event_bucket(), prefix_of(client_ip)
+    started = time.monotonic()
+    reason = "closed by client"
+    transcript = Transcript(session_id)
+
+    try:
+        writer.write(BANNER)
+        transcript.send(BANNER)
+        await writer.drain()
+        ACCEPT_TO_BANNER.observe(time.perf_counter() - accepted)
+        country = await loop.run_in_executor(None, register_session, session_id, client_ip, client_port)
+        while True:
+            timeout = next_timeout(started)
+            if timeout <= 0:
+                reason = "session timeout"
+                break
+            try:
+                data = await asyncio.wait_for(reader.read(RECV_SIZE), timeout)
+            except asyncio.TimeoutError:
+                reason = "session timeout" if next_timeout(started) <= 0 else "idle timeout"
+                break
+            if data:
+                transcript.recv(data)
+            complete = lines.feed(data) if data else lines.flush()
+            for line in complete:
+                payload = decode_line(line)
+                if not payload:
+                    continue
+                log_it, delay = pace_event(events, prefix)
+                if delay:
+                    await asyncio.sleep(delay)
+                if log_it:
+                    verdict = known_verdict(payload) or await analyze_event_async(payload)
+                    log_event(session_id, "recv", payload, verdict=verdict, client_ip=client_ip,
+                              client_port=client_port, country=country, block=False)
+                writer.write(b"OK\r\n")
+                transcript.send(b"OK\r\n")
+                await writer.drain()
+            if not data:
+                break
+    except ConnectionResetError:
+        reason = "reset by peer"
+    except Exception as e:
+        reason = f"error: {e}"
+        logs.log("error", f"Error handling client {addr}: {e}", "warn", session=session_id, error=str(e))
+    finally:
+        writer.close()
+        ADMISSION.release()
+        # compression happens off the loop; asyncio.run waits for it on shutdown
+        loop.run_in_executor(None, close_session, session_id, reason, lines, transcript)
+        logs.log("disconnect", f"Disconnected {client_ip}:{client_port} ({reason})", "end",
+                 session=session_id, reason=reason)
 
 # ==============================================
 # Start honeypot with auto port fallback
 # ==============================================
-def start_server():
+def bind_socket(port=PORT, retries=5):
+    """Bind a listening socket to the first free port in [port, port+retries).
+    Returns (sock, final_port) or (None, None)."""
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
-    base_port = PORT
-    retries = 5
-    bound = False
-
     for i in range(retries):
         try:
-            sock.bind((HOST, base_port + i))
-            final_port = base_port + i
-            print(f"[*] Honeypot bound to port {final_port}")
-            bound = True
-            break
+            sock.bind((HOST, port + i))
+            print(f"[*] Honeypot bound to port {port + i}")
+            return sock, port + i
         except OSError as e:
             if e.errno == errno.EADDRINUSE:
-                print(f"[!] Port {base_port + i} already in use. Trying next...")
+                print(f"[!] Port {port + i} already in use. Trying next...")
                 continue
             else:
+                sock.close()
                 raise
 
-    if not bound:
+    sock.close()
+    return None, None
+
+def raise_fd_limit():
+    """Lift the soft open-file limit to the hard limit so one process can hold
+    tens of thousands of idle sockets. No-op where `resource` is unavailable."""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY or soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+def start_server(port=PORT, backlog=BACKLOG):
+    """Threaded mode: one daemon thread per connection (kept as a fallback)."""
+    sock, final_port = bind_socket(port)
+    if sock is None:
         print("[X] Could not bind to any available port. Exiting.")
         return
 
-    sock.listen(5)
+    sock.listen(backlog)
     print(f"[+] Honeypot active on {HOST}:{final_port}. Waiting for connections...")
 
     while True:
         try:
             client, addr = sock.accept()
-            t = threading.Thread(target=handle_client, args=(client, addr))
+            accepted = time.perf_counter()
+            admitted, reason = ADMISSION.admit(addr[0])
+            CONNECTIONS.labels(reason or "admitted").inc()
+            if not admitted:
+                refuse(client, addr[0])
+                continue
+            t = threading.Thread(target=handle_client, args=(client, addr, accepted))
             t.daemon = True
             t.start()
         except KeyboardInterrupt:
@@ -226,6 +500,256 @@ def start_server():
             break
         except Exception as e:
             print(f"[!] Error in main loop: {e}")
+    ADMISSION.flush(DB_FILE)
+    KNOWN_PAYLOADS.flush(DB_FILE)
+    alerts.shutdown()
+    shutdown_writers()
+
+async def serve_async(port=PORT, backlog=BACKLOG):
+    sock, final_port = bind_socket(port)
+    if sock is None:
+        print("[X] Could not bind to any available port. Exiting.")
+        return
+
+    server = await asyncio.start_server(handle_client_async, sock=sock, backlog=backlog)
+    print(f"[+] Honeypot active on {HOST}:{final_port} (async, backlog={backlog}). Waiting for connections...")
+    async with server:
+        await server.serve_forever()
+
+def start_async_server(port=PORT, backlog=BACKLOG):
+    """Async mode: a single event loop multiplexes every connection."""
+    raise_fd_limit()
+    try:
+        asyncio.run(serve_async(port, backlog))
+    except KeyboardInterrupt:
+        print("\n[!] Honeypot shutting down.")
+    ADMISSION.flush(DB_FILE)
+    KNOWN_PAYLOADS.flush(DB_FILE)
+    alerts.shutdown()
+    shutdown_writers()
+
+# ==============================================
+# Multi-port / multi-process mode (SO_REUSEPORT)
+# ==============================================
+WORKER_RESTART_DELAY = 1.0   # seconds before a crashed worker is replaced
+WORKER_BIND_FAILED = 3       # worker exit code: could not bind, do not restart
+CHANNEL_BATCHES = 256        # row batches buffered between workers and the writer
+
+def bind_shared(port):
+    """Listening socket on a fixed port that other workers can bind too
+    (the kernel spreads new connections across them)."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if hasattr(socket, "SO_REUSEPORT"):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    try:
+        sock.bind((HOST, port))
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+async def serve_ports(ports, backlog=BACKLOG):
+    servers = [await asyncio.start_server(handle_client_async, sock=bind_shared(p), backlog=backlog)
+               for p in ports]
+    print(f"[+] Honeypot active on {HOST}:{','.join(map(str, ports))} (pid {os.getpid()}). Waiting for connections...")
+    await asyncio.gather(*(s.serve_forever() for s in servers))
+
+def apply_config(config, workers=1, index=0):
+    """Set this process's module settings from the parsed command line. With
+    several workers each one gets 1/workers of the connection limits, since
+    the kernel spreads a client's connections across all of them; worker
+    `index` publishes live events to ring hp_ring_<index>."""
+    global MAX_LINE, IDLE_TIMEOUT, SESSION_TIMEOUT, GEOIP_DB_FILE, GEOIP_HTTP_FALLBACK, ADMISSION
+    MAX_LINE = config["max_line"]
+    IDLE_TIMEOUT = config["idle_timeout"]
+    SESSION_TIMEOUT = config["session_timeout"]
+    GEOIP_DB_FILE = config["geoip_db"]
+    transcripts.TRANSCRIPT_DIR = config["transcripts"]
+    GEOIP_HTTP_FALLBACK = not config["no_geoip_http"]
+    utils.ANALYZER_MODE = config["analyzer"]
+    logs.configure(config["log_format"], config["log_rate"])
+    mail_to = config["alert_mail_to"].split(",") if config["alert_mail_to"] else ()
+    sinks = alerts.build_sinks(config["alert_webhook"] or (), config["alert_smtp"], config["alert_mail_from"], mail_to)
+    alerts.configure(sinks, window=config["alert_window"], key=config["alert_key"].split(","),
+                     rate=config["alert_rate"])
+    get_index(GEOIP_DB_FILE)
+    ring.open_writer(index, config["ring_slots"])
+    KNOWN_PAYLOADS.preload(DB_FILE, sources=None if utils.ANALYZER_MODE == "local" else ("analyzer",))
+    KNOWN_PAYLOADS.start_flusher(DB_FILE)
+    ADMISSION = Admission(ip_rate=config["ip_rate"] / workers,
+                          ip_burst=max(1, admission.IP_BURST // workers),
+                          prefix_rate=config["prefix_rate"] / workers,
+                          prefix_burst=max(1, admission.PREFIX_BURST // workers),
+                          max_sessions=max(1, config["max_sessions"] // workers),
+                          events_per_sec=config["events_per_sec"],
+                          policy=config["over_limit"]).start_flusher(DB_FILE)
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def worker_main(index, ports, backlog, channel, config, workers):
+    """One listener process: serves every port on its own event loop and
+    ships its rows to the supervisor's writer."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # Ctrl+C is handled by the supervisor
+    signal.signal(signal.SIGTERM, _interrupt)
+    use_remote_writer(channel)
+    apply_config(config, workers, index)
+    if config["metrics_port"]:
+        metrics.serve(config["metrics_port"] + 1 + index)   # the supervisor has metrics_port itself
+    raise_fd_limit()
+    try:
+        asyncio.run(serve_ports(ports, backlog))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"[X] Worker {index} could not bind {ports}: {e}")
+        sys.exit(WORKER_BIND_FAILED)
+    finally:
+        ADMISSION.flush(DB_FILE)
+        KNOWN_PAYLOADS.flush(DB_FILE)
+        alerts.shutdown()
+        shutdown_writers()
+
+def start_supervisor(ports, workers, backlog, config):
+    """Run `workers` listener processes sharing every port via SO_REUSEPORT.
+    This process owns the only SQLite writer and restarts crashed workers."""
+    if not hasattr(socket, "SO_REUSEPORT"):
+        print("[!] SO_REUSEPORT is not available here; serving all ports from one process.")
+        workers = 1
+    metrics.serve(config["metrics_port"])
+    if workers <= 1:
+        apply_config(config)
+        raise_fd_limit()
+        try:
+            asyncio.run(serve_ports(ports, backlog))
+        except KeyboardInterrupt:
+            print("\n[!] Honeypot shutting down.")
+        except OSError as e:
+            print(f"[X] Could not bind {ports}: {e}")
+        ADMISSION.flush(DB_FILE)
+        KNOWN_PAYLOADS.flush(DB_FILE)
+        alerts.shutdown()
+        shutdown_writers()
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    channel = ctx.Queue(maxsize=CHANNEL_BATCHES)
+    drain = threading.Thread(target=serve_remote, args=(channel, get_writer(DB_FILE)), name="hp-writer-feed", daemon=True)
+    drain.start()
+
+    def spawn(i):
+        p = ctx.Process(target=worker_main, args=(i, ports, backlog, channel, config, workers),
+                        name=f"hp-worker-{i}", daemon=True)
+        p.start()
+        return p
+
+    print(f"[*] Supervisor {os.getpid()} starting {workers} workers on ports {','.join(map(str, ports))}")
+    procs = {i: spawn(i) for i in range(workers)}
+    try:
+        while procs:
+            time.sleep(0.5)
+            for i, p in list(procs.items()):
+                if p.is_alive():
+                    continue
+                if p.exitcode == WORKER_BIND_FAILED:
+                    print(f"[X] Worker {i} could not bind; giving up on it.")
+                    del procs[i]
+                    continue
+                print(f"[!] Worker {i} exited with code {p.exitcode}; restarting")
+                time.sleep(WORKER_RESTART_DELAY)
+                procs[i] = spawn(i)
+    except KeyboardInterrupt:
+        print("\n[!] Honeypot shutting down.")
+    for p in procs.values():
+        p.terminate()
+    for p in procs.values():
+        p.join(10)
+    channel.put(None)
+    drain.join(10)
+    shutdown_writers()
 
 if __name__ == "__main__":
-    start_server()
+    parser = argparse.ArgumentParser(description="AI SecurityOps honeypot listener")
+    parser.add_argument("--mode", choices=["async", "threaded"], default=SERVER_MODE,
+                        help="connection handling model (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=PORT, help="first port to try (default: %(default)s)")
+    parser.add_argument("--backlog", type=int, default=BACKLOG, help="listen() backlog (default: %(default)s)")
+    parser.add_argument("--geoip-db", default=GEOIP_DB_FILE, help="local GeoIP/ASN range CSV (default: %(default)s)")
+    parser.add_argument("--no-geoip-http", action="store_true", help="never fall back to the ip-api.com lookup")
+    parser.add_argument("--analyzer", choices=["remote", "local"], default=utils.ANALYZER_MODE,
+                        help="remote: mock_ai_api/analyzer with local fallback; local: rules only (default: %(default)s)")
+    parser.add_argument("--queue-policy", choices=POLICIES, default=QUEUE_POLICY,
+                        help="what to do when the DB write queue is full (default: %(default)s)")
+    parser.add_argument("--max-line", type=int, default=MAX_LINE,
+                        help="longest command in bytes; longer lines are truncated (default: %(default)s)")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="close sessions silent for this many seconds (default: %(default)s)")
+    parser.add_argument("--session-timeout", type=float, default=SESSION_TIMEOUT,
+                        help="close sessions older than this many seconds (default: %(default)s)")
+    parser.add_argument("--transcripts", default=transcripts.TRANSCRIPT_DIR,
+                        help="directory for transcript segments (default: %(default)s)")
+    parser.add_argument("--max-sessions", type=int, default=admission.MAX_SESSIONS,
+                        help="concurrent sessions allowed (default: %(default)s)")
+    parser.add_argument("--ip-rate", type=float, default=admission.IP_RATE,
+                        help="new connections/s per source IP (burst %s)" % admission.IP_BURST)
+    parser.add_argument("--prefix-rate", type=float, default=admission.PREFIX_RATE,
+                        help="new connections/s per /24 or /48 (burst %s)" % admission.PREFIX_BURST)
+    parser.add_argument("--events-per-sec", type=float, default=admission.EVENTS_PER_SEC,
+                        help="commands/s per session (burst %s)" % admission.EVENT_BURST)
+    parser.add_argument("--over-limit", choices=admission.POLICIES, default=admission.POLICY,
+                        help="reject: reset at once / drop commands; tarpit: hold and stall (default: %(default)s)")
+    parser.add_argument("--metrics-port", type=int, default=metrics.METRICS_PORT,
+                        help="serve Prometheus metrics on 127.0.0.1:PORT/metrics, 0 = off; with --workers, "
+                             "worker N uses PORT+1+N (default: %(default)s)")
+    parser.add_argument("--log-format", choices=logs.FORMATS, default=logs.LOG_FORMAT,
+                        help="console log lines as text or JSON objects (default: %(default)s)")
+    parser.add_argument("--log-rate", type=float, default=logs.LOG_RATE,
+                        help="log lines/s per kind (connect, event, ...) before suppressing, 0 = no limit "
+                             "(default: %(default)s)")
+    parser.add_argument("--alert-webhook", action="append", metavar="URL",
+                        help="POST alert digests here as JSON (repeatable; no sink = console)")
+    parser.add_argument("--alert-smtp", metavar="HOST:PORT", help="email alert digests through this SMTP server")
+    parser.add_argument("--alert-mail-to", metavar="ADDRS", help="comma-separated alert recipients")
+    parser.add_argument("--alert-mail-from", default="honeypot@localhost", help="alert sender (default: %(default)s)")
+    parser.add_argument("--alert-window", type=float, default=alerts.DEDUP_WINDOW,
+                        help="seconds repeats are folded into one digest (default: %(default)s)")
+    parser.add_argument("--alert-key", default=",".join(alerts.DEDUP_KEY),
+                        help="fields that identify repeats, from %s (default: %%(default)s)" % ",".join(alerts.KEY_FIELDS))
+    parser.add_argument("--alert-rate", type=float, default=alerts.SINK_RATE,
+                        help="deliveries per second per sink (default: %(default)s)")
+    parser.add_argument("--archive-after", type=float, default=0,
+                        help="move events older than this many days into archive/ partitions (0 = keep in place)")
+    parser.add_argument("--archive-by", choices=partitions.GRANULARITIES, default="day",
+                        help="partition size (default: %(default)s)")
+    parser.add_argument("--compress-after", type=float, default=0, help="gzip partitions older than this many days (0 = never)")
+    parser.add_argument("--drop-after", type=float, default=0,
+                        help="delete events, partitions and transcripts older than this many days (0 = never)")
+    parser.add_argument("--cluster-interval", type=float, default=campaigns.CLUSTER_INTERVAL,
+                        help="seconds between campaign clustering passes over ended sessions, 0 = off (default: %(default)s)")
+    parser.add_argument("--ring-slots", type=int, default=ring.RING_SLOTS,
+                        help="newest events each listener process keeps in shared memory for the dashboard's "
+                             "live view, 0 = off (default: %(default)s)")
+    parser.add_argument("--ports", help="comma-separated fixed ports to listen on, e.g. 22,2222,23,2323 (no retry)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="listener processes sharing the ports via SO_REUSEPORT (0 = single process; "
+                             f"this machine has {os.cpu_count()} cores)")
+    args = parser.parse_args()
+    get_writer(DB_FILE, policy=args.queue_policy)
+    transcripts.TRANSCRIPT_DIR = args.transcripts
+    if args.archive_after or args.compress_after or args.drop_after:
+        # hourly, on its own connection in short batches; see partitions.py
+        partitions.start_maintainer(DB_FILE, archive_after=args.archive_after, granularity=args.archive_by,
+                                    compress_after=args.compress_after, drop_after=args.drop_after)
+    if args.cluster_interval:
+        # this process only (it owns the writer), so campaign ids stay unique; see campaigns.py
+        campaigns.start_clusterer(DB_FILE, args.cluster_interval)
+    if args.ports or args.workers:
+        ports = [int(p) for p in args.ports.split(",")] if args.ports else [args.port]
+        start_supervisor(ports, args.workers, args.backlog, vars(args))
+        sys.exit(0)
+    apply_config(vars(args))
+    metrics.serve(args.metrics_port)
+    if args.mode == "threaded":
+        start_server(args.port, args.backlog)
+    else:
+        start_async_server(args.port, args.backlog)
@@ -0,0 +1,234 @@
+# metrics.py - in-process counters, gauges and latency histograms, exported as Prometheus text
+import threading, time, bisect
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_HOST = "127.0.0.1"   # scrape address; keep it off the honeypot's public interface
+METRICS_PORT = 9109          # 0 = no endpoint
+# seconds; hot-path calls are expected well under 10 ms, the analyzer's HTTP timeout is 2 s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []      # metric families, in registration order
+_collectors = []    # fn() -> [(name, type, help, [(labels dict, value), ...])], called per scrape
+_lock = threading.Lock()
+START_TIME = time.time()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+def _num(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Family:
+    """A named metric with zero or more label dimensions; labels(...)
+    returns the child for one set of label values (created on first use)."""
+    kind = None
+
+    def __init__(self, name, doc, labelnames=()):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        with _lock:
+            _registry.append(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            out.extend(child.render(self.name, self.labelnames, values))
+        return out
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+    def render(self, name, names, values):
+        return [f"{name}{_labels(names, values)} {_num(self.value)}"]
+
+class Counter(_Family):
+    kind = "counter"
+    _child = _CounterChild
+
+    def inc(self, n=1):
+        self._default().inc(n)
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, v):
+        self.value = v
+
+    def dec(self, n=1):
+        self.inc(-n)
+
+class Gauge(_Family):
+    """A value that goes up and down. With fn, the value is fn() at scrape
+    time, for things that are already tracked elsewhere (queue depth,
+    thread count) and would cost a call on the hot path to mirror."""
+    kind = "gauge"
+    _child = _GaugeChild
+
+    def __init__(self, name, doc, fn=None):
+        super().__init__(name, doc)
+        self.fn = fn
+
+    def set(self, v):
+        self._default().set(v)
+
+    def render(self):
+        if self.fn is not None:
+            try:
+                self._default().set(self.fn())
+            except Exception:
+                return []
+        return super().render()
+
+
+class _Timer:
+    __slots__ = ("child", "t0")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.t0)
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, v):
+        i = bisect.bisect_left(self.bounds, v)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += v
+
+    def time(self):
+        """with hist.time(): ... observes the block's wall time."""
+        return _Timer(self)
+
+    def render(self, name, names, values):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        out, running = [], 0
+        for bound, n in zip(self.bounds + (float("inf"),), counts):
+            running += n
+            out.append(f"{name}_bucket{_labels(names + ('le',), values + (_num(bound),))} {running}")
+        out.append(f"{name}_sum{_labels(names, values)} {_num(total)}")
+        out.append(f"{name}_count{_labels(names, values)} {running}")
+        return out
+
+class Histogram(_Family):
+    """Latency (or size) distribution in fixed cumulative buckets: an
+    observe() is a bisect and an increment, whatever the rate."""
+    kind = "histogram"
+
+    def __init__(self, name, doc, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, v):
+        self._default().observe(v)
+
+    def time(self):
+        return self._default().time()
+
+
+def register_collector(fn):
+    """fn() returns [(name, type, help, [(labels dict, value), ...]), ...],
+    read at scrape time; for stats a module already keeps in a dict."""
+    with _lock:
+        if fn not in _collectors:
+            _collectors.append(fn)
+
+def render():
+    """Every metric in Prometheus text exposition format."""
+    with _lock:
+        families, collectors = list(_registry), list(_collectors)
+    out = ["# HELP process_start_time_seconds Start time of the process since unix epoch",
+           "# TYPE process_start_time_seconds gauge", f"process_start_time_seconds {START_TIME:.3f}"]
+    for f in families:
+        out.extend(f.render())
+    for fn in collectors:
+        try:
+            collected = fn()
+        except Exception as e:
+            print(f"[!] Metrics collector {getattr(fn, '__name__', fn)} failed: {e}")
+            continue
+        for name, kind, doc, samples in collected:
+            out += [f"# HELP {name} {doc}", f"# TYPE {name} {kind}"]
+            for labels, value in samples:
+                out.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_num(value)}")
+    return "\n".join(out) + "\n"
+
+
+# ---------------- /metrics endpoint ----------------
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def serve(port=METRICS_PORT, host=METRICS_HOST):
+    """Serve /metrics from a daemon thread. Returns the server, or None if
+    the endpoint is disabled (port 0) or the port is taken."""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as e:
+        print(f"[!] Metrics endpoint not started on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="hp-metrics", daemon=True).start()
+    print(f"[*] Metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+migrate.py
+
+Online migration of an existing hp_events.db to the typed schema:
+integer epoch timestamps (events.ts_epoch, sessions.start_epoch/end_epoch)
+and an indexed small-integer events.severity; then payload interning: the
+text, verdict and tags each event repeats move to one payloads row per
+distinct payload (see payloads.py), and a report shows what that saved.
+
+The columns and indexes are added by db.ensure_schema (a metadata-only ALTER).
+The backfill then walks the tables by id in small batches, each in its own
+short transaction, so a running honeypot keeps writing between batches. Rows
+written meanwhile by an older honeypot are picked up on a final sweep.
+
+Timestamps ending in 'Z' are read as UTC; naive ones as local time, which is
+how time.strftime wrote them.
+
+Interning frees pages inside the file, which new events reuse; --vacuum
+also shrinks the file, but rewrites it with the honeypot locked out.
+Archived partitions keep their rows as they are.
+
+Usage:
+    python migrate.py                         # migrate hp_events.db next to this file
+    python migrate.py --db /path/to/hp_events.db --batch 20000 --pause 0.02
+    python migrate.py --vacuum                # and give the freed space back to the filesystem
+"""
+import sqlite3, os, time, argparse
+from db import DB_FILE, ensure_schema
+import payloads, search
+
+# SQL twins of db.to_epoch / db.severity_code, so a batch is one UPDATE
+EPOCH_SQL = """CAST(CASE
+    WHEN {col} IS NULL OR {col} = '' THEN NULL
+    WHEN {col} LIKE '%Z' THEN strftime('%s', substr({col}, 1, 19))
+    ELSE strftime('%s', substr({col}, 1, 19), 'utc')
+END AS INTEGER)"""
+SEVERITY_SQL = """CASE lower(CASE WHEN json_valid(extra_json) THEN json_extract(extra_json, '$.severity') END)
+    WHEN 'low' THEN 0 WHEN 'medium' THEN 1 WHEN 'high' THEN 2 WHEN 'critical' THEN 3
+END"""
+
+STEPS = [
+    ("events", "ts_epoch IS NULL AND ts IS NOT NULL AND ts != ''",
+     f"ts_epoch = {EPOCH_SQL.format(col='ts')}, severity = COALESCE(severity, {SEVERITY_SQL})", "id"),
+    ("sessions", "start_epoch IS NULL AND start_ts IS NOT NULL AND start_ts != ''",
+     f"start_epoch = {EPOCH_SQL.format(col='start_ts')}, end_epoch = {EPOCH_SQL.format(col='end_ts')}", "rowid"),
+]
+
+def backfill(conn, table, pending, assignments, key, batch=5000, pause=0.05):
+    """Fill one table in key order, batch rows per transaction."""
+    hi = conn.execute(f"SELECT COALESCE(MAX({key}), 0) FROM {table}").fetchone()[0]
+    done, lo, t0 = 0, 0, time.time()
+    while lo < hi:
+        with conn:
+            cur = conn.execute(f"UPDATE {table} SET {assignments} WHERE {key} > ? AND {key} <= ? AND {pending}",
+                               (lo, lo + batch))
+        done += cur.rowcount
+        lo += batch
+        if cur.rowcount:
+            print(f"  {table}: {done} rows migrated (up to {key} {min(lo, hi)} of {hi})", end="\r")
+            time.sleep(pause)
+    # final sweep for rows an older writer added while we were running
+    with conn:
+        cur = conn.execute(f"UPDATE {table} SET {assignments} WHERE {key} > ? AND {pending}", (hi,))
+    done += max(cur.rowcount, 0)
+    print(f"  {table}: {done} rows migrated in {time.time() - t0:.1f}s" + " " * 20)
+    return done
+
+# one payloads row per distinct text in the batch, then the events point at
+# it; verdict/tags stay on an event only where they differ from the payload's,
+# and a (64-bit) hash collision leaves the event as it was
+INTERN_SQL = """INSERT INTO payloads (id, text, verdict, severity, tags, first_epoch, last_epoch, count)
+    SELECT content_id(payload), payload, extra_json, severity, NULLIF(tags, ''), MIN(ts_epoch), MAX(ts_epoch), COUNT(*)
+    FROM events WHERE id > ? AND id <= ? AND payload IS NOT NULL AND payload_id IS NULL
+    GROUP BY payload
+    ON CONFLICT (id) DO UPDATE SET first_epoch = MIN(first_epoch, excluded.first_epoch),
+        last_epoch = MAX(last_epoch, excluded.last_epoch), count = count + excluded.count"""
+REFERENCE_SQL = """UPDATE events SET payload_id = content_id(payload), payload = NULL,
+        extra_json = CASE WHEN extra_json IS (SELECT verdict FROM payloads WHERE id = content_id(events.payload))
+                          THEN NULL ELSE extra_json END,
+        tags = CASE WHEN COALESCE(tags, '') = COALESCE((SELECT tags FROM payloads WHERE id = content_id(events.payload)), '')
+                    THEN NULL ELSE tags END
+    WHERE id > ? AND id <= ? AND payload IS NOT NULL AND payload_id IS NULL
+      AND (SELECT text FROM payloads WHERE id = content_id(events.payload)) = payload"""
+
+def intern_payloads(conn, batch=5000, pause=0.05):
+    """Move inline payloads into the payloads table, batch events per
+    transaction. The search index needs no update: it reads the text
+    through events_text, which gives the same text either way."""
+    conn.create_function("content_id", 1, payloads.payload_id, deterministic=True)
+    hi = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+    first = conn.execute("SELECT MIN(id) FROM events WHERE payload IS NOT NULL AND payload_id IS NULL").fetchone()[0]
+    lo = hi if first is None else first - 1
+    done, t0 = 0, time.time()
+    while lo < hi:
+        with conn:
+            conn.execute(INTERN_SQL, (lo, lo + batch))
+            cur = conn.execute(REFERENCE_SQL, (lo, lo + batch))
+        done += cur.rowcount
+        lo += batch
+        if cur.rowcount:
+            print(f"  payloads: {done} events interned (up to id {min(lo, hi)} of {hi})", end="\r")
+            time.sleep(pause)
+    print(f"  payloads: {done} events interned in {time.time() - t0:.1f}s" + " " * 20)
+    return done
+
+def main(db_file=DB_FILE, batch=5000, pause=0.05, vacuum=False):
+    if not os.path.exists(db_file):
+        print("Database not found:", db_file)
+        raise SystemExit(1)
+    conn = sqlite3.connect(db_file, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    fts = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'events_fts'").fetchone()
+    print(f"[*] Ensuring typed columns and indexes on {db_file} ...")
+    ensure_schema(conn)
+    before = payloads.report(conn)
+    for table, pending, assignments, key in STEPS:
+        backfill(conn, table, pending, assignments, key, batch, pause)
+    left = conn.execute("SELECT COUNT(*) FROM events WHERE ts_epoch IS NULL").fetchone()[0]
+    if left:
+        print(f"[!] {left} events have unparseable timestamps and were left without ts_epoch.")
+    intern_payloads(conn, batch, pause)
+    if fts and "events_text" not in fts[0]:
+        search.rebuild(db_file)   # the old index was dropped by ensure_schema
+    conn.execute("ANALYZE")
+    if vacuum:
+        print("[*] VACUUM (the honeypot cannot write until it finishes) ...")
+        conn.execute("VACUUM")
+    payloads.print_report(payloads.report(conn), before)
+    conn.close()
+    print("[+] Migration complete.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Online migration of hp_events.db to the typed schema")
+    parser.add_argument("--db", default=DB_FILE, help="database file (default: %(default)s)")
+    parser.add_argument("--batch", type=int, default=5000, help="rows per transaction")
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds to sleep between batches")
+    parser.add_argument("--vacuum", action="store_true", help="rewrite the file afterwards to release freed pages")
+    args = parser.parse_args()
+    main(args.db, args.batch, args.pause, args.vacuum)
@@ -3,20 +3,34 @@ from flask import Flask, request, jsonify
 import time
 app = Flask("mock_ai")
 
-@app.route("/analyze", methods=["POST"])
-def analyze():
-    data = request.get_json(force=True)
-    inp = data.get("input","")
+KEYWORDS = ["sudo","rm","wget","curl","nc","bash","root","passwd","nmap","exploit"]
+LATENCY = 0.12  # simulated model latency per request
+
+def _score(inp):
     score = 0
-    for k in ["sudo","rm","wget","curl","nc","bash","root","passwd","nmap","exploit"]:
+    for k in KEYWORDS:
         if k in inp.lower(): score += 1
     if score >= 3: severity = "critical"
     elif score == 2: severity = "high"
     elif score == 1: severity = "medium"
     else: severity = "low"
-    tags = [t for t in ["sudo","rm","wget","curl","nc","bash","root","passwd","nmap","exploit"] if t in inp.lower()]
-    time.sleep(0.12)
-    return jsonify({"severity": severity, "tags": tags, "note": f"mocked {severity}"})
+    tags = [t for t in KEYWORDS if t in inp.lower()]
+    return {"severity": severity, "tags": tags, "note": f"mocked {severity}"}
+
+@app.route("/analyze", methods=["POST"])
+def analyze():
+    data = request.get_json(force=True)
+    inp = data.get("input","")
+    time.sleep(LATENCY)
+    return jsonify(_score(inp))
+
+@app.route("/analyze_batch", methods=["POST"])
+def analyze_batch():
+    """{"inputs": [...]} -> {"results": [...]} in input order; one model call per batch."""
+    data = request.get_json(force=True)
+    inputs = data.get("inputs", [])
+    time.sleep(LATENCY)
+    return jsonify({"results": [_score(str(inp)) for inp in inputs]})
 
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=9000)
+    app.run(host="127.0.0.1", port=9000, threaded=True)
@@ -0,0 +1,99 @@
+# mock_alert_sink.py - local webhook + SMTP stand-in for testing alert delivery
+import argparse, asyncio, random, threading, time
+from flask import Flask, request, jsonify
+
+app = Flask("mock_alert_sink")
+
+HTTP_PORT = 9001
+SMTP_PORT = 2525
+FAIL_RATE = 0.0      # share of webhook requests answered with 500 (exercises retries)
+KEEP = 200           # deliveries kept for GET /alerts
+
+_received = {"webhook_batches": 0, "webhook_digests": 0, "emails": 0, "recent": []}
+_lock = threading.Lock()
+
+def _record(kind, item):
+    with _lock:
+        _received["recent"] = (_received["recent"] + [dict(item, kind=kind, received=time.time())])[-KEEP:]
+
+@app.route("/alerts", methods=["POST"])
+def webhook():
+    if random.random() < FAIL_RATE:
+        return jsonify({"error": "injected failure"}), 500
+    digests = request.get_json(force=True).get("alerts", [])
+    with _lock:
+        _received["webhook_batches"] += 1
+        _received["webhook_digests"] += len(digests)
+    for d in digests:
+        _record("webhook", d)
+        print(f"[ALERT] webhook {d.get('severity', '?').upper()} x{d.get('count')} {d.get('ip')} {d.get('sample')}")
+    return jsonify({"ok": True})
+
+@app.route("/alerts", methods=["GET"])
+def received():
+    """What arrived so far, for tests: counters plus the latest deliveries."""
+    with _lock:
+        return jsonify(_received)
+
+# ---------------- SMTP (just enough of RFC 5321 for smtplib) ----------------
+async def smtp_session(reader, writer):
+    writer.write(b"220 mock-smtp ready\r\n")
+    mail_from, rcpts = None, []
+    while True:
+        await writer.drain()
+        line = await reader.readline()
+        if not line:
+            break
+        verb = line[:4].upper()
+        if verb in (b"HELO", b"EHLO"):
+            writer.write(b"250 mock-smtp\r\n")
+        elif verb == b"MAIL":
+            mail_from, rcpts = line[10:].strip().decode(errors="replace"), []
+            writer.write(b"250 OK\r\n")
+        elif verb == b"RCPT":
+            rcpts.append(line[8:].strip().decode(errors="replace"))
+            writer.write(b"250 OK\r\n")
+        elif verb == b"DATA":
+            writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+            await writer.drain()
+            body = []
+            while True:
+                data = await reader.readline()
+                if not data or data in (b".\r\n", b".\n"):
+                    break
+                body.append(data)
+            text = b"".join(body).decode(errors="replace")
+            subject = next((l[9:].strip() for l in text.splitlines() if l.startswith("Subject: ")), "")
+            with _lock:
+                _received["emails"] += 1
+            _record("email", {"from": mail_from, "to": rcpts, "subject": subject, "body": text})
+            print(f"[ALERT] email to {','.join(rcpts)}: {subject}")
+            writer.write(b"250 OK queued\r\n")
+        elif verb in (b"RSET", b"NOOP"):
+            writer.write(b"250 OK\r\n")
+        elif verb == b"QUIT":
+            writer.write(b"221 Bye\r\n")
+            await writer.drain()
+            break
+        else:
+            writer.write(b"502 Command not implemented\r\n")
+    writer.close()
+
+def run_smtp(port):
+    async def serve():
+        server = await asyncio.start_server(smtp_session, "127.0.0.1", port)
+        async with server:
+            await server.serve_forever()
+    asyncio.run(serve())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Webhook and SMTP stand-in for honeypot alerts")
+    parser.add_argument("--http-port", type=int, default=HTTP_PORT, help="webhook port, POST /alerts (default: %(default)s)")
+    parser.add_argument("--smtp-port", type=int, default=SMTP_PORT, help="SMTP port (default: %(default)s)")
+    parser.add_argument("--fail-rate", type=float, default=FAIL_RATE,
+                        help="share of webhook requests to fail with 500 (default: %(default)s)")
+    args = parser.parse_args()
+    FAIL_RATE = args.fail_rate
+    threading.Thread(target=run_smtp, args=(args.smtp_port,), daemon=True).start()
+    print(f"[*] SMTP stand-in on 127.0.0.1:{args.smtp_port}")
+    app.run(host="127.0.0.1", port=args.http_port, threaded=True)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+partitions.py
+
+Time-partitioned retention for the events table (opt-in).
+
+The live hp_events.db keeps recent events. Older ones are moved, a day (or
+week) at a time, into partition files next to it:
+archive/events-day-2026-10-18.db, each holding an events table plus copies of
+the sessions and payloads (see payloads.py) those events reference. The move happens in small batches, each
+a short transaction that copies rows into the attached partition, removes
+them from the search index (events_fts is external-content, so it has to be
+told the old values) and deletes them from events. A running honeypot keeps
+writing between batches, and the freed pages are reused by new events, so no
+VACUUM is needed.
+
+Ingest does not write into partitions: events land in the live database and
+are moved later. Routing each insert to its period's file would put an
+ATTACH (and a second fsync per batch) on the writer thread at every period
+boundary, and split the search index and the dashboard's recent-events
+queries across files. The cost is that archiving is copy-then-DELETE out of
+the live database; the DELETEs are bounded to ARCHIVE_BATCH rows and paced
+by ARCHIVE_PAUSE so the writer never waits long. Once a period has moved,
+retention itself is a whole-file operation.
+
+Once a partition exists, retention is a file operation: cold partitions are
+gzipped (and no longer queried until restored) and expired ones are
+deleted, together with transcript segments older than the cutoff. Rollups
+are not touched, so the stats panel keeps its history. db.fan_out() reads
+the live database and then the overlapping partitions, newest first. Search
+covers the live database only.
+
+Usage:
+    python partitions.py --archive-after 30                  # move events older than 30 days
+    python partitions.py --archive-after 30 --by week --compress-after 90 --drop-after 365
+    python partitions.py --list
+    python partitions.py --restore events-day-2026-01-01     # un-gzip a cold partition
+"""
+import sqlite3, os, re, time, gzip, shutil, threading, calendar, argparse
+import transcripts, payloads
+
+GRANULARITIES = {"day": 86400, "week": 7 * 86400}
+ARCHIVE_BATCH = 5000        # events moved per transaction
+ARCHIVE_PAUSE = 0.05        # seconds between batches, for the live writer
+MAINTAIN_INTERVAL = 3600.0  # seconds between runs of the in-process maintainer
+TABLES = ("sessions", "events", "payloads")   # copied into every partition
+PARTITION_RE = re.compile(r"^events-(day|week)-(\d{4}-\d{2}-\d{2})\.db(\.gz)?$")
+
+_EPOCH_MONDAY = 4 * 86400   # 1970-01-05 was a Monday
+
+
+class Partition:
+    __slots__ = ("path", "granularity", "start", "end", "compressed")
+
+    def __init__(self, path, granularity, start, compressed=False):
+        self.path = path
+        self.granularity = granularity
+        self.start = start
+        self.end = start + GRANULARITIES[granularity]
+        self.compressed = compressed
+
+    @property
+    def name(self):
+        return os.path.basename(self.path).split(".")[0]
+
+def partition_dir(db_file):
+    return os.path.join(os.path.dirname(os.path.abspath(db_file)), "archive")
+
+def bounds(epoch, granularity):
+    """(start, end) epoch seconds of the UTC day / Monday-based week holding epoch."""
+    size = GRANULARITIES[granularity]
+    offset = _EPOCH_MONDAY if granularity == "week" else 0
+    start = (epoch - offset) // size * size + offset
+    return start, start + size
+
+def partition_path(db_file, start, granularity):
+    day = time.strftime("%Y-%m-%d", time.gmtime(start))
+    return os.path.join(partition_dir(db_file), f"events-{granularity}-{day}.db")
+
+def list_partitions(db_file):
+    """Every partition of db_file, newest first."""
+    directory = partition_dir(db_file)
+    if not os.path.isdir(directory):
+        return []
+    out = []
+    for name in os.listdir(directory):
+        m = PARTITION_RE.match(name)
+        if m:
+            start = calendar.timegm(time.strptime(m.group(2), "%Y-%m-%d"))
+            out.append(Partition(os.path.join(directory, name), m.group(1), start, bool(m.group(3))))
+    return sorted(out, key=lambda p: p.start, reverse=True)
+
+def overlapping(db_file, since=None, until=None):
+    """Uncompressed partitions with events in [since, until], newest first."""
+    return [p for p in list_partitions(db_file)
+            if not p.compressed and (since is None or p.end > since) and (until is None or p.start <= until)]
+
+
+# ---------------- moving events out of the live database ----------------
+def _columns(conn, schema, table):
+    return [r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+def _create_partition(conn, path):
+    """Create the partition file with the live database's events/sessions/
+    payloads schema (as recorded in sqlite_master, so later columns come along)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _sync_partition(conn, path)
+    part = sqlite3.connect(path)
+    try:
+        part.execute("CREATE INDEX IF NOT EXISTS idx_events_epoch_id ON events(ts_epoch, id)")
+        part.execute("CREATE INDEX IF NOT EXISTS idx_events_sev_epoch_id ON events(severity, ts_epoch, id)")
+        part.execute("CREATE INDEX IF NOT EXISTS idx_events_session ON events(session_id)")
+        part.execute("CREATE INDEX IF NOT EXISTS idx_sessions_ip ON sessions(client_ip)")
+        part.commit()
+    finally:
+        part.close()
+
+def _sync_partition(conn, path):
+    """Create the live tables and columns the partition at path lacks."""
+    tables = conn.execute(f"SELECT name, sql FROM main.sqlite_master WHERE type = 'table' "
+                          f"AND name IN ({','.join('?' * len(TABLES))})", TABLES).fetchall()
+    part = sqlite3.connect(path, timeout=30)
+    try:
+        for table, sql in tables:
+            part.execute(sql.replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1))
+            have = set(_columns(part, "main", table))
+            for r in conn.execute(f"PRAGMA main.table_info({table})"):
+                if r[1] not in have:
+                    part.execute(f"ALTER TABLE {table} ADD COLUMN {r[1]} {r[2]}")
+        part.commit()
+    finally:
+        part.close()
+
+def sync_schema(db_file):
+    """Add tables and columns the live database gained since a partition was
+    created (e.g. payloads, sessions.campaign) to every uncompressed
+    partition, so queries that fan out over them see one schema. Compressed
+    partitions are brought up to date when restored."""
+    live = sqlite3.connect(db_file, timeout=30)
+    try:
+        for p in list_partitions(db_file):
+            if not p.compressed:
+                _sync_partition(live, p.path)
+    finally:
+        live.close()
+
+def move_range(conn, start, end, path=None, batch=ARCHIVE_BATCH, pause=ARCHIVE_PAUSE):
+    """Move events with start <= ts_epoch < end (and their sessions) into the
+    partition file at path, or just delete them if path is None. Each batch
+    is its own transaction; a batch interrupted half-way is redone safely
+    (rows already in the partition are skipped). Returns events moved."""
+    has_fts = conn.execute("SELECT 1 FROM main.sqlite_master WHERE name = 'events_fts'").fetchone()
+    if path:
+        if not os.path.exists(path):
+            _create_partition(conn, path)
+        else:
+            _sync_partition(conn, path)
+        conn.execute("ATTACH DATABASE ? AS part", (path,))
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS _archive_ids (id INTEGER PRIMARY KEY)")
+    moved = 0
+    try:
+        if path:
+            ev_cols = [c for c in _columns(conn, "main", "events") if c in _columns(conn, "part", "events")]
+            se_cols = [c for c in _columns(conn, "main", "sessions") if c in _columns(conn, "part", "sessions")]
+            pl_cols = [c for c in _columns(conn, "main", "payloads") if c in _columns(conn, "part", "payloads")]
+            ev_list, se_list, pl_list = ", ".join(ev_cols), ", ".join(se_cols), ", ".join(pl_cols)
+        while True:
+            with conn:
+                conn.execute("DELETE FROM _archive_ids")
+                conn.execute("""INSERT INTO _archive_ids SELECT id FROM main.events
+                                WHERE ts_epoch >= ? AND ts_epoch < ? ORDER BY ts_epoch, id LIMIT ?""",
+                             (start, end, batch))
+                n = conn.execute("SELECT COUNT(*) FROM _archive_ids").fetchone()[0]
+                if not n:
+                    break
+                if path:
+                    conn.execute(f"""INSERT OR IGNORE INTO part.sessions ({se_list})
+                                     SELECT {se_list} FROM main.sessions WHERE id IN
+                                        (SELECT session_id FROM main.events WHERE id IN (SELECT id FROM _archive_ids))""")
+                    if pl_cols and "payload_id" in ev_cols:
+                        conn.execute(f"""INSERT OR IGNORE INTO part.payloads ({pl_list})
+                                         SELECT {pl_list} FROM main.payloads WHERE id IN
+                                            (SELECT payload_id FROM main.events WHERE id IN (SELECT id FROM _archive_ids))""")
+                    conn.execute(f"""INSERT OR IGNORE INTO part.events ({ev_list})
+                                     SELECT {ev_list} FROM main.events WHERE id IN (SELECT id FROM _archive_ids)""")
+                if has_fts:
+                    conn.execute("""INSERT INTO events_fts (events_fts, rowid, payload)
+                                    SELECT 'delete', id, payload FROM main.events_text
+                                    WHERE id IN (SELECT id FROM _archive_ids) AND payload IS NOT NULL""")
+                conn.execute("DELETE FROM main.events WHERE id IN (SELECT id FROM _archive_ids)")
+            moved += n
+            time.sleep(pause)
+        # finished sessions of this range that no longer have events here
+        with conn:
+            orphan = """FROM main.sessions WHERE start_epoch >= ? AND start_epoch < ? AND end_epoch IS NOT NULL
+                        AND NOT EXISTS (SELECT 1 FROM main.events e WHERE e.session_id = sessions.id)"""
+            if path:
+                conn.execute(f"INSERT OR IGNORE INTO part.sessions ({se_list}) SELECT {se_list} {orphan}", (start, end))
+            conn.execute(f"DELETE {orphan}", (start, end))
+    finally:
+        if path:
+            conn.execute("DETACH DATABASE part")
+    return moved
+
+def archive(db_file, before, granularity="day", keep=True, batch=ARCHIVE_BATCH, pause=ARCHIVE_PAUSE):
+    """Move (keep=True) or delete every event older than the partition that
+    contains `before` (only whole days/weeks are moved)."""
+    # IMMEDIATE: take the write lock when a batch starts rather than upgrading
+    # from a read snapshot the live writer may have moved past meanwhile
+    conn = sqlite3.connect(db_file, timeout=30, isolation_level="IMMEDIATE")
+    payloads.ensure_schema(conn)   # the FTS delete below reads events_text
+    conn.commit()
+    cutoff = bounds(int(before), granularity)[0]
+    total = 0
+    try:
+        while True:
+            row = conn.execute("SELECT MIN(ts_epoch) FROM events WHERE ts_epoch < ?", (cutoff,)).fetchone()
+            if row[0] is None:
+                break
+            start, end = bounds(row[0], granularity)
+            path = partition_path(db_file, start, granularity) if keep else None
+            n = move_range(conn, start, end, path, batch, pause)
+            total += n
+            print(f"[+] {'Archived' if keep else 'Deleted'} {n} events from "
+                  f"{time.strftime('%Y-%m-%d', time.gmtime(start))}" + (f" to {os.path.basename(path)}" if path else ""))
+    finally:
+        conn.close()
+    return total
+
+
+# ---------------- file-level retention ----------------
+def compress(partition):
+    """gzip a partition; it is skipped by queries until restored."""
+    with open(partition.path, "rb") as src, gzip.open(partition.path + ".gz.tmp", "wb") as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(partition.path + ".gz.tmp", partition.path + ".gz")
+    os.remove(partition.path)
+    print(f"[+] Compressed {os.path.basename(partition.path)}")
+
+def restore(db_file, name):
+    for p in list_partitions(db_file):
+        if p.name == name and p.compressed:
+            target = p.path[:-3]
+            with gzip.open(p.path, "rb") as src, open(target + ".tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.replace(target + ".tmp", target)
+            os.remove(p.path)
+            sync_schema(db_file)
+            print(f"[+] Restored {os.path.basename(target)}")
+            return target
+    print(f"[!] No compressed partition named {name}")
+    return None
+
+def drop_transcripts(db_file, before):
+    """Delete transcript segments last written before `before` and their index rows."""
+    directory = transcripts.TRANSCRIPT_DIR
+    if not os.path.isdir(directory):
+        return 0
+    conn = sqlite3.connect(db_file, timeout=30)
+    dropped = 0
+    try:
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if name.endswith(".hpt") and os.path.getmtime(path) < before:
+                with conn:
+                    conn.execute("DELETE FROM transcript_index WHERE segment = ?", (name,))
+                os.remove(path)
+                dropped += 1
+    finally:
+        conn.close()
+    if dropped:
+        print(f"[+] Dropped {dropped} transcript segments")
+    return dropped
+
+def maintain(db_file, archive_after=0, granularity="day", compress_after=0, drop_after=0, now=None):
+    """One retention pass; every *_after is in days, 0 = off. Without
+    archive_after, events older than drop_after are deleted in place."""
+    now = now or time.time()
+    if archive_after:
+        archive(db_file, now - archive_after * 86400, granularity)
+    elif drop_after:
+        archive(db_file, now - drop_after * 86400, granularity, keep=False)
+    for p in list_partitions(db_file):
+        if drop_after and p.end <= now - drop_after * 86400:
+            os.remove(p.path)
+            print(f"[+] Dropped {os.path.basename(p.path)}")
+        elif compress_after and not p.compressed and p.end <= now - compress_after * 86400:
+            compress(p)
+    if drop_after:
+        drop_transcripts(db_file, now - drop_after * 86400)
+
+def start_maintainer(db_file, interval=MAINTAIN_INTERVAL, **options):
+    """Run maintain() now and every `interval` seconds on a daemon thread."""
+    def run():
+        while True:
+            try:
+                maintain(db_file, **options)
+            except Exception as e:
+                print(f"[!] Retention pass failed: {e}")
+            time.sleep(interval)
+    t = threading.Thread(target=run, name="hp-retention", daemon=True)
+    t.start()
+    return t
+
+
+if __name__ == "__main__":
+    from db import DB_FILE
+    parser = argparse.ArgumentParser(description="Archive, compress and expire old events")
+    parser.add_argument("--db", default=DB_FILE, help="database file (default: %(default)s)")
+    parser.add_argument("--archive-after", type=float, default=0, help="move events older than this many days into partitions")
+    parser.add_argument("--by", choices=GRANULARITIES, default="day", help="partition size (default: %(default)s)")
+    parser.add_argument("--compress-after", type=float, default=0, help="gzip partitions older than this many days")
+    parser.add_argument("--drop-after", type=float, default=0,
+                        help="delete partitions, transcripts (and, without --archive-after, events) older than this many days")
+    parser.add_argument("--list", action="store_true", help="list partitions")
+    parser.add_argument("--restore", metavar="NAME", help="decompress a cold partition so it is queried again")
+    args = parser.parse_args()
+    if args.restore:
+        restore(args.db, args.restore)
+    if args.archive_after or args.compress_after or args.drop_after:
+        maintain(args.db, args.archive_after, args.by, args.compress_after, args.drop_after)
+    if args.list:
+        for p in list_partitions(args.db):
+            size = os.path.getsize(p.path)
+            print(f"{p.name:<28} {'cold' if p.compressed else 'live':<5} {size / 1e6:>10.1f} MB")
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+payloads.py
+
+Content-addressed payload store. Bots send the same few droppers and
+recon one-liners over and over, so each distinct command is stored once, in
+the payloads table, with the verdict it was given and first-seen/last-seen/
+count statistics. An event row references it through events.payload_id and
+leaves events.payload and events.extra_json NULL; events.tags still holds
+the tags of that event.
+
+A payload's id is its content hash (the first 8 bytes of BLAKE2b, as a
+signed 64-bit integer), so every process computes it without asking the
+database: a listener worker writing through the supervisor needs no round
+trip, and all of them agree on the id.
+
+In the honeypot, PayloadCache remembers the verdicts of recently seen
+payloads (preloaded with the most frequent ones from the database), and
+log_event does not classify a payload it already knows. The first sighting
+queues a payloads upsert ahead of the event (the writer keeps submission
+order, so the row is never committed after the events that reference it).
+A queued row may still be dropped (a full queue, or a batch a listener
+worker could not ship), so the payload counts as stored only once the
+flusher has found its row in the database; until then every sighting
+queues the upsert again, and the flusher re-queues the rows it did not
+find. Repeats of a stored payload only bump in-process counters, flushed
+as one upsert per payload every STATS_FLUSH seconds.
+
+NEW_SQL carries a verdict the payload should keep (the analyzer's, or the
+local rules' when they are the configured analyzer) and overwrites the
+stored one; SEEN_SQL only counts the sighting once the row exists, so a
+fallback verdict given while the analyzer was down never replaces it.
+
+Rows written before this table existed keep their text inline; readers take
+COALESCE(p.text, e.payload) with `LEFT JOIN payloads p ON p.id =
+e.payload_id`. `python migrate.py` moves them into payloads.
+
+Usage:
+    python payloads.py --report      # how much payload text is interned, and what it saves
+    python payloads.py --top 20      # most frequent payloads with their verdicts
+"""
+import sqlite3, os, json, hashlib, threading, time, argparse
+from collections import OrderedDict
+from writer import get_writer
+from rules import SEVERITY_RANK, SEVERITIES
+
+PAYLOAD_CACHE = 50000      # payload verdicts kept per process (least recently seen are forgotten)
+UNCONFIRMED = 50000        # payloads whose row is not yet known to be stored (oldest are forgotten)
+CONFIRM_BATCH = 500        # ids looked up per query when confirming stored rows
+PRELOAD = 5000             # most frequent payloads loaded into the cache at start
+STATS_FLUSH = 10.0         # seconds between flushes of repeat counts to the database
+
+NEW_SQL = """INSERT INTO payloads (id, text, verdict, severity, tags, first_epoch, last_epoch, count)
+             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+             ON CONFLICT (id) DO UPDATE SET verdict = excluded.verdict, severity = excluded.severity,
+                 tags = excluded.tags, first_epoch = MIN(first_epoch, excluded.first_epoch),
+                 last_epoch = MAX(last_epoch, excluded.last_epoch), count = count + excluded.count"""
+SEEN_SQL = """INSERT INTO payloads (id, text, verdict, severity, tags, first_epoch, last_epoch, count)
+              VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+              ON CONFLICT (id) DO UPDATE SET first_epoch = MIN(first_epoch, excluded.first_epoch),
+                  last_epoch = MAX(last_epoch, excluded.last_epoch), count = count + excluded.count"""
+
+
+def payload_id(text):
+    """Content id of a payload: 64 bits of BLAKE2b, signed to fit an SQLite INTEGER."""
+    digest = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+def ensure_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS payloads (
+            id INTEGER PRIMARY KEY,
+            text TEXT NOT NULL,
+            verdict TEXT,
+            severity INTEGER,
+            tags TEXT,
+            first_epoch INTEGER,
+            last_epoch INTEGER,
+            count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    if "payload_id" not in {r[1] for r in conn.execute("PRAGMA table_info(events)")}:
+        conn.execute("ALTER TABLE events ADD COLUMN payload_id INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_payload ON events(payload_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_payloads_count ON payloads(count)")
+    # one payload column whichever way a row stores it (search.py indexes this)
+    conn.execute("""
+        CREATE VIEW IF NOT EXISTS events_text AS
+        SELECT e.id AS id, COALESCE(p.text, e.payload) AS payload
+        FROM events e LEFT JOIN payloads p ON p.id = e.payload_id
+    """)
+
+
+class PayloadCache:
+    """Verdicts of payloads this process has seen, plus their repeat counts
+    since the last flush. Shared by every connection handler."""
+
+    def __init__(self, size=PAYLOAD_CACHE):
+        self.size = size
+        self._entries = OrderedDict()   # id -> (text, verdict)
+        self._unconfirmed = OrderedDict()   # id -> (text, verdict, epoch): row queued, not yet seen stored
+        self._seen = {}                 # id -> [count, first epoch, last epoch]
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def get(self, pid):
+        """The cached verdict for payload id pid, or None."""
+        with self._lock:
+            entry = self._entries.get(pid)
+            if entry is None:
+                return None
+            self._entries.move_to_end(pid)
+            return entry[1]
+
+    def add(self, pid, text, verdict, epoch=0, cache=True):
+        """Note that a payloads row for pid was queued; cache its verdict
+        too unless cache is False (a fallback verdict)."""
+        with self._lock:
+            self._unconfirmed[pid] = (text, verdict, epoch)
+            while len(self._unconfirmed) > UNCONFIRMED:
+                self._unconfirmed.popitem(last=False)
+            if not cache:
+                return
+            self._entries[pid] = (text, verdict)
+            self._entries.move_to_end(pid)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def seen(self, pid, epoch):
+        """Count a repeat of a cached payload. False (nothing counted) if its
+        row is not confirmed stored yet: the caller queues the upsert again."""
+        with self._lock:
+            if pid in self._unconfirmed:
+                return False
+            stats = self._seen.get(pid)
+            if stats is None:
+                self._seen[pid] = [1, epoch, epoch]
+            else:
+                stats[0] += 1
+                stats[2] = epoch
+            return True
+
+    def preload(self, db_file, n=PRELOAD, sources=None):
+        """Load the n most frequent payloads' verdicts (only those whose
+        verdict source is in `sources`, if given). Returns how many."""
+        if not n or not os.path.exists(db_file):
+            return 0
+        conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+        try:
+            rows = conn.execute("SELECT id, text, verdict FROM payloads WHERE verdict IS NOT NULL "
+                                "ORDER BY count DESC LIMIT ?", (n,)).fetchall()
+        except sqlite3.OperationalError:
+            return 0     # no payloads table yet
+        finally:
+            conn.close()
+        loaded = 0
+        for pid, text, verdict in reversed(rows):   # most frequent end up most recently used
+            try:
+                verdict = json.loads(verdict)
+            except ValueError:
+                continue
+            if not isinstance(verdict, dict) or not {"severity", "tags"} <= verdict.keys():
+                continue     # e.g. the simulator's bare {"severity": ...}
+            if sources is not None and verdict.get("source") not in sources:
+                continue
+            self.add(pid, text, verdict)
+            loaded += 1
+        return loaded
+
+    # ---------------- repeat counters ----------------
+    def take_seen(self):
+        with self._lock:
+            seen, self._seen = self._seen, {}
+            entries = {pid: self._entries.get(pid) for pid in seen}
+        return seen, entries
+
+    def confirm(self, db_file):
+        """Look up the queued payload rows not yet confirmed; those found are
+        stored, the others are queued again (a no-op if the first one is
+        still on its way). Returns how many were re-queued."""
+        with self._lock:
+            pending = dict(self._unconfirmed)
+        if not pending or not os.path.exists(db_file):
+            return 0
+        ids, found = list(pending), set()
+        conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True, timeout=5)
+        try:
+            for i in range(0, len(ids), CONFIRM_BATCH):
+                chunk = ids[i:i + CONFIRM_BATCH]
+                found.update(r[0] for r in conn.execute(
+                    f"SELECT id FROM payloads WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+        except sqlite3.Error:
+            return 0     # no payloads table yet, or busy: try again next time
+        finally:
+            conn.close()
+        with self._lock:
+            for pid in found:
+                self._unconfirmed.pop(pid, None)
+        w = get_writer(db_file)
+        missing = [pid for pid in ids if pid not in found]
+        for pid in missing:
+            text, verdict, epoch = pending[pid]
+            w.submit(SEEN_SQL, row(pid, text, verdict, epoch, epoch, 0))
+        return len(missing)
+
+    def flush(self, db_file):
+        """Fold the repeat counts into the payloads table (through the writer)
+        and confirm the rows queued since the last flush. A payload evicted
+        from the cache meanwhile gets a plain UPDATE, as its text is no
+        longer at hand."""
+        self.confirm(db_file)
+        seen, entries = self.take_seen()
+        w = get_writer(db_file)
+        for pid, (count, first, last) in seen.items():
+            entry = entries.get(pid)
+            if entry is None:
+                w.submit("""UPDATE payloads SET count = count + ?, first_epoch = MIN(first_epoch, ?),
+                            last_epoch = MAX(last_epoch, ?) WHERE id = ?""", (count, first, last, pid))
+                continue
+            text, verdict = entry
+            w.submit(SEEN_SQL, row(pid, text, verdict, first, last, count))
+        return len(seen)
+
+    def start_flusher(self, db_file, interval=STATS_FLUSH):
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush(db_file)
+                except Exception as e:
+                    print(f"[!] Payload counter flush failed: {e}")
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=run, name="hp-payloads", daemon=True)
+            self._flusher.start()
+        return self
+
+def row(pid, text, verdict, first, last, count=1):
+    """Parameters for NEW_SQL / SEEN_SQL."""
+    tags = verdict.get("tags") or ()
+    return (pid, text, json.dumps(verdict), SEVERITY_RANK.get(str(verdict.get("severity")).lower()),
+            ",".join(tags) if isinstance(tags, (list, tuple)) else str(tags), first, last, count)
+
+# ---------------- reports ----------------
+def report(conn):
+    """Storage figures for interned payloads: a dict, see print_report."""
+    q = lambda sql: conn.execute(sql).fetchone()
+    events, inline, interned = q("SELECT COUNT(*), COUNT(payload), COUNT(payload_id) FROM events")
+    distinct, text_bytes, verdict_bytes, referenced = q(
+        "SELECT COUNT(*), COALESCE(SUM(length(CAST(text AS BLOB))), 0), "
+        "COALESCE(SUM(length(CAST(COALESCE(verdict, '') AS BLOB)) + length(CAST(COALESCE(tags, '') AS BLOB))), 0), "
+        "COALESCE(SUM(count), 0) FROM payloads")
+    # bytes the referenced rows would hold if each repeated its text, verdict and tags
+    expanded = q("""SELECT COALESCE(SUM(length(CAST(p.text AS BLOB)) + length(CAST(COALESCE(p.verdict, '') AS BLOB))
+                                        + length(CAST(COALESCE(p.tags, '') AS BLOB))), 0)
+                    FROM events e JOIN payloads p ON p.id = e.payload_id""")[0]
+    inline_bytes = q("SELECT COALESCE(SUM(length(CAST(payload AS BLOB)) + length(CAST(COALESCE(extra_json, '') AS BLOB))"
+                     " + length(CAST(COALESCE(tags, '') AS BLOB))), 0) FROM events WHERE payload IS NOT NULL")[0]
+    page_size, pages, free = (q(f"PRAGMA {p}")[0] for p in ("page_size", "page_count", "freelist_count"))
+    return {"events": events, "inline": inline, "interned": interned, "distinct": distinct,
+            "text_bytes": text_bytes + verdict_bytes, "expanded_bytes": expanded, "inline_bytes": inline_bytes,
+            "saved_bytes": max(0, expanded - text_bytes - verdict_bytes - 8 * interned), "sightings": referenced,
+            "file_bytes": page_size * pages, "free_bytes": page_size * free}
+
+def _mb(n):
+    return f"{n / 1e6:,.1f} MB"
+
+def print_report(r, before=None):
+    print(f"[*] {r['events']:,} events: {r['interned']:,} reference {r['distinct']:,} distinct payloads, "
+          f"{r['inline']:,} still store their text inline")
+    if r["interned"]:
+        print(f"    interned text+verdicts: {_mb(r['text_bytes'])} stored once instead of "
+              f"{_mb(r['expanded_bytes'])} repeated per event ({r['interned'] / max(r['distinct'], 1):,.1f} "
+              f"events per payload), about {_mb(r['saved_bytes'])} saved")
+    if r["inline"]:
+        print(f"    inline text+verdicts: {_mb(r['inline_bytes'])} (run `python migrate.py` to intern them)")
+    print(f"    database: {_mb(r['file_bytes'])} in pages, {_mb(r['free_bytes'])} of them free for reuse")
+    if before:
+        used_before = before["file_bytes"] - before["free_bytes"]
+        used = r["file_bytes"] - r["free_bytes"]
+        print(f"[+] Pages in use: {_mb(used_before)} -> {_mb(used)} "
+              f"({(used_before - used) / max(used_before, 1):.0%} smaller); file: "
+              f"{_mb(before['file_bytes'])} -> {_mb(r['file_bytes'])}")
+
+
+if __name__ == "__main__":
+    from db import DB_FILE
+    parser = argparse.ArgumentParser(description="Report on the content-addressed payload store")
+    parser.add_argument("--db", default=DB_FILE, help="database file (default: %(default)s)")
+    parser.add_argument("--report", action="store_true", help="storage used and saved by interning")
+    parser.add_argument("--top", type=int, default=0, help="list the N most frequent payloads")
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        print("Database not found:", args.db)
+        raise SystemExit(1)
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    if args.report or not args.top:
+        print_report(report(conn))
+    if args.top:
+        for pid, text, count, sev, first, last in conn.execute(
+                "SELECT id, text, count, severity, first_epoch, last_epoch FROM payloads ORDER BY count DESC LIMIT ?",
+                (args.top,)):
+            name = SEVERITIES[sev] if sev is not None else "unknown"
+            print(f"{count:>10,}  {name:8}  {time.strftime('%Y-%m-%d', time.gmtime(last or 0))}  {text[:100]}")
+    conn.close()
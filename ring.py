@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+ring.py
+
+Shared-memory ring buffer of the newest events, so the dashboard's live view
+can follow the honeypot without polling SQLite.
+
+Every listener process publishes each event it logs into its own named
+segment (hp_ring_<index>: 0 for a single process, the worker index with
+--workers). A segment is a 64-byte header followed by `slots` fixed-width
+records:
+
+    header: magic, version, slots, record size, head (u64: events published),
+            generation (u64, random per segment), owner pid (u32)
+    record: seq (u64), ts (f64), client port (u16), severity code (i8),
+            flags (u8: 1 = payload truncated), session id, client ip,
+            country, payload (NUL-padded UTF-8)
+
+Event n goes to slot n % slots. The writer zeroes the slot's seq, fills in
+the record, stores seq = n and then advances head; it never waits for
+readers, and a reader that falls more than `slots` events behind simply
+loses the overwritten ones. A reader copies a slot and accepts it only if
+seq reads n before and after the copy (a seqlock), so a record overwritten
+mid-read is skipped rather than returned torn.
+
+A segment left behind by a killed process is taken over by the next writer
+with the same index, but only once its owner pid is gone; a second honeypot
+on the same index gets no ring instead of clobbering the first one's.
+
+Usage:
+    python ring.py            # follow every ring on this host (like tail -f)
+    python ring.py --last 20  # print the newest 20 events and exit
+"""
+import os, struct, threading, time, atexit, argparse
+from multiprocessing import shared_memory, resource_tracker
+
+RING_NAME = "hp_ring"          # segment name prefix; the process index is appended
+RING_SLOTS = 4096              # events kept per process (~2 MB)
+MAX_RINGS = 64                 # indexes a reader looks for
+RETRY_INTERVAL = 5.0           # seconds between a reader's attempts to attach missing rings
+
+MAGIC = b"HPR1"
+VERSION = 1
+HEADER = struct.Struct("<4sIIIQQ")
+HEADER_SIZE = 64
+HEAD_OFFSET = 16               # offset of head inside the header
+OWNER = struct.Struct("<I")
+OWNER_OFFSET = 32              # offset of the writer's pid inside the header (0 = unknown)
+SEQ = struct.Struct("<Q")
+RECORD = struct.Struct("<QdHbB64s46s48s334s")   # 512 bytes
+TRUNCATED = 1
+
+
+def _text(value, size):
+    data = (value or "").encode("utf-8", "replace")
+    if len(data) <= size:
+        return data, False
+    return data[:size].decode("utf-8", "ignore").encode("utf-8"), True
+
+def _str(raw):
+    return raw.rstrip(b"\0").decode("utf-8", "replace")
+
+def _attach(name):
+    """Map an existing segment read-only in spirit: attaching registers it
+    with this process's resource tracker, which would unlink it when we
+    exit, so it is unregistered again; the segment is not ours."""
+    shm = shared_memory.SharedMemory(name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+def _alive(pid):
+    if os.name == "nt":
+        return True      # segments die with their last handle there, so the owner still runs
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass             # another user's process
+    return True
+
+def _owner(name):
+    """pid of the writer of an existing segment, or 0 if unknown."""
+    shm = _attach(name)
+    try:
+        if shm.size < HEADER_SIZE or bytes(shm.buf[:4]) != MAGIC:
+            return 0
+        return OWNER.unpack_from(shm.buf, OWNER_OFFSET)[0]
+    finally:
+        shm.close()
+
+
+class RingWriter:
+    """Publisher side; one per process. Threads of the process share it."""
+
+    def __init__(self, index=0, slots=RING_SLOTS, name=RING_NAME):
+        self.name = f"{name}_{index}"
+        self.slots = slots
+        size = HEADER_SIZE + slots * RECORD.size
+        try:
+            self.shm = shared_memory.SharedMemory(self.name, create=True, size=size)
+        except FileExistsError:
+            owner = _owner(self.name)
+            if owner and owner != os.getpid() and _alive(owner):
+                raise FileExistsError(f"{self.name} is in use by process {owner}") from None
+            # left over from a process that was killed: take it over
+            stale = shared_memory.SharedMemory(self.name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(self.name, create=True, size=size)
+        self.buf = self.shm.buf
+        self.head = 0
+        HEADER.pack_into(self.buf, 0, MAGIC, VERSION, slots, RECORD.size, 0, int.from_bytes(os.urandom(8), "big"))
+        OWNER.pack_into(self.buf, OWNER_OFFSET, os.getpid())
+        self._lock = threading.Lock()
+
+    def publish(self, session_id, client_ip, client_port, country, payload, severity, ts=None):
+        sid, _ = _text(session_id, 64)
+        ip, _ = _text(client_ip, 46)
+        ctry, _ = _text(country, 48)
+        text, truncated = _text(payload, 334)
+        sev = -1 if severity is None else severity
+        with self._lock:
+            self.head += 1
+            seq = self.head
+            offset = HEADER_SIZE + (seq % self.slots) * RECORD.size
+            SEQ.pack_into(self.buf, offset, 0)   # slot is being rewritten
+            RECORD.pack_into(self.buf, offset, 0, ts or time.time(), client_port or 0, sev,
+                             TRUNCATED if truncated else 0, sid, ip, ctry, text)
+            SEQ.pack_into(self.buf, offset, seq)
+            SEQ.pack_into(self.buf, HEAD_OFFSET, seq)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class RingReader:
+    """Reads one process's ring without ever writing to it."""
+
+    def __init__(self, index=0, name=RING_NAME):
+        self.name = f"{name}_{index}"
+        self.shm = _attach(self.name)
+        magic, version, self.slots, record_size, _, self.generation = HEADER.unpack_from(self.shm.buf, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            self.shm.close()
+            raise ValueError(f"{self.name} is not a version {VERSION} event ring")
+        self.lapped = 0
+
+    def head(self):
+        return SEQ.unpack_from(self.shm.buf, HEAD_OFFSET)[0]
+
+    def current(self):
+        """False once the segment was unlinked or replaced by a new honeypot
+        process (our mapping then stays valid but never changes again)."""
+        try:
+            shm = _attach(self.name)
+        except FileNotFoundError:
+            return False
+        try:
+            return HEADER.unpack_from(shm.buf, 0)[5] == self.generation
+        finally:
+            shm.close()
+
+    def read(self, after, limit=None):
+        """Records with after < seq <= head (at most the newest `limit`), as
+        dicts, oldest first, plus the seq to pass next time."""
+        head = self.head()
+        start = max(after + 1, head - self.slots + 1)
+        if limit is not None:
+            start = max(start, head - limit + 1)
+        if after and start > after + 1:
+            self.lapped += start - after - 1
+        out = []
+        buf = self.shm.buf
+        for seq in range(start, head + 1):
+            offset = HEADER_SIZE + (seq % self.slots) * RECORD.size
+            raw = bytes(buf[offset:offset + RECORD.size])
+            if SEQ.unpack_from(raw, 0)[0] != seq or SEQ.unpack_from(buf, offset)[0] != seq:
+                self.lapped += 1     # overwritten while we were behind (or mid-copy)
+                continue
+            _, ts, port, sev, flags, sid, ip, country, payload = RECORD.unpack(raw)
+            out.append({"seq": seq, "ts": ts, "session_id": _str(sid), "client_ip": _str(ip),
+                        "client_port": port, "country": _str(country), "payload": _str(payload),
+                        "severity": None if sev < 0 else sev, "truncated": bool(flags & TRUNCATED)})
+        return out, head
+
+    def close(self):
+        self.shm.close()
+
+
+class RingSet:
+    """Every ring on the host, merged by time: what the dashboard follows."""
+
+    def __init__(self, name=RING_NAME, max_rings=MAX_RINGS, retry=RETRY_INTERVAL):
+        self.name = name
+        self.max_rings = max_rings
+        self.retry = retry
+        self.readers = {}     # index -> [reader, last seq read]
+        self._next_scan = 0.0
+
+    def _scan(self):
+        now = time.monotonic()
+        if now < self._next_scan:
+            return
+        self._next_scan = now + self.retry
+        for index, (reader, _) in list(self.readers.items()):
+            if not reader.current():
+                reader.close()
+                del self.readers[index]
+        for index in range(self.max_rings):
+            if index in self.readers:
+                continue
+            try:
+                reader = RingReader(index, self.name)
+            except (FileNotFoundError, ValueError):
+                continue
+            self.readers[index] = [reader, reader.head()]   # follow from now on
+
+    def available(self):
+        self._scan()
+        return bool(self.readers)
+
+    def poll(self):
+        """New records from every ring since the last poll, oldest first."""
+        self._scan()
+        records = []
+        for index, entry in list(self.readers.items()):
+            reader, after = entry
+            new, entry[1] = reader.read(after)
+            records.extend(new)
+        records.sort(key=lambda r: r["ts"])
+        return records
+
+    def latest(self, n):
+        """The newest n records across all rings, newest first."""
+        self._scan()
+        records = []
+        for reader, _ in self.readers.values():
+            records.extend(reader.read(0, n)[0])
+        records.sort(key=lambda r: r["ts"], reverse=True)
+        return records[:n]
+
+
+# ---------------- process-wide writer (main.py) ----------------
+_writer = None
+
+def open_writer(index=0, slots=RING_SLOTS):
+    """Create this process's ring; publish() is a no-op until then."""
+    global _writer
+    if slots <= 0:
+        return None
+    try:
+        _writer = RingWriter(index, slots)
+    except OSError as e:
+        print(f"[!] Live event ring unavailable ({e}); the dashboard will poll SQLite.")
+        return None
+    atexit.register(_writer.close)
+    return _writer
+
+def publish(session_id, client_ip, client_port, country, payload, severity, ts=None):
+    if _writer is not None:
+        _writer.publish(session_id, client_ip, client_port, country, payload, severity, ts)
+
+
+if __name__ == "__main__":
+    from rules import SEVERITIES
+    parser = argparse.ArgumentParser(description="Follow the honeypot's live event rings")
+    parser.add_argument("--last", type=int, default=0, help="print the newest N events and exit")
+    args = parser.parse_args()
+    rings = RingSet(retry=0)
+    if not rings.available():
+        print("[!] No event ring found; is the honeypot running?")
+        raise SystemExit(1)
+
+    def show(r):
+        sev = SEVERITIES[r["severity"]] if r["severity"] is not None else "unknown"
+        print(f"{time.strftime('%H:%M:%S', time.localtime(r['ts']))} {r['client_ip']}:{r['client_port']} "
+              f"{sev.upper():8} {r['payload']}")
+
+    if args.last:
+        for r in reversed(rings.latest(args.last)):
+            show(r)
+    else:
+        rings.retry = RETRY_INTERVAL
+        try:
+            while True:
+                for r in rings.poll():
+                    show(r)
+                time.sleep(0.2)
+        except KeyboardInterrupt:
+            pass
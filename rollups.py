@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+rollups.py
+
+Pre-aggregated event counts for the dashboard's stats panel.
+
+Three tables (rollup_minute, rollup_hour, rollup_day) hold
+(dim, bucket, key) -> count, where dim is one of DIMS and bucket is the epoch
+second the minute/hour/day starts at. The write-behind writer calls
+apply_range() inside every batch transaction with the id range it just
+inserted, so the rollups stay in step with the events table at the cost of a
+few grouped UPSERTs per batch. Minute rows are pruned after
+MINUTE_RETENTION seconds; hour and day rows are kept.
+
+Usage:
+    python rollups.py --backfill        # rebuild every rollup from the events table
+    python rollups.py --top country     # print the top countries for the last 24h
+"""
+import sqlite3, time, argparse
+import payloads
+
+GRANULARITIES = {"minute": 60, "hour": 3600, "day": 86400}
+DIMS = ("total", "severity", "country", "asn", "command")
+MINUTE_RETENTION = 3 * 86400
+COMMAND_KEY_LEN = 200          # commands are grouped by their first 200 chars
+PRUNE_EVERY = 1000             # batches between minute-table prunes
+
+SEVERITY_NAME_SQL = """CASE e.severity WHEN 0 THEN 'low' WHEN 1 THEN 'medium'
+    WHEN 2 THEN 'high' WHEN 3 THEN 'critical' ELSE 'unknown' END"""
+
+def ensure_schema(conn):
+    for name in GRANULARITIES:
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS rollup_{name} (
+                dim TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                key TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (dim, bucket, key)
+            ) WITHOUT ROWID
+        """)
+
+_batches = 0
+
+def apply_range(conn, lo_id, hi_id):
+    """Fold events with lo_id < id <= hi_id into every rollup table. Runs in
+    the caller's transaction."""
+    global _batches
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS _rollup_batch (dim TEXT, bucket INTEGER, key TEXT, count INTEGER)")
+    conn.execute("DELETE FROM _rollup_batch")
+    conn.execute(f"""
+        INSERT INTO _rollup_batch (dim, bucket, key, count)
+        SELECT d.dim, b.bucket,
+               CASE d.dim WHEN 'total' THEN '' WHEN 'severity' THEN b.sev WHEN 'country' THEN b.country
+                          WHEN 'asn' THEN b.asn ELSE b.command END,
+               COUNT(*)
+        FROM (
+            SELECT e.ts_epoch / 60 * 60 AS bucket,
+                   {SEVERITY_NAME_SQL} AS sev,
+                   COALESCE(NULLIF(s.country, ''), 'Unknown') AS country,
+                   COALESCE(NULLIF(s.asn, ''), 'Unknown') AS asn,
+                   substr(COALESCE(p.text, e.payload, ''), 1, {COMMAND_KEY_LEN}) AS command
+            FROM events e LEFT JOIN sessions s ON s.id = e.session_id
+                          LEFT JOIN payloads p ON p.id = e.payload_id
+            WHERE e.id > ? AND e.id <= ? AND e.ts_epoch IS NOT NULL
+        ) AS b
+        CROSS JOIN (SELECT 'total' AS dim UNION ALL SELECT 'severity' UNION ALL SELECT 'country'
+                    UNION ALL SELECT 'asn' UNION ALL SELECT 'command') AS d
+        GROUP BY 1, 2, 3
+    """, (lo_id, hi_id))
+    for name, size in GRANULARITIES.items():
+        conn.execute(f"""
+            INSERT INTO rollup_{name} (dim, bucket, key, count)
+            SELECT dim, bucket / {size} * {size}, key, SUM(count) FROM _rollup_batch WHERE true
+            GROUP BY 1, 2, 3
+            ON CONFLICT (dim, bucket, key) DO UPDATE SET count = count + excluded.count
+        """)
+    _batches += 1
+    if _batches % PRUNE_EVERY == 0:
+        prune(conn)
+
+def prune(conn, now=None):
+    cutoff = int((now or time.time()) - MINUTE_RETENTION)
+    for dim in DIMS:
+        conn.execute("DELETE FROM rollup_minute WHERE dim = ? AND bucket < ?", (dim, cutoff))
+
+def backfill(db_file, chunk=50000):
+    """Rebuild all rollups from the events table. Safe next to a running
+    honeypot: the wipe and the snapshot of MAX(id) happen in one transaction,
+    rows above it are rolled up by the live writer."""
+    conn = sqlite3.connect(db_file, timeout=30)
+    ensure_schema(conn)
+    payloads.ensure_schema(conn)
+    with conn:
+        for name in GRANULARITIES:
+            conn.execute(f"DELETE FROM rollup_{name}")
+        hi = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+    lo, t0 = 0, time.time()
+    while lo < hi:
+        with conn:
+            apply_range(conn, lo, min(lo + chunk, hi))
+        lo += chunk
+        print(f"  rolled up to id {min(lo, hi)} of {hi}", end="\r")
+    with conn:
+        prune(conn)
+    conn.close()
+    print(f"[+] Rollups rebuilt for {hi} events in {time.time() - t0:.1f}s" + " " * 20)
+
+# ---------------- queries (dashboard) ----------------
+def pick_granularity(since, until):
+    span = until - since
+    if span <= 6 * 3600:
+        return "minute"
+    if span <= 14 * 86400:
+        return "hour"
+    return "day"
+
+def top(conn, dim, since, until, limit=10, granularity=None):
+    """[(key, count)] for dim over [since, until), largest first."""
+    g = granularity or pick_granularity(since, until)
+    size = GRANULARITIES[g]
+    return conn.execute(f"""
+        SELECT key, SUM(count) AS n FROM rollup_{g}
+        WHERE dim = ? AND bucket >= ? AND bucket < ?
+        GROUP BY key ORDER BY n DESC LIMIT ?
+    """, (dim, since // size * size, until, limit)).fetchall()
+
+def series(conn, since, until, dim="total", key="", granularity=None):
+    """[(bucket, count)] for one dim/key over [since, until), oldest first."""
+    g = granularity or pick_granularity(since, until)
+    size = GRANULARITIES[g]
+    return conn.execute(f"""
+        SELECT bucket, count FROM rollup_{g}
+        WHERE dim = ? AND bucket >= ? AND bucket < ? AND key = ?
+        ORDER BY bucket
+    """, (dim, since // size * size, until, key)).fetchall()
+
+def summary(db_file, since, until, limit=10):
+    """Everything the stats panel shows, read from the rollups only."""
+    conn = sqlite3.connect(db_file)
+    try:
+        ensure_schema(conn)
+        g = pick_granularity(since, until)
+        return {
+            "granularity": g,
+            "total": sum(n for _, n in top(conn, "total", since, until, 1, g)),
+            "severity": dict(top(conn, "severity", since, until, 10, g)),
+            "country": top(conn, "country", since, until, limit, g),
+            "asn": top(conn, "asn", since, until, limit, g),
+            "command": top(conn, "command", since, until, limit, g),
+            "series": series(conn, since, until, granularity=g),
+        }
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    from db import DB_FILE
+    parser = argparse.ArgumentParser(description="Maintain and query the dashboard rollup tables")
+    parser.add_argument("--db", default=DB_FILE, help="database file (default: %(default)s)")
+    parser.add_argument("--backfill", action="store_true", help="rebuild all rollups from events")
+    parser.add_argument("--top", choices=DIMS, help="print the top keys for a dimension")
+    parser.add_argument("--hours", type=int, default=24, help="window for --top (default: %(default)s)")
+    args = parser.parse_args()
+    if args.backfill:
+        backfill(args.db)
+    if args.top:
+        now = int(time.time())
+        conn = sqlite3.connect(args.db)
+        for k, n in top(conn, args.top, now - args.hours * 3600, now + 1):
+            print(f"{n:>10}  {k}")
+        conn.close()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# rules.py - single-pass severity classifier shared by main.py and utils.py
+"""
+A rule pack is a list of literal patterns (matched case-insensitively, with word
+boundaries on any edge that is a word character unless the rule sets
+"word": false), each carrying a tag and a minimum severity. All patterns are
+compiled into ONE regex shaped like a prefix trie, so a payload is scanned once
+no matter how many rules are loaded; a match also credits every rule contained
+in the matched text (e.g. "rm -rf" credits "rm").
+
+The verdict severity is the highest of:
+  - the severity of any matched rule, and
+  - the escalation level for the number of distinct tags matched
+    (1 -> medium, 2 -> high, 3+ -> critical by default).
+
+Rule packs are JSON files:
+    {"escalation": {"1": "medium", "2": "high", "3": "critical"},
+     "rules": [{"pattern": "rm -rf", "tag": "rm", "severity": "critical"}, ...]}
+
+RuleEngine watches its file and swaps a freshly compiled pack in atomically
+when it changes; a pack that fails to load is reported and the old one kept.
+
+Usage:
+    python rules.py --dump > rules.json     # start a pack from the defaults
+    python rules.py "wget http://x/y.sh"    # classify from the command line
+"""
+import json, os, re, sys, threading, time
+
+SEVERITIES = ("low", "medium", "high", "critical")
+SEVERITY_RANK = {s: i for i, s in enumerate(SEVERITIES)}
+RULES_FILE = os.path.join(os.path.dirname(__file__), "rules.json")
+CHECK_INTERVAL = 2.0  # seconds between rule-file mtime checks
+
+# Defaults: the former main.log_event lists plus utils.KEYWORDS
+DEFAULT_PACK = {
+    "escalation": {"1": "medium", "2": "high", "3": "critical"},
+    "rules": (
+        [{"pattern": p, "tag": t, "severity": "critical"} for p, t in
+         [("rm -rf", "rm"), ("wget", "wget"), ("chmod 777", "chmod"), ("python -c", "python")]]
+        + [{"pattern": "curl http", "tag": "curl", "severity": "critical", "word": False}]
+        + [{"pattern": p, "tag": t, "severity": "high"} for p, t in
+           [("sudo", "sudo"), ("nmap", "nmap"), ("nc", "nc"), ("bash", "bash"), ("cat /etc/passwd", "passwd")]]
+        + [{"pattern": k, "tag": k, "severity": "low"} for k in
+           ["rm", "curl", "root", "ssh", "passwd", "exploit", "docker"]]
+    ),
+}
+
+
+def _is_word(ch):
+    return ch.isalnum() or ch == "_"
+
+
+def _trie_regex(literals):
+    """Build one regex matching any of literals ({literal: word_bounded}),
+    factored as a prefix trie so the engine does not try every alternative at
+    every position. Longer literals win over their prefixes; word boundaries
+    are checked only where a literal ends."""
+    def emit(node, prev, depth):
+        alts = [re.escape(ch) + emit(node[ch], ch, depth + 1) for ch in sorted(k for k in node if k)]
+        if "" in node:
+            first = node[""]
+            check = ""
+            if first and _is_word(first):
+                # no word character right before the literal's first char
+                check += r"(?<!\w[\s\S]{%d})" % depth
+            if first and _is_word(prev):
+                check += r"(?!\w)"
+            alts.append(check)
+        return alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+
+    trie = {}
+    for lit, word in literals.items():
+        node = trie
+        for ch in lit:
+            node = node.setdefault(ch, {})
+        node[""] = lit[0] if word else None
+    return re.compile(emit(trie, "", 0)) if trie else None
+
+
+class CompiledPack:
+    """Immutable compiled form of a rule pack; swapped in as a whole."""
+
+    def __init__(self, pack):
+        self.rules = []
+        by_literal, bounded = {}, {}
+        for r in pack.get("rules", []):
+            pattern = str(r.get("pattern", "")).strip().lower()
+            severity = str(r.get("severity", "low")).lower()
+            if not pattern:
+                continue
+            if severity not in SEVERITY_RANK:
+                raise ValueError(f"rule {pattern!r}: unknown severity {severity!r}")
+            rid = len(self.rules)
+            self.rules.append((r.get("tag") or pattern, SEVERITY_RANK[severity]))
+            by_literal.setdefault(pattern, []).append(rid)
+            bounded[pattern] = bounded.get(pattern, True) and r.get("word", True) is not False
+        self.escalation = sorted(
+            ((int(n), SEVERITY_RANK[str(s).lower()]) for n, s in pack.get("escalation", {}).items()),
+            reverse=True)
+        self.regex = _trie_regex(bounded)
+        # matched literal -> every rule whose literal occurs inside it
+        self.credits = {lit: frozenset(self._contained(lit, by_literal)) for lit in by_literal}
+
+    @staticmethod
+    def _contained(lit, by_literal):
+        n = len(lit)
+        starts = [i for i in range(n) if i == 0 or not (_is_word(lit[i - 1]) and _is_word(lit[i]))]
+        ends = [j for j in range(1, n + 1) if j == n or not (_is_word(lit[j - 1]) and _is_word(lit[j]))]
+        found = []
+        for i in starts:
+            for j in ends:
+                if j > i and lit[i:j] in by_literal:
+                    found.extend(by_literal[lit[i:j]])
+        return found
+
+    def spans(self, payload):
+        """(start, end) of every rule match in payload, in order."""
+        if self.regex is None or not payload:
+            return []
+        lowered = payload.lower()
+        if len(lowered) != len(payload):
+            return [(0, len(payload))]   # lower() moved the offsets; treat it all as matched
+        return [m.span() for m in self.regex.finditer(lowered)]
+
+    def classify(self, payload):
+        if not payload:
+            return {"severity": "low", "tags": [], "note": "empty"}
+        matched = set()
+        if self.regex is not None:
+            credits = self.credits
+            for m in self.regex.finditer(payload.lower()):
+                matched |= credits[m.group()]
+        rank, tags = 0, []
+        for rid in sorted(matched):
+            tag, r = self.rules[rid]
+            rank = max(rank, r)
+            if tag not in tags:
+                tags.append(tag)
+        for threshold, r in self.escalation:
+            if len(tags) >= threshold:
+                rank = max(rank, r)
+                break
+        severity = SEVERITIES[rank]
+        if severity == "critical":
+            note = f'ALERT: critical tokens ({",".join(tags)})'
+        elif severity == "high":
+            note = f'ALERT: suspicious tokens ({",".join(tags)})'
+        elif severity == "medium":
+            note = "Permission denied."
+        else:
+            note = "OK"
+        return {"severity": severity, "tags": tags, "note": note}
+
+
+class RuleEngine:
+    """Classifier bound to a rule-pack file, hot-reloaded on change."""
+
+    def __init__(self, path=RULES_FILE, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._pack = CompiledPack(DEFAULT_PACK)
+        self.reload()
+
+    def reload(self):
+        """Compile the pack at self.path (defaults if missing) and swap it in."""
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                mtime = None
+            if mtime is not None and mtime != self._mtime:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self._pack = CompiledPack(json.load(f))
+                    print(f"[*] Rule pack loaded from {self.path}: {len(self._pack.rules)} rules")
+                except (OSError, ValueError, TypeError, re.error) as e:
+                    print(f"[!] Rule pack {self.path} rejected, keeping previous rules: {e}")
+            elif mtime is None and self._mtime is not None:
+                self._pack = CompiledPack(DEFAULT_PACK)
+            self._mtime = mtime
+            self._checked = time.monotonic()
+
+    def classify(self, payload):
+        if time.monotonic() - self._checked >= self.check_interval:
+            self.reload()
+        return self._pack.classify(payload)
+
+    def spans(self, payload):
+        if time.monotonic() - self._checked >= self.check_interval:
+            self.reload()
+        return self._pack.spans(payload)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RuleEngine()
+    return _engine
+
+def classify(payload):
+    """Return {"severity", "tags", "note"} for payload using the shared engine."""
+    return get_engine().classify(payload)
+
+def rule_spans(payload):
+    """Where the shared engine's rules match payload, as (start, end) pairs."""
+    return get_engine().spans(payload)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--dump":
+        print(json.dumps(DEFAULT_PACK, indent=2))
+    else:
+        for arg in sys.argv[1:]:
+            print(arg, "->", classify(arg))
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+search.py
+
+Full-text search over captured payloads with SQLite FTS5.
+
+events_fts is an external-content FTS5 table over the events_text view
+(rowid = events.id; the payload text from the payloads table, or from
+events.payload for rows written before it, see payloads.py), so the text is
+stored once, outside the index. The write-behind writer
+calls index_range() inside every batch transaction with the id range it just
+inserted, the same way it feeds rollups.py. Payloads are tokenized with
+unicode61, so punctuation splits tokens: a host or URL is matched as a phrase
+(`wget "evil.example.com"` finds every wget to that host).
+
+Usage:
+    python search.py --rebuild          # (re)index every existing event
+    python search.py 'wget AND sh'      # ranked matches from the command line
+"""
+import sqlite3, time, argparse
+import payloads
+
+SNIPPET_TOKENS = 24             # tokens of context around each hit
+HIT_START, HIT_END = "\x02", "\x03"
+
+def ensure_schema(conn):
+    """Create the index (after payloads.ensure_schema, which creates its
+    content view). Returns True if it had to be (re)created, in which case
+    events written before now are not indexed until --rebuild."""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'events_fts'").fetchone()
+    if row and "events_text" in row[0]:
+        return False
+    if row:
+        # an index over events.payload, which interned events leave NULL
+        conn.execute("DROP TABLE events_fts")
+    conn.execute("""
+        CREATE VIRTUAL TABLE events_fts USING fts5(
+            payload, content='events_text', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 0'
+        )
+    """)
+    return True
+
+def index_range(conn, lo_id, hi_id):
+    """Index events with lo_id < id <= hi_id. Runs in the caller's transaction."""
+    conn.execute("""
+        INSERT INTO events_fts (rowid, payload)
+        SELECT id, payload FROM events_text WHERE id > ? AND id <= ? AND payload IS NOT NULL
+    """, (lo_id, hi_id))
+
+def rebuild(db_file):
+    conn = sqlite3.connect(db_file, timeout=30)
+    payloads.ensure_schema(conn)
+    ensure_schema(conn)
+    t0 = time.time()
+    with conn:
+        conn.execute("INSERT INTO events_fts (events_fts) VALUES ('rebuild')")
+    with conn:
+        conn.execute("INSERT INTO events_fts (events_fts) VALUES ('optimize')")
+    n = conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+    conn.close()
+    print(f"[+] Search index rebuilt for {n} events in {time.time() - t0:.1f}s")
+
+# ---------------- queries (dashboard) ----------------
+def quote_terms(query):
+    """Plain-text fallback for input that is not valid FTS5 syntax: every
+    whitespace-separated word becomes a quoted phrase (all must match); a
+    trailing * is kept as a prefix search."""
+    terms = []
+    for word in query.split():
+        prefix = word.endswith("*") and len(word) > 1
+        word = word.rstrip("*") if prefix else word
+        terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+def search(conn, query, limit=50, offset=0, where=(), params=()):
+    """Rank payloads matching query by bm25. where/params are extra clauses on
+    e (events) and s (sessions), as built by dashboard.filter_clauses.
+    Returns sqlite rows with the event columns plus `snippet`, whose hits are
+    wrapped in HIT_START/HIT_END."""
+    sql = f"""
+        SELECT e.id, e.session_id, e.ts_epoch, s.client_ip, s.client_port, s.country, s.campaign,
+               COALESCE(p.text, e.payload) AS payload, e.severity,
+               snippet(events_fts, 0, '{HIT_START}', '{HIT_END}', '…', {SNIPPET_TOKENS}) AS snippet
+        FROM events_fts
+        JOIN events e ON e.id = events_fts.rowid
+        LEFT JOIN payloads p ON p.id = e.payload_id
+        LEFT JOIN sessions s ON s.id = e.session_id
+        WHERE events_fts MATCH ? {"".join(" AND " + w for w in where)}
+        ORDER BY bm25(events_fts), e.id DESC
+        LIMIT ? OFFSET ?
+    """
+    try:
+        return conn.execute(sql, (query, *params, limit, offset)).fetchall()
+    except sqlite3.OperationalError:
+        # not FTS5 syntax (e.g. a bare URL): search for the words literally
+        return conn.execute(sql, (quote_terms(query), *params, limit, offset)).fetchall()
+
+if __name__ == "__main__":
+    from db import DB_FILE
+    parser = argparse.ArgumentParser(description="Maintain and query the payload search index")
+    parser.add_argument("query", nargs="?", help="FTS5 query, or plain words")
+    parser.add_argument("--db", default=DB_FILE, help="database file (default: %(default)s)")
+    parser.add_argument("--rebuild", action="store_true", help="index every existing event")
+    parser.add_argument("--limit", type=int, default=20, help="results to print (default: %(default)s)")
+    args = parser.parse_args()
+    if args.rebuild:
+        rebuild(args.db)
+    if args.query:
+        conn = sqlite3.connect(args.db)
+        conn.row_factory = sqlite3.Row
+        t0 = time.perf_counter()
+        rows = search(conn, args.query, args.limit)
+        for r in rows:
+            print(f"{r['id']:>10}  {r['snippet'].replace(HIT_START, '[').replace(HIT_END, ']')}")
+        print(f"[*] {len(rows)} results in {(time.perf_counter() - t0) * 1000:.1f} ms")
+        conn.close()
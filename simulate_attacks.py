@@ -3,25 +3,41 @@
 simulate_attacks.py
 
 Insert N fake sessions and events into hp_events.db to simulate
-remote attackers from different countries/IPs. Also creates transcript
-files and session FS zip files so the dashboard can download them.
+remote attackers from different countries/IPs. Also appends session
+transcripts to the segment store and creates session FS zip files so the
+dashboard can replay and download them.
 
 Usage:
     python simulate_attacks.py   # runs with defaults
     python simulate_attacks.py --n 10 --start-ip 203.0.113.1
+    python simulate_attacks.py --n 10 --no-artifacts
 
-This script only modifies local files (hp_events.db, transcripts/, sessions_fs/, geoip_cache.json).
+Bulk mode seeds large datasets for capacity testing: generation runs in
+parallel worker processes, one writer inserts in large transactions, and the
+same --seed and --start always produce the same rows. Session start times
+follow a diurnal curve over --days, and a share of sessions are bursty bots
+(hundreds of commands, sub-second apart, in waves from one /24). Chunks of a
+seed already in the database are skipped, so an interrupted run is resumed
+by running it again:
+    python simulate_attacks.py --bulk 5000000 --days 90 --seed 7
+    python simulate_attacks.py --bulk 5000000 --days 90 --seed 7 --start 1735689600
+    python simulate_attacks.py --bulk 50000000 --workers 8 --derived skip
+
+This script only modifies local files (hp_events.db, transcripts/, sessions_fs/, geoip_cache.jsonl).
 """
-import sqlite3, os, time, json, argparse, random, zipfile, shutil
+import sqlite3, os, time, json, argparse, random, shutil, math, multiprocessing
+from cache import open_store
+from db import ensure_schema, severity_code, to_epoch
+from writer import max_event_id, run_batch_hooks
+import transcripts, payloads
+from transcripts import Transcript
 
-BASE = os.path.dirname(__file__) or "."
+BASE = os.path.dirname(os.path.abspath(__file__))
 DB_FILE = os.path.join(BASE, "hp_events.db")
-TRANS_DIR = os.path.join(BASE, "transcripts")
+TRANS_DIR = transcripts.TRANSCRIPT_DIR  # segment store, see transcripts.py
 FS_DIR = os.path.join(BASE, "sessions_fs")
-GEO_CACHE = os.path.join(BASE, "geoip_cache.json")
-
-os.makedirs(TRANS_DIR, exist_ok=True)
-os.makedirs(FS_DIR, exist_ok=True)
+GEO_CACHE = os.path.join(BASE, "geoip_cache.jsonl")
+GEO_LEGACY = os.path.join(BASE, "geoip_cache.json")
 
 # small country list with flags for demo
 COUNTRIES = [
@@ -45,16 +61,12 @@ PAYLOADS = {
 }
 
 def load_geo_cache():
-    if os.path.exists(GEO_CACHE):
-        try:
-            return json.load(open(GEO_CACHE, "r"))
-        except Exception:
-            return {}
-    return {}
+    """Shared GeoIP store (same file and format as main.geoip_lookup)."""
+    return open_store(GEO_CACHE, legacy_json=GEO_LEGACY, maxsize=100000, ttl=7 * 86400)
 
 def save_geo_cache(j):
     try:
-        json.dump(j, open(GEO_CACHE, "w"), indent=2)
+        j.flush()
     except Exception:
         pass
 
@@ -78,36 +90,47 @@ def ensure_db():
         print("Database not found:", DB_FILE)
         print("Run `python -c \"import db; db.init_db()\"` first or start the dashboard once to init DB.")
         raise SystemExit(1)
+    conn = sqlite3.connect(DB_FILE)
+    ensure_schema(conn)
+    conn.close()
 
-def insert_session_and_events(ip, port, country, asn, n_events=3, start_ts=None):
+def insert_session_and_events(ip, port, country, asn, n_events=3, start_ts=None, artifacts=True):
     sid = f"sim-{ip.replace('.','-')}-{int(time.time())}-{random.randint(1000,9999)}"
     if start_ts is None:
         start_ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
     conn = sqlite3.connect(DB_FILE)
     cur = conn.cursor()
-    cur.execute("INSERT OR REPLACE INTO sessions (id, client_ip, client_port, start_ts, end_ts, r_dns, country, asn, notes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                (sid, ip, port, start_ts, None, f"simulated-{ip}.example", f"{country}", asn, "simulated session"))
+    cur.execute("INSERT OR REPLACE INTO sessions (id, client_ip, client_port, start_ts, end_ts, r_dns, country, asn, notes, start_epoch) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (sid, ip, port, start_ts, None, f"simulated-{ip}.example", f"{country}", asn, "simulated session", to_epoch(start_ts)))
     # create events list mixing severities
-    events = []
-    ts_base = int(time.time())
+    events, texts = [], []
+    ts_epoch = to_epoch(start_ts) or int(time.time())
     # Guarantee at least one low, one high, maybe one critical depending on random
     choices = ["low","low","low","high","critical"]
     for i in range(n_events):
         sev = random.choice(choices)
         payload = random.choice(PAYLOADS[sev])
-        ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts_base - random.randint(0, 3600)))
-        extra = json.dumps({"severity": sev})
-        events.append((sid, ts, "recv", payload, ",".join([]), extra))
-    cur.executemany("INSERT INTO events (session_id, ts, kind, payload, tags, extra_json) VALUES (?, ?, ?, ?, ?, ?)", events)
+        ts_epoch += 1 + int(random.expovariate(1 / HUMAN_GAP))   # commands follow the session start
+        ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts_epoch))
+        pid = payloads.payload_id(payload)
+        cur.execute(payloads.SEEN_SQL, payloads.row(pid, payload, {"severity": sev}, ts_epoch, ts_epoch))
+        events.append((sid, ts, "recv", pid, ts_epoch, severity_code(sev)))
+        texts.append(payload)
+    lo = max_event_id(conn)
+    cur.executemany(EVENT_SQL, events)
+    run_batch_hooks(conn, lo, max_event_id(conn))
+
+    if artifacts:
+        # append the transcript to the segment store (same layout as the live honeypot)
+        transcript = Transcript(sid)
+        for payload in texts:
+            transcript.recv(payload.encode() + b"\r\n")
+            transcript.send(b"OK\r\n")
+        transcripts.save(transcript, conn.execute)
     conn.commit()
     conn.close()
-
-    # write transcript
-    tpath = os.path.join(TRANS_DIR, f"{sid}.log")
-    with open(tpath, "w") as f:
-        for ev in events:
-            f.write(f"{ev[1]} RECV {ev[3]}\n")
-            f.write(f"{ev[1]} SEND OK\n")
+    if not artifacts:
+        return sid
     # create session fs zip
     sdir = os.path.join(FS_DIR, sid)
     try:
@@ -117,7 +140,7 @@ def insert_session_and_events(ip, port, country, asn, n_events=3, start_ts=None)
         # make small file to simulate /home/attacker/.ssh/id_rsa
         os.makedirs(os.path.join(sdir, "home"), exist_ok=True)
         with open(os.path.join(sdir, "home", "commands.txt"), "w") as f:
-            f.write("\n".join([e[3] for e in events]))
+            f.write("\n".join(texts))
         zipname = os.path.join(FS_DIR, f"{sid}.zip")
         # remove old zip if exists
         if os.path.exists(zipname):
@@ -127,8 +150,11 @@ def insert_session_and_events(ip, port, country, asn, n_events=3, start_ts=None)
         print("Warning: could not create session fs zip:", e)
     return sid
 
-def main(n=5, start_ip=None):
+def main(n=5, start_ip=None, artifacts=True):
     ensure_db()
+    if artifacts:
+        os.makedirs(TRANS_DIR, exist_ok=True)
+        os.makedirs(FS_DIR, exist_ok=True)
     geo = load_geo_cache()
     inserted = []
     for i in range(n):
@@ -139,18 +165,183 @@ def main(n=5, start_ip=None):
         display_country = f"{flag} {country_name}"
         # update geo cache
         geo[ip] = {"country": display_country, "asn": asn, "hostname": f"simhost-{ip}.example"}
-        sid = insert_session_and_events(ip, port, display_country, asn, n_events=random.randint(2,5))
+        sid = insert_session_and_events(ip, port, display_country, asn, n_events=random.randint(2,5), artifacts=artifacts)
         inserted.append((sid, ip, port, display_country, asn))
         print("Inserted simulated session:", sid, ip, port, display_country)
     save_geo_cache(geo)
     print(f"\nDone. Inserted {len(inserted)} fake sessions into {DB_FILE}.")
-    print("Transcripts directory:", TRANS_DIR)
-    print("Session FS zip files created under:", FS_DIR)
+    if artifacts:
+        print("Transcript segments:", TRANS_DIR)
+        print("Session FS zip files created under:", FS_DIR)
     print("Refresh your dashboard (login required) to view them.")
 
+# ==============================================
+# Bulk mode
+# ==============================================
+BULK_CHUNK = 200000        # events per generated chunk / write transaction
+BOT_SHARE = 0.15           # share of sessions that are bursty bots
+BOT_WAVES = 8              # bot waves per chunk (bots in a wave share a /24 and start together)
+HUMAN_GAP = 8.0            # mean seconds between a human's commands
+BOT_GAP = 0.3              # mean seconds between a bot's commands
+HUMAN_MIX = (("low", 70), ("high", 20), ("critical", 10))
+BOT_MIX = (("low", 20), ("high", 40), ("critical", 40))
+DOC_BLOCKS = ("203.0.113", "198.51.100", "192.0.2")   # documentation ranges only
+# relative attack volume per UTC hour: quiet around 02:00, peak around 14:00
+DIURNAL = [1 + 0.8 * math.sin(2 * math.pi * (h - 8) / 24) for h in range(24)]
+
+SESSION_SQL = ("INSERT OR REPLACE INTO sessions (id, client_ip, client_port, start_ts, end_ts, r_dns, country, asn, notes, "
+               "start_epoch, end_epoch) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+EVENT_SQL = "INSERT INTO events (session_id, ts, kind, payload_id, ts_epoch, severity) VALUES (?, ?, ?, ?, ?, ?)"
+
+def _iso(epoch):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(epoch))
+
+def diurnal_time(rnd, t_start, days):
+    """A start time in [t_start, t_start + days) weighted by DIURNAL."""
+    day = t_start // 86400 * 86400 + rnd.randrange(days) * 86400
+    hour = rnd.choices(range(24), DIURNAL)[0]
+    return max(t_start, day + hour * 3600 + rnd.randrange(3600))
+
+def generate_chunk(task):
+    """Rows for one chunk: (sessions, payloads, events, transcripts), with
+    one payloads upsert per distinct command. Depends only on the task
+    tuple, so a given seed always yields the same dataset."""
+    seed, index, n_events, t_start, days, with_transcripts = task
+    rnd = random.Random(seed * 1000003 + index)
+    sev_codes = {s: severity_code(s) for s in PAYLOADS}
+    pids = {p: payloads.payload_id(p) for ps in PAYLOADS.values() for p in ps}
+    seen = {}   # payload -> [severity, first epoch, last epoch, count]
+    waves = [(diurnal_time(rnd, t_start, days), rnd.choice(DOC_BLOCKS)) for _ in range(BOT_WAVES)]
+    sessions, events, frames = [], [], []
+    n = 0
+    while len(events) < n_events:
+        sid = f"bulk-{seed}-{index}-{n}"
+        n += 1
+        if rnd.random() < BOT_SHARE:
+            wave_start, block = rnd.choice(waves)
+            start = wave_start + int(rnd.expovariate(1 / 120))
+            ip = f"{block}.{rnd.randint(1, 254)}"
+            count, gap, mix = rnd.randint(50, 500), BOT_GAP, BOT_MIX
+        else:
+            start = diurnal_time(rnd, t_start, days)
+            ip = f"{rnd.choice(DOC_BLOCKS)}.{rnd.randint(1, 254)}"
+            count, gap, mix = rnd.randint(2, 12), HUMAN_GAP, HUMAN_MIX
+        count = min(count, n_events - len(events))
+        cc, name, flag = COUNTRIES[int(ip.split(".")[2]) % len(COUNTRIES)]
+        sevs = rnd.choices([s for s, _ in mix], [w for _, w in mix], k=count)
+        t = float(start)
+        lines = []
+        for sev in sevs:
+            t += rnd.expovariate(1 / gap)
+            payload = rnd.choice(PAYLOADS[sev])
+            epoch = int(t)
+            events.append((sid, _iso(epoch), "recv", pids[payload], epoch, sev_codes[sev]))
+            stats = seen.get(payload)
+            if stats is None:
+                seen[payload] = [sev, epoch, epoch, 1]
+            else:
+                stats[1], stats[2], stats[3] = min(stats[1], epoch), max(stats[2], epoch), stats[3] + 1
+            if with_transcripts:
+                lines.append(json.dumps({"t": round(t - start, 3), "d": "recv", "x": payload + "\r\n"}))
+                lines.append(json.dumps({"t": round(t - start, 3), "d": "send", "x": "OK\r\n"}))
+        end = int(t) + 1
+        asn = f"AS{64496 + int(ip.split('.')[2]) % 16} SimISP-{cc}"
+        sessions.append((sid, ip, rnd.randint(1025, 65500), _iso(start), _iso(end), f"simulated-{ip}.example",
+                         f"{flag} {name}", asn, "simulated bulk session", start, end))
+        if with_transcripts:
+            frames.append((sid, ("\n".join(lines) + "\n").encode("utf-8"), len(lines)))
+    rows = [payloads.row(pids[p], p, {"severity": sev}, first, last, count)
+            for p, (sev, first, last, count) in seen.items()]
+    return sessions, rows, events, frames
+
+def bulk_start(days):
+    """Default first epoch of a bulk run: UTC midnight `days` days back, so
+    runs on the same day line up without --start."""
+    return (int(time.time()) // 86400 - days) * 86400
+
+def bulk(n_events, seed=1, days=30, start=None, workers=None, chunk=BULK_CHUNK, derived="after",
+         with_transcripts=False):
+    """Insert n_events simulated events (plus their sessions) in chunked
+    transactions from a single writer, generated by `workers` processes.
+    Sessions start from epoch `start` (default: bulk_start(days)). A chunk
+    whose first session is already in the database is skipped."""
+    ensure_db()
+    workers = workers or os.cpu_count() or 1
+    t_start = bulk_start(days) if start is None else start
+    conn = sqlite3.connect(DB_FILE, timeout=60)
+    loaded = {r[0] for r in conn.execute("SELECT id FROM sessions WHERE id GLOB ?", (f"bulk-{seed}-*-0",))}
+    tasks = [(seed, i, min(chunk, n_events - i * chunk), t_start, days, with_transcripts)
+             for i in range(math.ceil(n_events / chunk)) if f"bulk-{seed}-{i}-0" not in loaded]
+    skipped = math.ceil(n_events / chunk) - len(tasks)
+    if skipped:
+        print(f"[!] Skipping {skipped} chunks of seed {seed} already in the database")
+    if not tasks:
+        conn.close()
+        print("[+] Nothing to insert")
+        return
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")       # a crashed seed run is simply re-run
+    conn.execute("PRAGMA cache_size=-262144")    # 256 MB page cache for index maintenance
+    conn.execute("PRAGMA temp_store=MEMORY")
+    store = transcripts.get_store() if with_transcripts else None
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    chunks = pool.imap(generate_chunk, tasks) if pool else map(generate_chunk, tasks)
+    total_events = total_sessions = 0
+    t0 = time.time()
+    print(f"[*] Generating {sum(t[2] for t in tasks):,} events in {len(tasks)} chunks with {workers} workers "
+          f"(seed {seed}, {days} days from --start {t_start})")
+    try:
+        for sessions, payload_rows, events, frames in chunks:
+            with conn:
+                lo = max_event_id(conn)
+                conn.executemany(SESSION_SQL, sessions)
+                conn.executemany(payloads.SEEN_SQL, payload_rows)
+                conn.executemany(EVENT_SQL, events)
+                if derived == "inline":
+                    run_batch_hooks(conn, lo, max_event_id(conn))
+                for sid, raw, records in frames:
+                    conn.execute(transcripts.INDEX_SQL, (sid, 0, *store.append(sid, raw), len(raw), records))
+            total_events += len(events)
+            total_sessions += len(sessions)
+            rate = total_events / (time.time() - t0)
+            print(f"  {total_events:,} events / {total_sessions:,} sessions ({rate * 60:,.0f} rows/min)", end="\r")
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    conn.close()
+    elapsed = time.time() - t0
+    print(f"[+] Inserted {total_events:,} events and {total_sessions:,} sessions in {elapsed:.1f}s "
+          f"({total_events / elapsed * 60:,.0f} events/min)" + " " * 10)
+    if derived == "after":
+        import rollups, search
+        rollups.backfill(DB_FILE)
+        search.rebuild(DB_FILE)
+    elif derived == "skip":
+        print("[!] Rollups, search index and campaigns not updated; run `python rollups.py --backfill`, "
+              "`python search.py --rebuild` and `python campaigns.py` when done seeding.")
+    if derived != "skip":
+        import campaigns
+        campaigns.cluster(DB_FILE)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Simulate attacker sessions/events in hp_events.db")
     parser.add_argument("--n", type=int, default=5, help="number of simulated sessions to create")
     parser.add_argument("--start-ip", type=str, default=None, help="optional start IP (e.g. 203.0.113.1)")
+    parser.add_argument("--no-artifacts", action="store_true", help="skip transcripts and session FS zips")
+    parser.add_argument("--bulk", type=int, metavar="EVENTS", help="bulk mode: insert this many events")
+    parser.add_argument("--seed", type=int, default=1, help="bulk: random seed (same seed, same data)")
+    parser.add_argument("--days", type=int, default=30, help="bulk: spread sessions over this many days")
+    parser.add_argument("--start", type=int, default=None, metavar="EPOCH",
+                        help="bulk: first session time (default: UTC midnight --days days ago)")
+    parser.add_argument("--workers", type=int, default=None, help="bulk: generator processes (default: CPU count)")
+    parser.add_argument("--chunk", type=int, default=BULK_CHUNK, help="bulk: events per transaction")
+    parser.add_argument("--derived", choices=["after", "inline", "skip"], default="after",
+                        help="bulk: rebuild rollups/search after the load, maintain them per chunk, or skip")
+    parser.add_argument("--transcripts", action="store_true", help="bulk: also write transcripts to the segment store")
     args = parser.parse_args()
-    main(n=args.n, start_ip=args.start_ip)
+    if args.bulk:
+        bulk(args.bulk, seed=args.seed, days=args.days, start=args.start, workers=args.workers, chunk=args.chunk,
+             derived=args.derived, with_transcripts=args.transcripts)
+    else:
+        main(n=args.n, start_ip=args.start_ip, artifacts=not args.no_artifacts)
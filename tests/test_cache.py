@@ -0,0 +1,28 @@
+# test_cache.py - TTL cache persistence shared between listener workers
+from cache import TTLCache
+
+
+def test_compaction_keeps_entries_other_processes_appended(tmp_path):
+    path = str(tmp_path / "geoip_cache.jsonl")
+    a = TTLCache(path=path)
+    b = TTLCache(path=path)              # a second worker on the same file
+    a.put("203.0.113.1", {"country": "NL"})
+    a.flush()
+    b.put("203.0.113.2", {"country": "US"})
+    b._lines_on_disk = 10 ** 6           # force b to compact instead of append
+    b.flush()
+    assert b._lines_on_disk == 2
+    fresh = TTLCache(path=path)
+    assert fresh.get("203.0.113.1") == {"country": "NL"}
+    assert fresh.get("203.0.113.2") == {"country": "US"}
+
+def test_newer_entry_wins_on_compaction(tmp_path):
+    path = str(tmp_path / "geoip_cache.jsonl")
+    a = TTLCache(path=path)
+    b = TTLCache(path=path)
+    b.put("k", "old", ttl=60)
+    a.put("k", "new", ttl=3600)
+    a.flush()
+    b._lines_on_disk = 10 ** 6
+    b.flush()
+    assert TTLCache(path=path).get("k") == "new"
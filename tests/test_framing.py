@@ -0,0 +1,38 @@
+# test_framing.py - line reassembly with a bounded buffer
+from framing import LineBuffer, decode_line
+
+
+def test_partial_lines_are_joined():
+    buf = LineBuffer()
+    assert buf.feed(b"wh") == []
+    assert buf.pending() == 2
+    assert buf.feed(b"oami\r\nun") == [b"whoami"]
+    assert buf.feed(b"ame -a\n") == [b"uname -a"]
+    assert buf.pending() == 0
+    assert buf.lines == 2
+
+def test_pipelined_commands_come_out_separately():
+    assert LineBuffer().feed(b"id\nls\r\n\npwd\n") == [b"id", b"ls", b"", b"pwd"]
+
+def test_oversize_line_is_truncated_and_the_rest_dropped():
+    buf = LineBuffer(max_line=8)
+    assert buf.feed(b"0123456789") == [b"01234567"]
+    assert buf.truncated == 1
+    assert buf.feed(b"abcdef" * 100) == []      # still discarding, nothing buffered
+    assert buf.pending() == 0
+    assert buf.feed(b"xyz\nid\n") == [b"id"]
+    assert buf.truncated == 1
+
+def test_line_of_exactly_max_line_is_kept():
+    buf = LineBuffer(max_line=4)
+    assert buf.feed(b"abcd\n") == [b"abcd"]
+    assert buf.truncated == 0
+
+def test_flush_returns_the_unterminated_tail():
+    buf = LineBuffer()
+    buf.feed(b"exit")
+    assert buf.flush() == [b"exit"]
+    assert buf.flush() == []
+
+def test_decode_line():
+    assert decode_line(b"  ls \xff-la ") == "ls -la"
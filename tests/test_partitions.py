@@ -0,0 +1,75 @@
+# test_partitions.py - moving old events into partition files and back
+import os, sqlite3
+
+import pytest
+
+import db, partitions, search
+
+DAY = 86400
+T0 = 1767225600            # 2026-01-01T00:00:00Z
+
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "hp_events.db")
+    monkeypatch.setattr(db, "DB_FILE", path)
+    db.init_db()
+    conn = sqlite3.connect(path)
+    for day in range(3):
+        sid = f"s{day}"
+        conn.execute("INSERT INTO sessions (id, client_ip, start_epoch, end_epoch) VALUES (?, ?, ?, ?)",
+                     (sid, f"203.0.113.{day + 1}", T0 + day * DAY, T0 + day * DAY + 60))
+        for i in range(5):
+            conn.execute("INSERT INTO events (session_id, kind, payload, ts_epoch, severity) VALUES (?, 'recv', ?, ?, 0)",
+                         (sid, f"echo day{day} n{i}", T0 + day * DAY + i))
+    conn.commit()
+    conn.close()
+    search.rebuild(path)
+    return path
+
+def count(path, sql="SELECT COUNT(*) FROM events", params=()):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql, params).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_archive_moves_whole_days(db_file):
+    assert partitions.archive(db_file, T0 + 2 * DAY + 3600, pause=0) == 10
+    assert count(db_file) == 5
+    assert count(db_file, "SELECT COUNT(*) FROM sessions") == 1
+    assert count(db_file, "SELECT COUNT(*) FROM events_fts WHERE events_fts MATCH 'day0'") == 0
+    parts = partitions.list_partitions(db_file)
+    assert [p.name for p in parts] == ["events-day-2026-01-02", "events-day-2026-01-01"]
+    for day, p in zip((1, 0), parts):
+        assert count(p.path, "SELECT COUNT(*) FROM events WHERE session_id = ?", (f"s{day}",)) == 5
+        assert count(p.path, "SELECT COUNT(*) FROM sessions") == 1
+    # reads fan out over the live database and the partitions, newest first
+    rows = db.fan_out("SELECT id, ts_epoch FROM events ORDER BY ts_epoch DESC, id DESC LIMIT ?", (), 12,
+                      db_file=db_file)
+    assert [r["ts_epoch"] for r in rows][:6] == [T0 + 2 * DAY + i for i in (4, 3, 2, 1, 0)] + [T0 + DAY + 4]
+    assert len(rows) == 12
+
+def test_move_range_is_resumable_and_can_delete(db_file):
+    conn = sqlite3.connect(db_file, isolation_level="IMMEDIATE")
+    path = partitions.partition_path(db_file, T0, "day")
+    assert partitions.move_range(conn, T0, T0 + DAY, path, batch=2, pause=0) == 5
+    assert partitions.move_range(conn, T0, T0 + DAY, path, batch=2, pause=0) == 0
+    assert partitions.move_range(conn, T0 + DAY, T0 + 2 * DAY, None, batch=2, pause=0) == 5
+    conn.close()
+    assert count(path) == 5
+    assert count(db_file) == 5
+    assert [p.name for p in partitions.list_partitions(db_file)] == ["events-day-2026-01-01"]
+
+def test_compress_and_restore(db_file):
+    partitions.archive(db_file, T0 + DAY, pause=0)
+    [p] = partitions.list_partitions(db_file)
+    partitions.compress(p)
+    [cold] = partitions.list_partitions(db_file)
+    assert cold.compressed and not os.path.exists(p.path)
+    assert partitions.overlapping(db_file) == []          # cold partitions are not queried
+    assert partitions.restore(db_file, "events-day-2026-01-01") == p.path
+    assert count(p.path) == 5
+    assert [q.compressed for q in partitions.list_partitions(db_file)] == [False]
+    assert partitions.restore(db_file, "events-day-2026-01-01") is None
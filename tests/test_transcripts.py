@@ -0,0 +1,34 @@
+# test_transcripts.py - transcripts written to the segment store in parts
+import sqlite3
+
+import transcripts
+from transcripts import SegmentStore, Transcript
+
+
+def test_long_session_is_flushed_in_parts(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    conn = sqlite3.connect(":memory:")
+    transcripts.ensure_schema(conn)
+    t = Transcript("s1", flush_bytes=256, store=store)
+    for n in range(50):
+        t.recv(f"echo {n}\r\n".encode())
+        t.send(b"OK\r\n")
+        assert t._buffered < 256                 # never more than one frame's worth in memory
+    t.note("closed")
+    rows = transcripts.save(t, conn.execute)
+    assert len(rows) == len(t.parts) > 1
+    assert t.records() == 101
+    records = transcripts.load(conn, "s1", str(tmp_path))
+    assert len(records) == 101
+    assert [r["x"] for r in records[:2]] == ["echo 0\r\n", "OK\r\n"]
+    assert records[-1] == {"t": records[-1]["t"], "d": "note", "x": "closed"}
+
+def test_index_from_before_parts_is_migrated():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""CREATE TABLE transcript_index (session_id TEXT PRIMARY KEY, segment TEXT NOT NULL,
+                    offset INTEGER NOT NULL, length INTEGER NOT NULL, raw_length INTEGER NOT NULL,
+                    records INTEGER NOT NULL)""")
+    conn.execute("INSERT INTO transcript_index VALUES ('s1', 'a.hpt', 0, 10, 20, 2)")
+    transcripts.ensure_schema(conn)
+    transcripts.ensure_schema(conn)
+    assert conn.execute("SELECT * FROM transcript_index").fetchall() == [("s1", 0, "a.hpt", 0, 10, 20, 2)]
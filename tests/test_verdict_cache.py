@@ -0,0 +1,43 @@
+# test_verdict_cache.py - verdict cache keys must not merge commands the rules tell apart
+import pytest
+import utils
+from rules import classify
+
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    """Remote mode with a memory-only cache and the rules standing in for the analyzer."""
+    calls = []
+
+    def fake(command):
+        calls.append(command)
+        return dict(classify(command), source="analyzer")
+
+    monkeypatch.setattr(utils, "ANALYZER_MODE", "remote")
+    monkeypatch.setattr(utils, "VERDICT_CACHE_FILE", None)
+    monkeypatch.setattr(utils, "_verdicts", None)
+    monkeypatch.setattr(utils, "_analyze_uncached", fake)
+    return calls
+
+
+@pytest.mark.parametrize("mask", [False, True])
+def test_commands_differing_in_a_number_keep_their_own_severity(analyzer, monkeypatch, mask):
+    monkeypatch.setattr(utils, "MASK_NUMBERS", mask)
+    assert utils.analyze_event("chmod 644 /tmp/x")["severity"] == "low"
+    assert utils.analyze_event("chmod 777 /tmp/x")["severity"] == "critical"
+    assert len(analyzer) == 2
+
+
+def test_masking_is_opt_in():
+    assert utils.normalize_payload("ping  -c 4 10.0.0.1") == "ping -c 4 10.0.0.1"
+
+
+def test_masking_skips_rule_matches():
+    assert utils.normalize_payload("chmod 644 /tmp/x", mask_numbers=True) == "chmod <n> /tmp/x"
+    assert utils.normalize_payload("chmod 777 /tmp/x", mask_numbers=True) == "chmod 777 /tmp/x"
+
+
+def test_repeats_hit_the_cache(analyzer):
+    utils.analyze_event("uname -a")
+    utils.analyze_event("uname   -a")
+    assert analyzer == ["uname -a"]
@@ -0,0 +1,109 @@
+# test_writer.py - write-behind batching and full-queue policies
+import queue, sqlite3, threading, time
+
+import pytest
+
+from writer import EventWriter, RemoteWriter
+
+INSERT = "INSERT INTO t (n) VALUES (?)"
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    path = str(tmp_path / "w.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (n INTEGER)")
+    conn.close()
+    return path
+
+def rows(db_file):
+    conn = sqlite3.connect(db_file)
+    try:
+        return [r[0] for r in conn.execute("SELECT n FROM t ORDER BY rowid")]
+    finally:
+        conn.close()
+
+def stalled(db_file, **kwargs):
+    """A writer whose thread has not started yet, so its queue only fills."""
+    w = EventWriter(db_file, max_queue=2, **kwargs)
+    w._thread = threading.Thread(target=lambda: None)   # keeps submit() from starting it
+    return w
+
+
+def test_rows_are_committed_in_batches(db_file):
+    w = EventWriter(db_file, batch_size=4, flush_interval=1.0).start()
+    for n in range(10):
+        assert w.submit(INSERT, (n,))
+    assert w.flush(5)
+    w.stop()
+    assert rows(db_file) == list(range(10))
+    assert w.stats["written"] == 10
+    assert w.stats["batches"] == 3      # 4 + 4 + 2
+
+def test_bad_row_does_not_cost_the_batch(db_file):
+    w = EventWriter(db_file, flush_interval=1.0).start()
+    w.submit(INSERT, (1,))
+    w.submit("INSERT INTO missing (n) VALUES (?)", (2,))
+    w.submit(INSERT, (3,))
+    w.stop()
+    assert rows(db_file) == [1, 3]
+    assert w.stats["errors"] == 1
+
+def test_drop_new_keeps_the_queued_rows(db_file):
+    w = stalled(db_file, policy="drop_new")
+    assert w.submit(INSERT, (1,)) and w.submit(INSERT, (2,))
+    assert not w.submit(INSERT, (3,))
+    assert w.stats["dropped"] == 1
+    w.start()
+    w.stop()
+    assert rows(db_file) == [1, 2]
+
+def test_drop_oldest_makes_room(db_file):
+    w = stalled(db_file, policy="drop_oldest")
+    for n in (1, 2, 3):
+        assert w.submit(INSERT, (n,))
+    assert w.stats["dropped"] == 1
+    w.start()
+    w.stop()
+    assert rows(db_file) == [2, 3]
+
+def test_block_waits_then_drops(db_file):
+    w = stalled(db_file, policy="block", block_timeout=0.2)
+    w.submit(INSERT, (1,))
+    w.submit(INSERT, (2,))
+    t0 = time.monotonic()
+    assert not w.submit(INSERT, (3,))
+    assert time.monotonic() - t0 >= 0.2
+    assert w.stats["dropped"] == 1
+
+def test_block_gets_room_once_the_writer_drains(db_file):
+    w = stalled(db_file, policy="block", block_timeout=5.0)
+    w.submit(INSERT, (1,))
+    w.submit(INSERT, (2,))
+    threading.Timer(0.1, w.start).start()
+    assert w.submit(INSERT, (3,))
+    w.stop()
+    assert rows(db_file) == [1, 2, 3]
+
+def test_unknown_policy_is_rejected(db_file):
+    with pytest.raises(ValueError):
+        EventWriter(db_file, policy="spill")
+
+def test_non_blocking_submit_never_waits(db_file):
+    w = stalled(db_file, policy="block", block_timeout=5.0)
+    w.submit(INSERT, (1,))
+    w.submit(INSERT, (2,))
+    t0 = time.monotonic()
+    assert not w.submit(INSERT, (3,), block=False)
+    assert time.monotonic() - t0 < 1.0
+    assert w.stats["dropped"] == 1
+
+def test_remote_writer_drops_a_batch_instead_of_waiting():
+    channel = queue.Queue(maxsize=1)
+    channel.put([])
+    w = RemoteWriter(channel, batch_size=2, flush_interval=60, block_timeout=5.0)
+    assert w.submit(INSERT, (1,), block=False)      # buffered, nothing shipped yet
+    t0 = time.monotonic()
+    assert not w.submit(INSERT, (2,), block=False)
+    assert time.monotonic() - t0 < 1.0
+    assert w.stats["dropped"] == 2
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+transcripts.py
+
+Session transcripts (every RECV/SEND chunk with its timing), stored as
+compressed frames appended to a few large segment files instead of one file
+per session.
+
+A running session buffers at most FLUSH_BYTES of records in memory. Each
+time the buffer fills, and once more when the session ends, it is compressed
+with zlib into one frame and appended to the current segment,
+transcripts/<epoch>-<pid>.hpt, which rolls over at SEGMENT_MAX bytes. A long
+session is therefore several frames (parts), interleaved with other
+sessions'; MAX_BYTES caps what one session records in total. Each process
+writes its own segments, so listener workers never interleave.
+
+Frame layout: MAGIC, session id length (u16), payload length (u32), session
+id, zlib data. The transcript_index table maps (session id, part) to
+(segment, offset, length), so one transcript is read through mmap, frame by
+frame, without touching the rest of the segment; the frame headers also let
+a segment be scanned without the index (see scan()).
+
+Decompressed, a transcript is NDJSON: {"t": seconds since connect,
+"d": "recv" | "send" | "note", "x": text}.
+
+Usage:
+    python transcripts.py <session_id>        # print one transcript
+    python transcripts.py --scan <segment>    # list the frames in a segment
+"""
+import os, json, zlib, struct, mmap, threading, time, argparse
+
+TRANSCRIPT_DIR = os.path.join(os.path.dirname(__file__), "transcripts")
+SEGMENT_MAX = 64 * 1024 * 1024   # roll to a new segment file past this size
+MAX_BYTES = 1024 * 1024          # per-session transcript cap (raw data)
+FLUSH_BYTES = 64 * 1024          # records buffered per session before a frame is written
+COMPRESS_LEVEL = 6
+
+MAGIC = b"HPT1"
+HEADER = struct.Struct(">4sHI")
+INDEX_SQL = """INSERT OR REPLACE INTO transcript_index
+    (session_id, part, segment, offset, length, raw_length, records) VALUES (?, ?, ?, ?, ?, ?, ?)"""
+
+
+def ensure_schema(conn):
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(transcript_index)")}
+    old = columns and "part" not in columns     # one frame per session, keyed on session_id
+    if old:
+        conn.execute("ALTER TABLE transcript_index RENAME TO transcript_index_v1")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS transcript_index (
+            session_id TEXT NOT NULL,
+            part INTEGER NOT NULL,
+            segment TEXT NOT NULL,
+            offset INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            raw_length INTEGER NOT NULL,
+            records INTEGER NOT NULL,
+            PRIMARY KEY (session_id, part)
+        )
+    """)
+    if old:
+        conn.execute("""INSERT INTO transcript_index
+            SELECT session_id, 0, segment, offset, length, raw_length, records FROM transcript_index_v1""")
+        conn.execute("DROP TABLE transcript_index_v1")
+
+
+class Transcript:
+    """Recorder for one live session (used by its handler only). Buffered
+    records go to the segment store as a frame every flush_bytes."""
+
+    def __init__(self, session_id, max_bytes=MAX_BYTES, flush_bytes=FLUSH_BYTES, store=None):
+        self.session_id = session_id
+        self.max_bytes = max_bytes
+        self.flush_bytes = flush_bytes
+        self.started = time.monotonic()
+        self.size = 0
+        self.truncated = False
+        self.parts = []          # (segment, offset, length, raw_length, records) of written frames
+        self._store = store
+        self._lines = []
+        self._buffered = 0
+
+    def recv(self, data):
+        self._add("recv", data)
+
+    def send(self, data):
+        self._add("send", data)
+
+    def note(self, text):
+        self._append(self._encode("note", text))
+
+    def _add(self, direction, data):
+        if self.truncated:
+            return
+        if self.size + len(data) > self.max_bytes:
+            self.truncated = True
+            self.note(f"transcript truncated at {self.max_bytes} bytes")
+            return
+        self.size += len(data)
+        # surrogateescape keeps non-UTF-8 bytes recoverable through JSON
+        self._append(self._encode(direction, data.decode("utf-8", "surrogateescape")))
+
+    def _encode(self, direction, text):
+        t = round(time.monotonic() - self.started, 3)
+        return json.dumps({"t": t, "d": direction, "x": text})
+
+    def _append(self, line):
+        self._lines.append(line)
+        self._buffered += len(line) + 1
+        if self._buffered >= self.flush_bytes:
+            self.flush()
+
+    def records(self):
+        return sum(p[4] for p in self.parts) + len(self._lines)
+
+    def encode(self):
+        """The buffered records, not yet written."""
+        return ("\n".join(self._lines) + "\n").encode("utf-8") if self._lines else b""
+
+    def flush(self):
+        """Append the buffered records to the store as one frame."""
+        raw = self.encode()
+        if not raw:
+            return
+        segment, offset, length = (self._store or get_store()).append(self.session_id, raw)
+        self.parts.append((segment, offset, length, len(raw), len(self._lines)))
+        self._lines, self._buffered = [], 0
+
+
+class SegmentStore:
+    """Appends compressed transcript frames to rolling segment files."""
+
+    def __init__(self, directory=TRANSCRIPT_DIR, segment_max=SEGMENT_MAX):
+        self.directory = directory
+        self.segment_max = segment_max
+        self._lock = threading.Lock()
+        self._file = None
+        self._name = None
+
+    def _roll(self):
+        if self._file:
+            self._file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self._name = f"{int(time.time())}-{os.getpid()}.hpt"
+        self._file = open(os.path.join(self.directory, self._name), "ab")
+
+    def append(self, session_id, raw):
+        """Write one frame; returns (segment, offset, length)."""
+        sid = session_id.encode("utf-8")
+        body = zlib.compress(raw, COMPRESS_LEVEL)
+        frame = HEADER.pack(MAGIC, len(sid), len(body)) + sid + body
+        with self._lock:
+            if self._file is None or self._file.tell() + len(frame) > self.segment_max:
+                self._roll()
+            offset = self._file.tell()
+            self._file.write(frame)
+            self._file.flush()
+            return self._name, offset, len(frame)
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None or _store.directory != TRANSCRIPT_DIR:
+            _store = SegmentStore(TRANSCRIPT_DIR)
+        return _store
+
+def save(transcript, submit):
+    """Write the rest of a finished session's transcript and record its index
+    rows with submit(sql, params): a writer's submit, or a connection's execute."""
+    transcript.flush()
+    rows = [(transcript.session_id, part, *p) for part, p in enumerate(transcript.parts)]
+    for row in rows:
+        submit(INDEX_SQL, row)
+    return rows
+
+
+# ---------------- reading ----------------
+def read_frame(path, offset):
+    """(session_id, raw transcript bytes) for the frame at offset, via mmap:
+    only that frame's pages are read and decompressed."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic, sid_len, body_len = HEADER.unpack_from(mm, offset)
+        if magic != MAGIC:
+            raise ValueError(f"no transcript frame at {path}:{offset}")
+        start = offset + HEADER.size
+        sid = mm[start:start + sid_len].decode("utf-8")
+        body = mm[start + sid_len:start + sid_len + body_len]
+    return sid, zlib.decompress(body)
+
+def load(conn, session_id, directory=None):
+    """Parsed records of one session's transcript, or None if it has none."""
+    rows = conn.execute("SELECT segment, offset FROM transcript_index WHERE session_id = ? ORDER BY part",
+                        (session_id,)).fetchall()
+    if not rows:
+        return None
+    records = []
+    for segment, offset in rows:
+        sid, raw = read_frame(os.path.join(directory or TRANSCRIPT_DIR, segment), offset)
+        if sid != session_id:
+            raise ValueError(f"index points at the transcript of {sid}, not {session_id}")
+        records.extend(parse(raw))
+    return records
+
+def parse(raw):
+    return [json.loads(line) for line in raw.decode("utf-8").splitlines() if line]
+
+def record_bytes(record):
+    return record["x"].encode("utf-8", "surrogateescape")
+
+def to_text(records):
+    """Plain-text rendering, one line per record: '+0.123s RECV ls -la'."""
+    out = []
+    for r in records:
+        text = record_bytes(r).decode("utf-8", "replace").rstrip("\r\n")
+        out.append(f"+{r['t']:.3f}s {r['d'].upper()} {text}")
+    return "\n".join(out) + "\n"
+
+def scan(path):
+    """Yield (offset, length, session_id) for every frame in a segment."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        offset = 0
+        while offset + HEADER.size <= len(mm):
+            magic, sid_len, body_len = HEADER.unpack_from(mm, offset)
+            if magic != MAGIC:
+                break
+            start = offset + HEADER.size
+            length = HEADER.size + sid_len + body_len
+            yield offset, length, mm[start:start + sid_len].decode("utf-8")
+            offset += length
+
+
+if __name__ == "__main__":
+    import sqlite3
+    from db import DB_FILE
+    parser = argparse.ArgumentParser(description="Read session transcripts from the segment store")
+    parser.add_argument("session_id", nargs="?", help="session to print")
+    parser.add_argument("--db", default=DB_FILE, help="database file (default: %(default)s)")
+    parser.add_argument("--dir", default=TRANSCRIPT_DIR, help="segment directory (default: %(default)s)")
+    parser.add_argument("--scan", metavar="SEGMENT", help="list the frames of a segment file")
+    args = parser.parse_args()
+    if args.scan:
+        for offset, length, sid in scan(args.scan):
+            print(f"{offset:>12} {length:>8}  {sid}")
+    if args.session_id:
+        conn = sqlite3.connect(args.db)
+        records = load(conn, args.session_id, args.dir)
+        conn.close()
+        if records is None:
+            print("No transcript for", args.session_id)
+            raise SystemExit(1)
+        print(to_text(records), end="")
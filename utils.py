@@ -1,36 +1,269 @@
 # utils.py - Analyzer that calls external REST API and falls back to keyword rules
-import requests, json, re
+import requests, threading, queue, time, asyncio, re
+from concurrent.futures import Future
+from requests.adapters import HTTPAdapter
+from rules import classify, rule_spans
+from cache import TTLCache, open_store
+import metrics
 ANALYZER_URL = "http://127.0.0.1:9000/analyze"
+ANALYZER_BATCH_URL = "http://127.0.0.1:9000/analyze_batch"
 TIMEOUT = 2.0
 
-KEYWORDS = ['sudo','rm','wget','curl','nc','bash','root','ssh','passwd','nmap','exploit','docker']
+ANALYZER_MODE = "remote"    # "remote" (analyzer with local fallback) or "local" (rules only)
+BATCHING = True             # coalesce in-flight commands into /analyze_batch requests
+BATCH_MAX = 64              # commands per batch request
+BATCH_WINDOW = 0.005        # seconds to wait for more commands before sending
+BATCH_SENDERS = 4           # batch requests allowed in flight at once
+POOL_SIZE = 16              # pooled keep-alive connections to the analyzer
+BREAKER_THRESHOLD = 3       # consecutive failures before the circuit opens
+BREAKER_RESET = 10.0        # seconds before an open circuit lets a probe through
+
+VERDICT_CACHE_SIZE = 50000  # distinct normalized payloads kept in memory
+VERDICT_TTL = 86400         # analyzer verdicts
+FALLBACK_TTL = 60           # local-rule verdicts issued while the analyzer was down
+VERDICT_CACHE_FILE = "verdict_cache.jsonl"  # None = memory only
+MASK_URLS = False           # opt-in: normalize URLs to <url> before keying the cache
+MASK_IPS = False            # opt-in: normalize IPv4 addresses to <ip>
+MASK_NUMBERS = False        # opt-in: normalize standalone numbers to <n>
+
+ANALYZER_SECONDS = metrics.Histogram("hp_analyzer_seconds", "Verdicts for commands not in the verdict cache, by source",
+                                     ["source"])
 
 def _fallback(command: str):
-    if not command:
-        return {'severity':'low','tags':[],'note':'empty'}
-    txt = command.lower()
-    tags = [k for k in KEYWORDS if re.search(r"\b" + re.escape(k) + r"\b", txt)]
-    score = len(tags)
-    if score >= 3:
-        severity = 'critical'; note = f'ALERT: critical tokens ({",".join(tags)})'
-    elif score == 2:
-        severity = 'high'; note = f'ALERT: suspicious tokens ({",".join(tags)})'
-    elif score == 1:
-        severity = 'medium'; note = 'Permission denied.'
-    else:
-        severity = 'low'; note = 'OK'
-    return {'severity': severity, 'tags': tags, 'note': note}
+    """Local verdict when the analyzer is unreachable (see rules.py)."""
+    verdict = classify(command)
+    verdict['source'] = 'rules'
+    return verdict
 
-def analyze_event(command: str):
+def _verdict(j):
+    return {
+        'severity': j.get('severity', 'low'),
+        'tags': j.get('tags', []),
+        'note': j.get('note', str(j)),
+        'source': 'analyzer'
+    }
+
+# ==============================================
+# Pooled HTTP session
+# ==============================================
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=POOL_SIZE))
+
+# ==============================================
+# Circuit breaker
+# ==============================================
+class CircuitBreaker:
+    """closed -> (threshold failures) -> open -> (reset_timeout) -> half-open.
+    While open every call goes straight to the local fallback; in half-open a
+    single probe request decides whether to close again or re-open."""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half-open"
+            if self.state == "half-open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half-open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    print(f"[!] Analyzer unhealthy, using local rules for {self.reset_timeout:.0f}s")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+_breaker = CircuitBreaker()
+
+# ==============================================
+# Micro-batching
+# ==============================================
+class AnalyzerBatcher:
+    """Collects commands from concurrent callers and sends them to the
+    analyzer's batch route, up to BATCH_MAX per request. Every submitted
+    Future resolves to a verdict: the analyzer's, or the local fallback."""
+
+    def __init__(self, url=ANALYZER_BATCH_URL, max_batch=BATCH_MAX, window=BATCH_WINDOW, senders=BATCH_SENDERS):
+        self.url = url
+        self.max_batch = max_batch
+        self.window = window
+        self._queue = queue.Queue()
+        for i in range(senders):
+            threading.Thread(target=self._run, name=f"hp-analyzer-{i}", daemon=True).start()
+
+    def submit(self, command):
+        fut = Future()
+        self._queue.put((command, fut))
+        return fut
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get_nowait() if remaining <= 0 else self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._send(batch)
+
+    def _send(self, batch):
+        try:
+            resp = _session.post(self.url, json={'inputs': [c for c, _ in batch]}, timeout=TIMEOUT)
+            results = resp.json().get('results', []) if resp.status_code == 200 else []
+            if len(results) != len(batch):
+                raise ValueError(f"analyzer returned {len(results)} results for {len(batch)} inputs")
+            _breaker.record_success()
+            for (_, fut), j in zip(batch, results):
+                fut.set_result(_verdict(j))
+        except Exception:
+            _breaker.record_failure()
+            for command, fut in batch:
+                fut.set_result(_fallback(command))
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def _get_batcher():
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = AnalyzerBatcher()
+    return _batcher
+
+# ==============================================
+# Verdict cache
+# ==============================================
+_URL_RE = re.compile(r"\b(?:https?|ftp|tftp)://\S+", re.IGNORECASE)
+_IP_RE = re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b")
+_NUM_RE = re.compile(r"\b\d+\b")
+
+def normalize_payload(command, mask_urls=None, mask_ips=None, mask_numbers=None):
+    """Cache key for a command: whitespace collapsed and, optionally, URLs,
+    IPv4 addresses and numbers replaced by placeholders, so droppers that only
+    rotate their download URL share one verdict. Text a rule matches is never
+    masked: "chmod 777" must not share a key (and a verdict) with "chmod 644"."""
+    key = " ".join(command.split())
+    masks = [(regex, repl) for regex, repl, on, default in ((_URL_RE, "<url>", mask_urls, MASK_URLS),
+                                                            (_IP_RE, "<ip>", mask_ips, MASK_IPS),
+                                                            (_NUM_RE, "<n>", mask_numbers, MASK_NUMBERS))
+             if (default if on is None else on)]
+    if not masks:
+        return key
+    parts, pos = [], 0
+    for start, end in rule_spans(key) + [(len(key), len(key))]:
+        text = key[pos:start]
+        for regex, repl in masks:
+            text = regex.sub(repl, text)
+        parts.append(text + key[start:end])
+        pos = end
+    return "".join(parts)
+
+def _verdict_ttl(verdict):
+    return VERDICT_TTL if verdict.get('source') == 'analyzer' else FALLBACK_TTL
+
+_verdicts = None
+_verdicts_lock = threading.Lock()
+
+def get_verdict_cache():
+    global _verdicts
+    if _verdicts is None:
+        with _verdicts_lock:
+            if _verdicts is None:
+                if VERDICT_CACHE_FILE:
+                    _verdicts = open_store(VERDICT_CACHE_FILE, maxsize=VERDICT_CACHE_SIZE, ttl=VERDICT_TTL)
+                else:
+                    _verdicts = TTLCache(maxsize=VERDICT_CACHE_SIZE, ttl=VERDICT_TTL)
+    return _verdicts
+
+def verdict_cache_stats():
+    """Counters plus hit rate, e.g. for a status line or metrics."""
+    c = get_verdict_cache()
+    return dict(c.stats, size=len(c), hit_rate=round(c.hit_rate(), 4))
+
+def collect_metrics():
+    stats = verdict_cache_stats() if ANALYZER_MODE != "local" else {}
+    counters = [({"result": k}, stats[k]) for k in ("hits", "misses", "coalesced", "evictions") if k in stats]
+    return [("hp_verdict_cache_total", "counter", "Verdict cache lookups by result", counters),
+            ("hp_verdict_cache_entries", "gauge", "Verdicts held in memory", [({}, stats.get("size", 0))]),
+            ("hp_analyzer_circuit_open", "gauge", "1 while the analyzer circuit breaker is not closed",
+             [({}, int(_breaker.state != "closed"))])]
+
+metrics.register_collector(collect_metrics)
+
+# ==============================================
+# Public API
+# ==============================================
+def _analyze_single(command):
     try:
-        resp = requests.post(ANALYZER_URL, json={'input': command}, timeout=TIMEOUT)
+        resp = _session.post(ANALYZER_URL, json={'input': command}, timeout=TIMEOUT)
         if resp.status_code == 200:
-            j = resp.json()
-            return {
-                'severity': j.get('severity', 'low'),
-                'tags': j.get('tags', []),
-                'note': j.get('note', str(j))
-            }
+            verdict = _verdict(resp.json())
+            _breaker.record_success()
+            return verdict
     except Exception:
         pass
+    _breaker.record_failure()
     return _fallback(command)
+
+def _analyze_uncached(command):
+    t0 = time.perf_counter()
+    if not _breaker.allow():
+        verdict = _fallback(command)
+    elif not BATCHING:
+        verdict = _analyze_single(command)
+    else:
+        verdict = _get_batcher().submit(command).result()
+    ANALYZER_SECONDS.labels(verdict['source']).observe(time.perf_counter() - t0)
+    return verdict
+
+def analyze_event(command: str):
+    if ANALYZER_MODE == "local":
+        return _fallback(command)
+    # concurrent misses for the same normalized payload share one analysis
+    return get_verdict_cache().get_or_load(normalize_payload(command),
+                                           lambda _key: _analyze_uncached(command),
+                                           ttl_for=_verdict_ttl)
+
+async def analyze_event_async(command: str):
+    """Event-loop variant of analyze_event: waits on the batch without
+    tying up an executor thread."""
+    if ANALYZER_MODE == "local":
+        return _fallback(command)
+    cache = get_verdict_cache()
+    key = normalize_payload(command)
+    verdict = cache.get(key)
+    if verdict is not None:
+        return verdict
+    t0 = time.perf_counter()
+    if not _breaker.allow():
+        verdict = _fallback(command)
+    elif not BATCHING:
+        verdict = await asyncio.get_running_loop().run_in_executor(None, _analyze_single, command)
+    else:
+        verdict = await asyncio.wrap_future(_get_batcher().submit(command))
+    ANALYZER_SECONDS.labels(verdict['source']).observe(time.perf_counter() - t0)
+    cache.put(key, verdict, _verdict_ttl(verdict))
+    return verdict
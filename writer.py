@@ -0,0 +1,332 @@
+# writer.py - write-behind SQLite stage: one thread, one connection, batched commits
+import sqlite3, threading, queue, time, itertools, atexit, os
+import metrics
+
+BATCH_SIZE = 500        # max rows per transaction
+FLUSH_INTERVAL = 0.25   # max seconds a row waits for its batch to fill
+MAX_QUEUE = 10000       # bounded queue between connection handlers and the writer
+QUEUE_POLICY = "block"  # "block" (backpressure), "drop_new" or "drop_oldest"
+BLOCK_TIMEOUT = 1.0     # "block" policy: seconds to wait for room before dropping
+SYNCHRONOUS = "NORMAL"  # WAL + NORMAL: durable on commit except across power loss
+
+POLICIES = ("block", "drop_new", "drop_oldest")
+_STOP = object()
+
+DB_INSERT_SECONDS = metrics.Histogram("hp_db_insert_seconds", "Statements and batch hooks of one writer transaction")
+DB_COMMIT_SECONDS = metrics.Histogram("hp_db_commit_seconds", "COMMIT of one writer transaction")
+DB_BATCH_ROWS = metrics.Histogram("hp_db_batch_rows", "Statements per writer transaction",
+                                  buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+# fn(conn, lo_id, hi_id), run inside each batch transaction that inserted rows
+# into `events` (ids lo_id < id <= hi_id); used for derived tables such as
+# the dashboard rollups.
+BATCH_HOOKS = []
+
+def register_batch_hook(fn):
+    if fn not in BATCH_HOOKS:
+        BATCH_HOOKS.append(fn)
+
+def max_event_id(conn):
+    try:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+
+def run_batch_hooks(conn, lo_id, hi_id):
+    """Apply every registered hook to a freshly inserted id range. Callers
+    that insert events outside the writer (e.g. the simulator) call this in
+    their own transaction."""
+    if lo_id is None or hi_id is None or hi_id <= lo_id:
+        return
+    for hook in BATCH_HOOKS:
+        hook(conn, lo_id, hi_id)
+
+
+class EventWriter:
+    """Single consumer of a bounded queue of (sql, params) statements.
+
+    Producers call submit() and return immediately; the writer thread groups
+    whatever is queued into one transaction (up to batch_size rows, or
+    flush_interval seconds) and runs consecutive statements with the same SQL
+    through executemany. Only this thread ever touches its connection."""
+
+    def __init__(self, db_file, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_queue=MAX_QUEUE, policy=QUEUE_POLICY, block_timeout=BLOCK_TIMEOUT,
+                 synchronous=SYNCHRONOUS):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown queue policy {policy!r}, expected one of {POLICIES}")
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.synchronous = synchronous
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {"submitted": 0, "written": 0, "dropped": 0, "batches": 0, "errors": 0}
+
+    # ---------------- producer side ----------------
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="hp-writer", daemon=True)
+                self._thread.start()
+        return self
+
+    def submit(self, sql, params=(), block=True):
+        """Queue one statement. Returns False if the row was dropped.
+        block=False never waits, whatever the policy (for callers on an
+        event loop): with "block", a full queue then drops the row."""
+        if self._thread is None:
+            self.start()
+        item = (sql, params)
+        try:
+            if self.policy == "block" and block:
+                self._queue.put(item, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            if self.policy != "drop_oldest":
+                self.stats["dropped"] += 1
+                return False
+            # make room by discarding the oldest queued statement
+            try:
+                self._queue.get_nowait()
+                self.stats["dropped"] += 1
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.stats["dropped"] += 1
+                return False
+        self.stats["submitted"] += 1
+        return True
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def flush(self, timeout=None):
+        """Block until everything queued before this call is committed."""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def stop(self, timeout=10.0):
+        """Commit whatever is queued and stop the writer thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    # ---------------- writer thread ----------------
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                item = self._queue.get()
+                batch, markers, stop = [], [], False
+                deadline = time.monotonic() + self.flush_interval
+                while True:
+                    if item is _STOP:
+                        stop = True
+                        break
+                    if isinstance(item, threading.Event):
+                        markers.append(item)
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    remaining = deadline - time.monotonic()
+                    try:
+                        item = self._queue.get_nowait() if remaining <= 0 else self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                if batch:
+                    self._write(conn, batch)
+                for m in markers:
+                    m.set()
+                if stop:
+                    self._drain(conn)
+                    break
+        finally:
+            conn.close()
+
+    def _drain(self, conn):
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is not _STOP:
+                batch.append(item)
+        for i in range(0, len(batch), self.batch_size):
+            self._write(conn, batch[i:i + self.batch_size])
+
+    def _commit(self, conn, batch, hooks=True):
+        t0 = time.perf_counter()
+        with conn:
+            lo = max_event_id(conn) if hooks and BATCH_HOOKS else None
+            for sql, group in itertools.groupby(batch, key=lambda it: it[0]):
+                conn.executemany(sql, [params for _, params in group])
+            if lo is not None:
+                run_batch_hooks(conn, lo, max_event_id(conn))
+            t1 = time.perf_counter()
+        DB_INSERT_SECONDS.observe(t1 - t0)
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - t1)
+        DB_BATCH_ROWS.observe(len(batch))
+
+    def _write(self, conn, batch):
+        try:
+            self._commit(conn, batch)
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
+        except Exception as e:
+            # one bad row must not cost the whole batch: retry row by row,
+            # and keep the row even if a derived-table hook keeps failing
+            print(f"[DB ERROR] batch of {len(batch)} failed ({e}); retrying individually")
+            for item in batch:
+                try:
+                    try:
+                        self._commit(conn, [item])
+                    except sqlite3.Error:
+                        self._commit(conn, [item], hooks=False)
+                    self.stats["written"] += 1
+                except Exception as row_err:
+                    self.stats["errors"] += 1
+                    print(f"[DB ERROR] {row_err}")
+
+
+class RemoteWriter:
+    """EventWriter stand-in for listener worker processes (main.py --workers).
+
+    Statements are buffered locally and shipped as lists over a
+    multiprocessing queue to the supervisor, where serve_remote() hands them
+    to the one real EventWriter, so SQLite only ever sees a single writer.
+    flush() only guarantees the rows have left this process."""
+
+    def __init__(self, channel, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 block_timeout=BLOCK_TIMEOUT):
+        self.channel = channel
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self._buf = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"submitted": 0, "written": 0, "dropped": 0, "batches": 0, "errors": 0}
+        threading.Thread(target=self._run, name="hp-writer-remote", daemon=True).start()
+
+    def start(self):
+        return self
+
+    def submit(self, sql, params=(), block=True):
+        with self._lock:
+            self._buf.append((sql, params))
+            self.stats["submitted"] += 1
+            full = len(self._buf) >= self.batch_size
+        if full:
+            return self._ship(block)
+        return True
+
+    def depth(self):
+        return len(self._buf)
+
+    def flush(self, timeout=None):
+        return self._ship()
+
+    def stop(self, timeout=10.0):
+        self._ship()
+        self._closed = True
+
+    def _run(self):
+        while not self._closed:
+            time.sleep(self.flush_interval)
+            self._ship()
+
+    def _ship(self, block=True):
+        with self._lock:
+            batch, self._buf = self._buf, []
+        if not batch:
+            return True
+        try:
+            if block:
+                self.channel.put(batch, timeout=self.block_timeout)
+            else:
+                self.channel.put_nowait(batch)
+        except queue.Full:
+            self.stats["dropped"] += len(batch)
+            return False
+        self.stats["written"] += len(batch)
+        self.stats["batches"] += 1
+        return True
+
+def serve_remote(channel, writer):
+    """Supervisor side of RemoteWriter: feed shipped batches into writer
+    until a None sentinel arrives. Run it in a thread."""
+    while True:
+        batch = channel.get()
+        if batch is None:
+            break
+        for sql, params in batch:
+            writer.submit(sql, params)
+
+
+# ---------------- process-wide writers ----------------
+_writers = {}
+_writers_lock = threading.Lock()
+_channel = None
+
+def use_remote_writer(channel):
+    """Make get_writer() return a RemoteWriter on channel in this process
+    (any writer inherited from a parent process is discarded)."""
+    global _channel
+    with _writers_lock:
+        _writers.clear()
+        _channel = channel
+
+def get_writer(db_file, **kwargs):
+    """Return the shared, started writer for db_file (one per database file)."""
+    key = os.path.abspath(db_file)
+    with _writers_lock:
+        w = _writers.get(key)
+        if w is None:
+            if _channel is not None:
+                w = _writers[key] = RemoteWriter(_channel)
+            else:
+                w = _writers[key] = EventWriter(db_file, **kwargs).start()
+        return w
+
+def shutdown_writers(timeout=10.0):
+    """Flush and stop every writer; registered with atexit."""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for w in writers:
+        w.stop(timeout)
+
+def collect_metrics():
+    """Queue depth and row counters of this process's writers, for /metrics."""
+    with _writers_lock:
+        writers = list(_writers.items())
+    depth = [({"db": os.path.basename(k)}, w.depth()) for k, w in writers]
+    rows = [({"db": os.path.basename(k), "state": s}, w.stats[s]) for k, w in writers
+            for s in ("submitted", "written", "dropped", "errors")]
+    return [("hp_writer_queue_depth", "gauge", "Statements waiting for the writer", depth),
+            ("hp_writer_rows_total", "counter", "Statements by outcome", rows)]
+
+metrics.register_collector(collect_metrics)
+atexit.register(shutdown_writers)